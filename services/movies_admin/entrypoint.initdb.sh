@@ -2,6 +2,7 @@
 set -e
 
 psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-EOSQL
+    ALTER DATABASE "$POSTGRES_DB" SET etl.cdc_channel = '${ETL_CDC_CHANNEL:-etl_changes}';
     CREATE SCHEMA IF NOT EXISTS content;
     CREATE TABLE IF NOT EXISTS content.genre (
         id UUID PRIMARY KEY,
@@ -65,4 +66,32 @@ psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-E
     CREATE UNIQUE INDEX film_work_genre ON content.genre_film_work (film_work_id, genre_id);
     CREATE UNIQUE INDEX film_work_person_role ON content.person_film_work (film_work_id, person_id, role);
     CREATE UNIQUE INDEX film_work_file ON content.file_film_work (film_work_id, file_id);
+    CREATE INDEX film_work_modified_id ON content.film_work (modified, id);
+    CREATE INDEX person_modified_id ON content.person (modified, id);
+    CREATE INDEX genre_modified_id ON content.genre (modified, id);
+    CREATE OR REPLACE FUNCTION content.notify_etl() RETURNS TRIGGER AS \$\$
+    DECLARE
+        row_data JSONB := CASE WHEN TG_OP = 'DELETE' THEN to_jsonb(OLD) ELSE to_jsonb(NEW) END;
+        -- The ETL listens on ETL_CDC_CHANNEL, stored in the etl.cdc_channel setting of the database
+        channel TEXT := COALESCE(NULLIF(current_setting('etl.cdc_channel', true), ''), 'etl_changes');
+    BEGIN
+        -- Trigger arguments are (source, id column) pairs: one notification per pair
+        FOR i IN 0..TG_NARGS - 1 BY 2 LOOP
+            PERFORM pg_notify(channel, json_build_object('table', TG_ARGV[i], 'id', row_data ->> TG_ARGV[i + 1])::TEXT);
+        END LOOP;
+        RETURN NULL;
+    END;
+    \$\$ LANGUAGE plpgsql;
+    CREATE TRIGGER film_work_notify_etl AFTER INSERT OR UPDATE ON content.film_work
+        FOR EACH ROW EXECUTE FUNCTION content.notify_etl('film_work', 'id');
+    CREATE TRIGGER person_notify_etl AFTER INSERT OR UPDATE ON content.person
+        FOR EACH ROW EXECUTE FUNCTION content.notify_etl('person', 'id');
+    CREATE TRIGGER genre_notify_etl AFTER INSERT OR UPDATE ON content.genre
+        FOR EACH ROW EXECUTE FUNCTION content.notify_etl('genre', 'id');
+    CREATE TRIGGER person_film_work_notify_etl AFTER INSERT OR UPDATE OR DELETE ON content.person_film_work
+        FOR EACH ROW EXECUTE FUNCTION content.notify_etl('film_work', 'film_work_id', 'person_film_work', 'person_id');
+    CREATE TRIGGER genre_film_work_notify_etl AFTER INSERT OR UPDATE OR DELETE ON content.genre_film_work
+        FOR EACH ROW EXECUTE FUNCTION content.notify_etl('film_work', 'film_work_id');
+    CREATE TRIGGER file_film_work_notify_etl AFTER INSERT OR UPDATE OR DELETE ON content.file_film_work
+        FOR EACH ROW EXECUTE FUNCTION content.notify_etl('film_work', 'film_work_id');
 EOSQL
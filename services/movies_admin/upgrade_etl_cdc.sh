@@ -0,0 +1,43 @@
+#!/bin/bash
+set -e
+
+# Brings a database created before the ETL change data capture up to date, safe to run again
+psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-EOSQL
+    ALTER DATABASE "$POSTGRES_DB" SET etl.cdc_channel = '${ETL_CDC_CHANNEL:-etl_changes}';
+    CREATE INDEX IF NOT EXISTS film_work_modified_id ON content.film_work (modified, id);
+    CREATE INDEX IF NOT EXISTS person_modified_id ON content.person (modified, id);
+    CREATE INDEX IF NOT EXISTS genre_modified_id ON content.genre (modified, id);
+    BEGIN;
+    CREATE OR REPLACE FUNCTION content.notify_etl() RETURNS TRIGGER AS \$\$
+    DECLARE
+        row_data JSONB := CASE WHEN TG_OP = 'DELETE' THEN to_jsonb(OLD) ELSE to_jsonb(NEW) END;
+        -- The ETL listens on ETL_CDC_CHANNEL, stored in the etl.cdc_channel setting of the database
+        channel TEXT := COALESCE(NULLIF(current_setting('etl.cdc_channel', true), ''), 'etl_changes');
+    BEGIN
+        -- Trigger arguments are (source, id column) pairs: one notification per pair
+        FOR i IN 0..TG_NARGS - 1 BY 2 LOOP
+            PERFORM pg_notify(channel, json_build_object('table', TG_ARGV[i], 'id', row_data ->> TG_ARGV[i + 1])::TEXT);
+        END LOOP;
+        RETURN NULL;
+    END;
+    \$\$ LANGUAGE plpgsql;
+    DROP TRIGGER IF EXISTS film_work_notify_etl ON content.film_work;
+    CREATE TRIGGER film_work_notify_etl AFTER INSERT OR UPDATE ON content.film_work
+        FOR EACH ROW EXECUTE FUNCTION content.notify_etl('film_work', 'id');
+    DROP TRIGGER IF EXISTS person_notify_etl ON content.person;
+    CREATE TRIGGER person_notify_etl AFTER INSERT OR UPDATE ON content.person
+        FOR EACH ROW EXECUTE FUNCTION content.notify_etl('person', 'id');
+    DROP TRIGGER IF EXISTS genre_notify_etl ON content.genre;
+    CREATE TRIGGER genre_notify_etl AFTER INSERT OR UPDATE ON content.genre
+        FOR EACH ROW EXECUTE FUNCTION content.notify_etl('genre', 'id');
+    DROP TRIGGER IF EXISTS person_film_work_notify_etl ON content.person_film_work;
+    CREATE TRIGGER person_film_work_notify_etl AFTER INSERT OR UPDATE OR DELETE ON content.person_film_work
+        FOR EACH ROW EXECUTE FUNCTION content.notify_etl('film_work', 'film_work_id', 'person_film_work', 'person_id');
+    DROP TRIGGER IF EXISTS genre_film_work_notify_etl ON content.genre_film_work;
+    CREATE TRIGGER genre_film_work_notify_etl AFTER INSERT OR UPDATE OR DELETE ON content.genre_film_work
+        FOR EACH ROW EXECUTE FUNCTION content.notify_etl('film_work', 'film_work_id');
+    DROP TRIGGER IF EXISTS file_film_work_notify_etl ON content.file_film_work;
+    CREATE TRIGGER file_film_work_notify_etl AFTER INSERT OR UPDATE OR DELETE ON content.file_film_work
+        FOR EACH ROW EXECUTE FUNCTION content.notify_etl('film_work', 'film_work_id');
+    COMMIT;
+EOSQL
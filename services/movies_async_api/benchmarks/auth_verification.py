@@ -0,0 +1,90 @@
+"""Latency `AuthRequired` adds to a request: validation by the auth service against local verification.
+
+An auth service stand-in answers the token and permission validation endpoints after `--auth-latency` seconds
+on AUTH_HOST:AUTH_PORT. Requests of `--users` users are authorized once with the token only and once with
+a permission; with AUTH_LOCAL_VERIFICATION the blocklist is looked up in Redis (the benchmark Redis stands
+for the auth one) and permission checks are cached.
+
+    python benchmarks/auth_verification.py --requests 2000 --users 50
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+
+from common import percentile, redis_client
+
+import jwt
+from aiohttp import web
+from fastapi.security import HTTPAuthorizationCredentials
+
+from api.auth.local import token_verifier
+from api.auth.required import AuthRequired
+from api.utils.http_client import HTTPClient, http_pool
+from core import config
+from db.redis import close_redis
+
+SECRET = 'benchmark-secret'
+
+
+async def start_auth_service(latency: float, calls: list) -> web.AppRunner:
+    async def validate(request: web.Request) -> web.Response:
+        calls.append(request.path)
+        await asyncio.sleep(latency)
+        return web.json_response({'msg': 'Token is valid', 'valid': True})
+
+    app = web.Application()
+    app.router.add_get('/auth/v1/auth_token/validation', validate)
+    app.router.add_get('/auth/v1/users/{user_id}/combined_permissions/validation', validate)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, config.AUTH_HOST, config.AUTH_PORT).start()
+    return runner
+
+
+def access_token(user_id: str) -> str:
+    claims = {'sub': user_id, 'jti': str(uuid.uuid4()), 'type': 'access', 'exp': int(time.time()) + 3600}
+    return jwt.encode(claims, SECRET)
+
+
+async def run(name: str, dependency: AuthRequired, tokens: list, requests: int, auth_redis, calls: list) -> None:
+    calls.clear()
+    latencies = []
+    for _ in range(requests):
+        credentials = HTTPAuthorizationCredentials(scheme='Bearer', credentials=random.choice(tokens))
+        start = time.perf_counter()
+        await dependency(None, credentials, HTTPClient(http_pool), auth_redis)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    print(f'{name:>34} | {len(calls):>10} | {percentile(latencies, 0.5):>8.2f} | {percentile(latencies, 0.99):>8.2f}')
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--auth-latency', type=float, default=0.002, help='Auth service response time, seconds')
+    args = parser.parse_args()
+
+    calls = []
+    runner = await start_auth_service(args.auth_latency, calls)
+    http_pool.start()
+    auth_redis = redis_client(max_connections=10)
+    token_verifier.key = SECRET
+    tokens = [access_token(str(uuid.uuid4())) for _ in range(args.users)]
+
+    print(f'{"verification":>34} | {"auth calls":>10} | {"p50, ms":>8} | {"p99, ms":>8}')
+    for local in (False, True):
+        config.AUTH_LOCAL_VERIFICATION = local
+        mode = 'local' if local else 'auth service'
+        await run(f'{mode}, token', AuthRequired(), tokens, args.requests, auth_redis, calls)
+        await run(f'{mode}, token and permission', AuthRequired('films_read'), tokens, args.requests, auth_redis, calls)
+
+    await close_redis(auth_redis)
+    await http_pool.close()
+    await runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+"""Time to fetch the details of a 100-film page: a request per film against one batch request.
+
+Runs the service calls behind `/api/v1/film/{film_id}` once per film and `/api/v1/film/batch` once,
+first with a cold cache (every film comes from the Elasticsearch stand-in answering after
+`--es-latency` seconds), then with the films cached in Redis. The in-process cache is left out
+so that every lookup reaches Redis.
+
+    python benchmarks/batch_lookup.py --films 100
+"""
+import argparse
+import asyncio
+import time
+
+from common import CountingFilmDB, redis_client, synthetic_films
+
+from db.redis import close_redis
+from models.film import Film
+from services.film import FilmService, RedisFilmCache
+
+
+async def run(name: str, service: FilmService, db: CountingFilmDB, ids, batch: bool) -> None:
+    db.calls = 0
+    start = time.perf_counter()
+    if batch:
+        body = await service.get_response_by_ids(ids, Film)
+    else:
+        bodies = [await service.get_response_by_id(film_id, Film) for film_id in ids]
+        body = b'[' + b','.join(bodies) + b']'
+    elapsed = time.perf_counter() - start
+    print(f'{name:>30} | {db.calls:>9} | {elapsed * 1000:>10.1f} | {len(body):>10}')
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--films', type=int, default=100, help='Films on the page')
+    parser.add_argument('--es-latency', type=float, default=0.005, help='Elasticsearch response time, seconds')
+    args = parser.parse_args()
+
+    redis = redis_client()
+    films = synthetic_films(args.films)
+    ids = [film.id for film in films]
+    db = CountingFilmDB(films, args.es_latency)
+    service = FilmService(RedisFilmCache(redis), db)
+    keys = [f'FilmService:Details:Film:{film_id}' for film_id in ids]
+
+    print(f'{"mode":>30} | {"ES calls":>9} | {"time, ms":>10} | {"body, B":>10}')
+    for batch in (False, True):
+        mode = 'batch' if batch else 'request per film'
+        await redis.delete(*keys)
+        await run(f'{mode}, cold cache', service, db, ids, batch)
+        await run(f'{mode}, warm cache', service, db, ids, batch)
+
+    await close_redis(redis)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
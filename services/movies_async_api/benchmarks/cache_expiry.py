@@ -0,0 +1,80 @@
+"""Tail latency of hot list pages across cache expiry boundaries.
+
+`--concurrency` coroutines request `--pages` film list pages for `--duration` seconds while the pages
+expire every `--expiration` seconds. Elasticsearch is replaced by a stand-in answering after
+`--es-latency` seconds. Runs: entries vanish at expiry and requests wait for the reload (the former
+behaviour), stale entries are served while they are refreshed in background, and the refreshes
+also start early at random.
+
+    python benchmarks/cache_expiry.py --expiration 2 --duration 20
+"""
+import argparse
+import asyncio
+import time
+
+from common import CountingFilmDB, percentile, redis_client, synthetic_films
+
+from core import config
+from db.redis import close_redis
+from queryes.base import PageInfo, ServiceQueryInfo
+from services.film import FilmService, RedisFilmCache
+
+MODES = (
+    # name, CACHE_STALE_EXPIRATION, CACHE_EARLY_REFRESH_BETA
+    ('hard expiry', 0, 0.0),
+    ('stale-while-revalidate', 60, 0.0),
+    ('swr + early refresh', 60, 1.0),
+)
+
+
+async def run(name: str, stale_expiration: int, beta: float, redis, args) -> None:
+    config.CACHE_STALE_EXPIRATION = stale_expiration
+    config.CACHE_EARLY_REFRESH_BETA = beta
+    db = CountingFilmDB(synthetic_films(args.page_size), args.es_latency)
+    service = FilmService(RedisFilmCache(redis), db)
+    pages = [ServiceQueryInfo(page=PageInfo(number=number)) for number in range(args.pages)]
+    await redis.delete(*(f'FilmService:List:{page.as_key()}' for page in pages))
+    # Warm the cache up: the first misses of the pages are not an expiry
+    await asyncio.gather(*(service.get_by_query(page) for page in pages))
+    db.calls = 0
+
+    latencies = []
+    deadline = time.perf_counter() + args.duration
+
+    async def worker(offset: int):
+        i = offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            assert await service.get_by_query(pages[i % len(pages)])
+            latencies.append((time.perf_counter() - start) * 1000)
+            i += 1
+
+    await asyncio.gather(*(worker(offset) for offset in range(args.concurrency)))
+    await asyncio.gather(*service._refresh_tasks)
+    latencies.sort()
+    print(f'{name:>24} | {db.calls:>9} | {percentile(latencies, 0.5):>8.2f} | {percentile(latencies, 0.99):>8.2f} | '
+          f'{percentile(latencies, 0.999):>9.2f} | {latencies[-1]:>8.2f}')
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=20, help='Hot list pages')
+    parser.add_argument('--page-size', type=int, default=10, help='Films per page')
+    parser.add_argument('--concurrency', type=int, default=10, help='Coroutines issuing requests at once')
+    parser.add_argument('--expiration', type=int, default=2, help='CACHE_EXPIRATION, seconds')
+    parser.add_argument('--duration', type=float, default=20, help='Duration of a run, seconds')
+    parser.add_argument('--es-latency', type=float, default=0.2, help='Elasticsearch response time, seconds')
+    args = parser.parse_args()
+
+    config.CACHE_EXPIRATION = args.expiration
+    redis = redis_client()
+
+    print(f'{"mode":>24} | {"ES calls":>9} | {"p50, ms":>8} | {"p99, ms":>8} | {"p99.9, ms":>9} | {"max, ms":>8}')
+    for name, stale_expiration, beta in MODES:
+        await run(name, stale_expiration, beta, redis, args)
+
+    await close_redis(redis)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,150 @@
+"""Cache hit ratio of list and search pages replayed from an access log under three key schemes.
+
+* former keys: the raw query text and page size, filters other than genre and person left out;
+* canonical keys: normalized query text and every set filter, ordered by name (`ServiceQueryInfo.as_key`);
+* blocks: canonical keys of the `--block-size` hit blocks every page is sliced from.
+
+A request is a hit when all the keys it reads are cached; an LRU of `--capacity` keys stands for Redis.
+Former-key hits which share an entry with a request of other results are counted as wrong: films filter
+of person lists used to be left out of the key. Without `--log`, a synthetic log of a Zipf-distributed
+query workload with case, whitespace and page size variations is replayed. No Redis is needed.
+
+    python benchmarks/cache_keys.py --log access.log --block-size 200
+"""
+import argparse
+import random
+import re
+import uuid
+from collections import OrderedDict
+from typing import Iterable, List, Tuple
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from common import Zipf
+
+from core import config
+from queryes.base import QueryParamsBase, ServiceQueryInfo
+
+REQUEST_LINE = re.compile(r'"GET (/api/v1/(?:film|genre|person)/(?:search)?(?:\?\S*)?) HTTP')
+
+
+def parse_request(path: str) -> Tuple[str, QueryParamsBase]:
+    url = urlsplit(path)
+    params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+    return url.path, QueryParamsBase(
+        page_number=int(params.get('page[number]', 0)),
+        page_size=int(params.get('page[size]', config.PAGE_SIZE)),
+        sort=params.get('sort'),
+        filter_genre=params.get('filter[genre]'),
+        filter_person=params.get('filter[person]'),
+        filter_film=params.get('filter[film]'),
+        query=params.get('query'),
+        page_cursor=params.get('page[cursor]'),
+    )
+
+
+def former_key(params: QueryParamsBase) -> str:
+    """The former `ServiceQueryInfo.as_key`."""
+    page, filter_info, sort = params.page, params.filter, params.sort
+    page_key = '{number}-{size}'.format(**page) if page['cursor'] is None else 'after-{cursor}-{size}'.format(**page)
+    filter_key = '{genre}-{person}'.format(**filter_info) if filter_info else None
+    sort_key = '{field}-{desc}'.format(field=sort['field'], desc=int(sort['desc'])) if sort else None
+    return f'{page_key}:{filter_key}:{sort_key}:{params.query}'
+
+
+def block_keys(query_info: ServiceQueryInfo, block_size: int) -> List[str]:
+    page = query_info.page
+    if page.cursor is not None:
+        return [query_info.as_key()]
+    start = page.number * page.size
+    return [query_info.block(number, block_size).as_key()
+            for number in range(start // block_size, (start + page.size - 1) // block_size + 1)]
+
+
+class Replay:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.requests = self.hits = self.wrong_hits = self.loads = 0
+        self._keys: OrderedDict[str, str] = OrderedDict()
+
+    def request(self, keys: Iterable[Tuple[str, str]]) -> None:
+        """Read the `(key, results)` pairs: the missing keys are loaded and cached with the results of the request."""
+        self.requests += 1
+        hit = True
+        for key, results in keys:
+            cached = self._keys.get(key)
+            if cached is None:
+                hit = False
+                self.loads += 1
+                self._keys[key] = results
+                if self.capacity and len(self._keys) > self.capacity:
+                    self._keys.popitem(last=False)
+            else:
+                self._keys.move_to_end(key)
+                self.wrong_hits += cached != results
+        self.hits += hit
+
+    def report(self, name: str) -> None:
+        print(f'{name:>16} | {self.hits / self.requests:>9.1%} | {self.loads:>19} | {self.wrong_hits:>10}')
+
+
+def synthetic_log(requests: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    titles = [f'title {i}' for i in range(500)]
+    genres = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(20)]
+    films = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(200)]
+    queries, ranks = Zipf(len(titles), seed=seed), Zipf(len(films), seed=seed + 1)
+    variants = (str.lower, str.title, str.upper, lambda text: f'{text} ', lambda text: text.replace(' ', '  '))
+
+    paths = []
+    for _ in range(requests):
+        size = rng.choice((10, 20, 25, 50))
+        params = {'page[number]': min(int(rng.expovariate(0.7)), 9), 'page[size]': size}
+        kind = rng.random()
+        if kind < 0.5:
+            params['query'] = rng.choice(variants)(titles[queries.sample() - 1])
+            path = '/api/v1/film/search'
+        elif kind < 0.8:
+            params['sort'] = rng.choice(('-imdb_rating', 'title'))
+            if rng.random() < 0.5:
+                params['filter[genre]'] = rng.choice(genres)
+            path = '/api/v1/film/'
+        else:
+            params['filter[film]'] = films[ranks.sample() - 1]
+            path = '/api/v1/person/'
+        paths.append(f'{path}?{urlencode(params)}')
+    return paths
+
+
+def read_log(file_name: str) -> List[str]:
+    with open(file_name) as log:
+        return [match.group(1) for match in map(REQUEST_LINE.search, log) if match]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--log', help='Access log with the request lines of the API, e.g. of uvicorn or nginx')
+    parser.add_argument('--requests', type=int, default=100_000, help='Requests of the synthetic log')
+    parser.add_argument('--capacity', type=int, default=10_000, help='Cached keys, 0 for no limit')
+    parser.add_argument('--block-size', type=int, default=config.QUERY_BLOCK_SIZE or 200)
+    args = parser.parse_args()
+
+    paths = read_log(args.log) if args.log else synthetic_log(args.requests)
+    former, canonical, blocks = Replay(args.capacity), Replay(args.capacity), Replay(args.capacity)
+    for path in paths:
+        endpoint, params = parse_request(path)
+        query_info = ServiceQueryInfo.parse_obj(params.asdict())
+        # A canonical key names the results it holds
+        page_key = f'{endpoint}:{query_info.as_key()}'
+        former.request([(f'{endpoint}:{former_key(params)}', page_key)])
+        canonical.request([(page_key, page_key)])
+        blocks.request((f'{endpoint}:{key}', f'{endpoint}:{key}') for key in block_keys(query_info, args.block_size))
+
+    print(f'Replayed {len(paths)} requests')
+    print(f'{"keys":>16} | {"hit ratio":>9} | {"Elasticsearch loads":>19} | {"wrong hits":>10}')
+    former.report('former')
+    canonical.report('canonical')
+    blocks.report(f'blocks of {args.block_size}')
+
+
+if __name__ == '__main__':
+    main()
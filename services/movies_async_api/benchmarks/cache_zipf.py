@@ -0,0 +1,75 @@
+"""Latency of film cache lookups for a Zipf-distributed film-id workload: Redis only against `TwoLevelCache`.
+
+Films are put to Redis up front, then `--concurrency` coroutines look up `--requests` film ids drawn
+from a Zipf distribution, first through `RedisCache` alone, then through the in-process `LocalCache`
+in front of it. Point it to a throwaway Redis: the films are written with the usual service keys.
+
+    python benchmarks/cache_zipf.py --films 10000 --requests 100000 --concurrency 50
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+from common import Zipf, percentile, redis_client, synthetic_films
+
+from db.cache import BaseCache, LocalCache, TwoLevelCache
+from db.redis import close_redis
+from services.film import RedisFilmCache
+
+KEY = 'FilmService:Details:{id}'
+
+
+async def run(name: str, cache: BaseCache, ids: List[str], sample: List[int], concurrency: int) -> None:
+    latencies = []
+    queue = iter(sample)
+
+    async def worker():
+        for rank in queue:
+            start = time.perf_counter()
+            film = await cache.get(KEY.format(id=ids[rank]))
+            latencies.append(time.perf_counter() - start)
+            assert film is not None
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency * 1000 for latency in sorted(latencies)]
+    print(f'{name:>22} | {len(latencies) / elapsed:>10.0f} | {percentile(latencies, 0.5):>8.3f} | '
+          f'{percentile(latencies, 0.95):>8.3f} | {percentile(latencies, 0.99):>8.3f}')
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--films', type=int, default=10_000)
+    parser.add_argument('--requests', type=int, default=100_000)
+    parser.add_argument('--concurrency', type=int, default=50, help='Coroutines issuing lookups at once')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Exponent of the film popularity distribution')
+    parser.add_argument('--local-size', type=int, default=1024, help='LOCAL_CACHE_SIZE of the two-level run')
+    parser.add_argument('--local-ttl', type=float, default=10, help='LOCAL_CACHE_TTL of the two-level run, seconds')
+    args = parser.parse_args()
+
+    redis = redis_client()
+    remote = RedisFilmCache(redis)
+    films = synthetic_films(args.films)
+    print(f'Putting {args.films} films to Redis...')
+    for film in films:
+        await remote.set(film, KEY.format(id=film.id))
+
+    ids = [film.id for film in films]
+    zipf = Zipf(len(ids), args.zipf)
+    sample = [zipf.sample() for _ in range(args.requests)]
+
+    print(f'{"cache":>22} | {"req/s":>10} | {"p50, ms":>8} | {"p95, ms":>8} | {"p99, ms":>8}')
+    await run('Redis', remote, ids, sample, args.concurrency)
+    local = LocalCache(args.local_size, args.local_ttl)
+    await run('LocalCache + Redis', TwoLevelCache(local, remote), ids, sample, args.concurrency)
+    print(f'Local cache: {local.hits} hits, {local.misses} misses '
+          f'({local.hits / (local.hits + local.misses):.1%} hit ratio)')
+
+    await close_redis(redis)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""Elasticsearch calls and latency of concurrent requests to a cold film key.
+
+`--requests` requests for the same film are fired at once and split between `--workers` simulated
+worker processes, each with its own local cache and single-flight table. The Elasticsearch stand-in
+answers after `--es-latency` seconds and counts its calls. Runs: every miss goes to Elasticsearch
+(the former behaviour), single-flight per worker, and single-flight with the Redis lock across workers.
+
+    python benchmarks/coalescing.py --requests 500 --workers 4
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+from common import CountingFilmDB, percentile, redis_client, synthetic_films
+
+from db.cache import LocalCache, RedisLock, TwoLevelCache
+from db.redis import close_redis
+from models.film import Film
+from services.base import BaseService
+from services.film import FilmService, RedisFilmCache
+from services.single_flight import SingleFlight
+
+
+class UncoalescedFilmService(FilmService):
+    async def _load_once(self, key, prefix, load):
+        return await self._load_to_cache(key, prefix, load)
+
+
+async def run(name: str, service_class, redis, film: Film, args, lock: bool) -> None:
+    await redis.delete(f'FilmService:Details:{film.id}')
+    db = CountingFilmDB([film], args.es_latency)
+    services: List[BaseService] = []
+    for _ in range(args.workers):
+        service = service_class(TwoLevelCache(LocalCache(), RedisFilmCache(redis)), db,
+                                RedisLock(redis) if lock else None)
+        service.single_flight = SingleFlight()
+        services.append(service)
+
+    latencies = []
+
+    async def request(service: BaseService):
+        start = time.perf_counter()
+        assert await service.get_by_id(film.id) is not None
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(request(services[i % args.workers]) for i in range(args.requests)))
+    latencies.sort()
+    print(f'{name:>28} | {db.calls:>9} | {percentile(latencies, 0.5):>8.1f} | {percentile(latencies, 0.99):>8.1f}')
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500, help='Concurrent requests for the cold key')
+    parser.add_argument('--workers', type=int, default=4, help='Simulated worker processes')
+    parser.add_argument('--es-latency', type=float, default=0.05, help='Elasticsearch response time, seconds')
+    args = parser.parse_args()
+
+    redis = redis_client()
+    film = synthetic_films(1)[0]
+
+    print(f'{"mode":>28} | {"ES calls":>9} | {"p50, ms":>8} | {"p99, ms":>8}')
+    await run('no coalescing', UncoalescedFilmService, redis, film, args, lock=False)
+    await run('single-flight per worker', FilmService, redis, film, args, lock=False)
+    await run('single-flight + Redis lock', FilmService, redis, film, args, lock=True)
+
+    await close_redis(redis)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
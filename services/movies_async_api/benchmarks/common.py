@@ -0,0 +1,98 @@
+"""Shared helpers for the async API benchmarks.
+
+Benchmarks are run from the `movies_async_api` directory, e.g. `python benchmarks/cache_zipf.py`.
+They import the API modules the same way `src/main.py` does and therefore need
+the usual API environment variables; sensible local defaults are provided here.
+"""
+import bisect
+import itertools
+import logging
+import os
+import asyncio
+import random
+import sys
+import uuid
+from pathlib import Path
+from typing import List
+
+API_DIR = Path(__file__).resolve(strict=True).parent.parent.joinpath('src')
+sys.path.insert(1, str(API_DIR))
+
+os.environ.setdefault('REDIS_HOST', '127.0.0.1')
+os.environ.setdefault('REDIS_PORT', '6379')
+os.environ.setdefault('ELASTICSEARCH_HOST', '127.0.0.1')
+os.environ.setdefault('ELASTICSEARCH_PORT', '9200')
+
+from core import config  # noqa: E402
+from db.redis import create_redis  # noqa: E402
+from models.film import Film  # noqa: E402
+from models.genre import BaseGenre  # noqa: E402
+from models.person import BasePerson  # noqa: E402
+from services.film import ElasticFilmDB  # noqa: E402
+
+# A log line per cache hit would flood the output and dominate the timings
+logging.disable(logging.INFO)
+
+
+def synthetic_films(count: int, persons_per_film: int = 10) -> List[Film]:
+    genres = [BaseGenre(id=str(uuid.uuid4()), name=f'Genre {i}') for i in range(20)]
+    persons = [BasePerson(id=str(uuid.uuid4()), name=f'Person {i}') for i in range(persons_per_film * 10)]
+    return [
+        Film(
+            id=str(uuid.uuid4()),
+            title=f'Film {i}',
+            rating=(i % 100) / 10,
+            description='Synthetic description. ' * 10,
+            genre=random.sample(genres, 2),
+            actors=random.sample(persons, persons_per_film),
+            writers=random.sample(persons, 2),
+            directors=random.sample(persons, 1),
+        )
+        for i in range(count)
+    ]
+
+
+class CountingFilmDB(ElasticFilmDB):
+    """Answers with the given films after a fixed delay instead of querying Elasticsearch and counts the calls."""
+
+    def __init__(self, films: List[Film], latency: float):
+        super().__init__(elastic=None)
+        self.films = films
+        self.films_by_id = {film.id: film for film in films}
+        self.latency = latency
+        self.calls = 0
+
+    async def get(self, item_id: str):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self.films_by_id.get(item_id)
+
+    async def get_many(self, item_ids: List[str]):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return [self.films_by_id[item_id] for item_id in item_ids if item_id in self.films_by_id]
+
+    async def query_item(self, query, model=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self.films
+
+
+class Zipf:
+    """Ranks 0..n-1 drawn with probability proportional to 1 / (rank + 1) ** s: a few hot items and a long tail."""
+
+    def __init__(self, n: int, s: float = 1.1, seed: int = 0):
+        self._cumulative = list(itertools.accumulate(1 / (rank ** s) for rank in range(1, n + 1)))
+        self._random = random.Random(seed)
+
+    def sample(self) -> int:
+        return bisect.bisect(self._cumulative, self._random.random() * self._cumulative[-1])
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def redis_client(**kwargs):
+    """Client of the benchmark Redis, configured as the API's own, see `create_redis`."""
+    return create_redis(config.REDIS_HOST, config.REDIS_PORT, **kwargs)
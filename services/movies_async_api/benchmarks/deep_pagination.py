@@ -0,0 +1,94 @@
+"""Latency of deep list pages: `from` offsets against search_after cursors.
+
+Fills a throwaway index (`--index`, `benchmark_movies` by default) with synthetic films using the
+ETL `movies` schema, with `index.max_result_window` raised so that offsets reach the last page.
+Every page is then read `--repeat` times both ways; the cursor of a page is taken from a walk
+through the pages before it.
+
+    python benchmarks/deep_pagination.py --films 30000 --pages 1 10 100 500
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+
+from common import synthetic_films
+
+from core import config
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_bulk
+from queryes.base import PageInfo, ServiceQueryInfo, SortInfo
+from services.film import ElasticFilmDB
+
+MOVIES_SCHEMA = Path(__file__).resolve(strict=True).parents[2].joinpath(
+    'movies_etl', 'postgres_to_es', 'indexes', 'movies.json'
+)
+
+
+async def seed(elastic: AsyncElasticsearch, index: str, films: int, max_result_window: int) -> None:
+    if await elastic.indices.exists(index=index):
+        await elastic.indices.delete(index=index)
+    schema = json.loads(MOVIES_SCHEMA.read_text())
+    schema['settings']['max_result_window'] = max_result_window
+    await elastic.indices.create(index=index, body=schema)
+    for i in range(0, films, 10_000):
+        await async_bulk(elastic, (
+            {'_index': index, '_id': film.id, '_source': film.dict(exclude_none=True)}
+            for film in synthetic_films(min(10_000, films - i), persons_per_film=3)
+        ))
+    await elastic.indices.refresh(index=index)
+
+
+async def timed(call, repeat: int) -> float:
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await call()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--index', default='benchmark_movies')
+    parser.add_argument('--films', type=int, default=30_000)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 100, 500], help='Page numbers to read')
+    parser.add_argument('--repeat', type=int, default=20, help='Reads per page, the median is reported')
+    parser.add_argument('--no-seed', action='store_true', help='Reuse the index filled by a previous run')
+    args = parser.parse_args()
+
+    elastic = AsyncElasticsearch(hosts=[f'{config.ELASTIC_HOST}:{config.ELASTIC_PORT}'])
+    if not args.no_seed:
+        print(f'Seeding {args.films} films...')
+        await seed(elastic, args.index, args.films, (max(args.pages) + 1) * args.page_size)
+
+    db = ElasticFilmDB(elastic)
+    db.index = args.index
+    sort = SortInfo(field='imdb_rating', desc=True)
+
+    cursors, cursor = {}, ''
+    for number in range(max(args.pages) + 1):
+        cursors[number] = cursor
+        _, cursor = await db.query_page(ServiceQueryInfo(page=PageInfo(size=args.page_size, cursor=cursor), sort=sort))
+        if cursor is None:
+            break
+
+    print(f'{"page":>6} | {"from, ms":>10} | {"search_after, ms":>16}')
+    for number in args.pages:
+        if number not in cursors:
+            print(f'{number:>6} | the index has fewer pages')
+            continue
+        offset_query = ServiceQueryInfo(page=PageInfo(number=number, size=args.page_size), sort=sort)
+        cursor_query = ServiceQueryInfo(page=PageInfo(size=args.page_size, cursor=cursors[number]), sort=sort)
+        offset = await timed(lambda: db.query_item(offset_query), args.repeat)
+        after = await timed(lambda: db.query_page(cursor_query), args.repeat)
+        print(f'{number:>6} | {offset:>10.1f} | {after:>16.1f}')
+
+    await elastic.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""Latency of auth service calls under concurrency: a session per call against the shared pooled session.
+
+`--concurrency` requests at once each make the token validation call of `AuthRequired` to an auth service
+stand-in answering after `--auth-latency` seconds on AUTH_HOST:AUTH_PORT. The former client opened a new
+`ClientSession`, and so a new connection, for every call; `HTTPClient` reuses the keep-alive connections
+of `HTTPClientPool`, at most HTTP_CLIENT_LIMIT_PER_HOST of them.
+
+    python benchmarks/http_client.py --concurrency 1000 --rounds 3
+"""
+import argparse
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from common import percentile
+
+import aiohttp
+from aiohttp import web
+
+from api.utils.http_client import HTTPClient, HTTPClientResponse, http_pool
+from core import config
+
+URL = f'http://{config.AUTH_HOST}:{config.AUTH_PORT}/auth/v1/auth_token/validation'
+
+
+async def start_auth_service(latency: float) -> web.AppRunner:
+    async def validate(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        return web.json_response({'msg': 'Token is valid'})
+
+    app = web.Application()
+    app.router.add_get('/auth/v1/auth_token/validation', validate)
+    # The default backlog of 128 would refuse a burst of new connections
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, config.AUTH_HOST, config.AUTH_PORT, backlog=4096).start()
+    return runner
+
+
+async def session_per_call(url: str) -> HTTPClientResponse:
+    """The former `HTTPClient.get`."""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, headers={'Authorization': 'Bearer token'}) as response:
+            return HTTPClientResponse(status=response.status, headers=response.headers, json=await response.json())
+
+
+async def run(name: str, call: Callable[[str], Awaitable[HTTPClientResponse]], concurrency: int, rounds: int):
+    latencies, errors = [], 0
+
+    async def timed_call():
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            await call(URL)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+            errors += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(*(timed_call() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f'{name:>20} | {len(latencies) / elapsed:>8.0f} | {percentile(latencies, 0.5):>8.1f} | '
+          f'{percentile(latencies, 0.99):>8.1f} | {errors:>6}')
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=1000, help='Requests in flight at once')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--auth-latency', type=float, default=0.002, help='Auth service response time, seconds')
+    args = parser.parse_args()
+
+    runner = await start_auth_service(args.auth_latency)
+    http_pool.start()
+    client = HTTPClient(http_pool)
+
+    print(f'{"client":>20} | {"calls/s":>8} | {"p50, ms":>8} | {"p99, ms":>8} | {"errors":>6}')
+    await run('session per call', session_per_call, args.concurrency, args.rounds)
+    await run('pooled session', lambda url: client.get(url, token='token'), args.concurrency, args.rounds)
+
+    await http_pool.close()
+    await runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
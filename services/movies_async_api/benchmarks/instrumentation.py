@@ -0,0 +1,118 @@
+"""CPU per cached request of the whole app with every log record written, with sampled log records
+and with sampled log records and the metrics.
+
+Requests are sent straight to the ASGI app, so the timings hold the middleware, routing, endpoints
+and services but no HTTP server. The log records are written to /dev/null. The pages and details are
+served from the local cache, with Redis behind it. The films come from an Elasticsearch stand-in rather
+than `dependency_overrides`, which FastAPI resolves anew on every request.
+
+    python benchmarks/instrumentation.py --requests 20000 --repeat 5
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import List
+
+from common import redis_client, synthetic_films
+
+import main
+from api.v1 import film as film_api
+from core import config, metrics
+from db import cache, elastic, redis
+from db import db as elastic_db
+from services import base as base_service
+from models.film import Film
+
+SAMPLED_LOGGERS = [film_api.module_logger, base_service.module_logger, elastic_db.db_logger, cache.cache_logger]
+METRIC_METHODS = {metric: metric.observe if isinstance(metric, metrics.Histogram) else metric.inc
+                  for metric in metrics.registry}
+
+
+class FilmElastic:
+    """Answers the `ElasticDB` requests with the given films."""
+
+    def __init__(self, films: List[Film]):
+        self.films = {film.id: film.dict() for film in films}
+
+    async def get(self, index: str, id: str) -> dict:
+        return {'_source': self.films[id]}
+
+    async def search(self, index: str, body: dict) -> dict:
+        hits = list(self.films.values())[body.get('from', 0):][:body['size']]
+        return {'took': 1, 'hits': {'hits': [{'_source': film, 'sort': [film['id']]} for film in hits]}}
+
+
+def configure(log_rate: float, with_metrics: bool) -> None:
+    for logger in SAMPLED_LOGGERS:
+        logger.rate = log_rate
+    for metric, method in METRIC_METHODS.items():
+        setattr(metric, method.__name__, method if with_metrics else (lambda *args, **kwargs: None))
+
+
+async def request(path: str, query_string: bytes = b'') -> None:
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query_string, 'root_path': '', 'headers': [],
+        'client': ('127.0.0.1', 50000), 'server': ('127.0.0.1', 8000),
+    }
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start' and message['status'] != 200:
+            raise RuntimeError(f'{path} answered {message["status"]}')
+
+    await main.app(scope, receive, send)
+
+
+async def run(paths: List[str], requests: int) -> float:
+    start = time.process_time()
+    for i in range(requests):
+        await request(paths[i % len(paths)], b'page[size]=50')
+    return (time.process_time() - start) / requests
+
+
+async def amain():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20_000, help='Requests per configuration, over all rounds')
+    parser.add_argument('--films', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Rounds of all configurations in turn, the best round of each is reported')
+    args = parser.parse_args()
+
+    logging.disable(logging.NOTSET)
+    root = logging.getLogger()
+    for handler in root.handlers:
+        handler.setStream(open(os.devnull, 'w'))
+
+    films = synthetic_films(args.films)
+    elastic.es = FilmElastic(films)
+    redis.redis = redis_client()
+    await redis.redis.flushdb()
+    paths = ['/api/v1/film/'] + [f'/api/v1/film/{film.id}' for film in films[:9]]
+    for path in paths:
+        await request(path, b'page[size]=50')
+
+    configurations = {
+        'every record': (1.0, False),
+        f'{config.LOG_SAMPLE_RATE:.0%} of records': (config.LOG_SAMPLE_RATE, False),
+        f'{config.LOG_SAMPLE_RATE:.0%} of records and metrics': (config.LOG_SAMPLE_RATE, True),
+    }
+    best = dict.fromkeys(configurations, float('inf'))
+    for _ in range(args.repeat):
+        for name, (log_rate, with_metrics) in configurations.items():
+            configure(log_rate, with_metrics)
+            best[name] = min(best[name], await run(paths, args.requests // args.repeat))
+
+    print(f'{"configuration":>30} | {"CPU, us/req":>12}')
+    for name, elapsed in best.items():
+        print(f'{name:>30} | {elapsed * 1e6:>12.1f}')
+
+    await redis.close_redis(redis.redis)
+
+
+if __name__ == '__main__':
+    asyncio.run(amain())
@@ -0,0 +1,501 @@
+"""Load test of the film, person and genre endpoints over a synthetic catalogue.
+
+A catalogue of `--films` films, `--persons` persons and `--genres` genres is generated with a fixed seed.
+By default the app runs in this process with the catalogue in an in-memory Elasticsearch stand-in and
+requests go straight to the ASGI app; with `--elastic` the catalogue is searched in the Elasticsearch of
+ELASTICSEARCH_HOST/ELASTICSEARCH_PORT instead, filled by `--seed`. With `--url`, the requests are sent over
+HTTP to a running API, which must read the same Elasticsearch (seed it with `--elastic --seed`).
+Redis (REDIS_HOST/REDIS_PORT) is flushed before the run unless `--no-flush` is given.
+
+`--concurrency` clients send `--requests` requests drawn from the scenario `--mix`, with the keys of every
+scenario (film, page, search word, genre) picked with the Zipf or uniform `--distribution`, in `--rounds`
+rounds. Throughput and latency percentiles are reported per scenario from its best round, which evens out
+the noise of a shared machine; `--output` saves them as JSON and `--baseline` compares them with a saved run,
+exiting with status 1 if the median latency of a scenario grew more than `--tolerance` allows or it got more
+errors. The tail percentiles of a run vary too much between runs to tell regressions by.
+
+    python benchmarks/load_test.py --concurrency 50 --requests 20000 --output load.json
+    python benchmarks/load_test.py --concurrency 50 --requests 20000 --baseline load.json
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import random
+import re
+import sys
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlencode
+
+from common import Zipf, percentile, redis_client
+
+import aiohttp
+import main
+from core import config
+from db import elastic, redis
+from elasticsearch import AsyncElasticsearch
+from elasticsearch import exceptions as elastic_exceptions
+from elasticsearch.helpers import async_bulk
+
+INDEXES_DIR = Path(__file__).resolve(strict=True).parents[2].joinpath('movies_etl', 'postgres_to_es', 'indexes')
+INDEX_SCHEMAS = {'movies': 'movies.json', 'persons': 'persons.json', 'genres': 'genres.json'}
+
+WORDS = ('star', 'night', 'love', 'war', 'city', 'dark', 'last', 'king', 'river', 'dream', 'ghost', 'island',
+         'summer', 'winter', 'secret', 'lost', 'blood', 'golden', 'silent', 'empire', 'road', 'storm', 'moon',
+         'shadow', 'heart', 'fire', 'ocean', 'wild', 'iron', 'glass', 'red', 'hidden', 'broken', 'journey',
+         'garden', 'echo', 'crown', 'stone', 'mirror', 'legend')
+ROLES = ('actors', 'writers', 'directors')
+ROLE_LINKS = {'actors': 3, 'writers': 1, 'directors': 1}
+
+SCENARIOS = ('film_details', 'film_list', 'film_search', 'film_filter', 'person_details', 'person_search',
+             'person_filter', 'genre_list')
+DEFAULT_MIX = 'film_details=30,film_list=20,film_search=15,film_filter=15,person_details=10,person_search=4,' \
+              'person_filter=4,genre_list=2'
+FILM_SORTS = (None, '-imdb_rating', 'imdb_rating', 'title', '-title')
+
+
+class Catalogue:
+    """Films, persons and genres as the ETL indexes them, generated from `seed`."""
+
+    def __init__(self, films: int, persons: int, genres: int, seed: int = 0):
+        rng = random.Random(seed)
+        self.genres = [{'id': str(uuid.UUID(int=rng.getrandbits(128))), 'name': f'Genre {i}',
+                        'description': ' '.join(rng.choices(WORDS, k=8))} for i in range(genres)]
+        self.persons = [{'id': str(uuid.UUID(int=rng.getrandbits(128))), 'name': f'{rng.choice(WORDS).title()} '
+                         f'{rng.choice(WORDS).title()} {i}', 'roles': set(), 'films': []} for i in range(persons)]
+        # Nested entries are shared by all the documents that hold them
+        genre_links = [{'id': genre['id'], 'name': genre['name']} for genre in self.genres]
+        person_links = [{'id': person['id'], 'name': person['name']} for person in self.persons]
+        self.films = []
+        for i in range(films):
+            film = {'id': str(uuid.UUID(int=rng.getrandbits(128))), 'title': ' '.join(rng.choices(WORDS, k=3)).title(),
+                    'rating': round(rng.uniform(1, 10), 1), 'description': ' '.join(rng.choices(WORDS, k=20)),
+                    'genre': rng.sample(genre_links, min(2, genres))}
+            film_link = {'id': film['id'], 'title': film['title'], 'rating': film['rating']}
+            for role in ROLES:
+                positions = rng.sample(range(persons), min(ROLE_LINKS[role], persons))
+                film[role] = [person_links[position] for position in positions]
+                for position in positions:
+                    self.persons[position]['roles'].add(role[:-1])
+                    self.persons[position]['films'].append(film_link)
+            self.films.append(film)
+        for person in self.persons:
+            person['roles'] = sorted(person['roles'])
+
+    def documents(self) -> Dict[str, List[dict]]:
+        return {'movies': self.films, 'persons': self.persons, 'genres': self.genres}
+
+
+class MemoryIndex:
+    """Documents of one index with the lookups the `QueryBuilder` requests need: terms of the searched fields,
+    ids of the nested filters and the rank of every document by each sort field."""
+
+    def __init__(self, documents: List[dict], sorted_cache_size: int = 1024):
+        self.documents = documents
+        self.positions = {document['id']: position for position, document in enumerate(documents)}
+        self.terms: Dict[str, Dict[str, Set[int]]] = defaultdict(lambda: defaultdict(set))
+        self.nested: Dict[str, Dict[str, List[int]]] = defaultdict(lambda: defaultdict(list))
+        for position, document in enumerate(documents):
+            for field, value in document.items():
+                if isinstance(value, str) and field != 'id':
+                    for term in set(re.findall(r'\w+', value.casefold())):
+                        self.terms[field][term].add(position)
+                elif isinstance(value, list) and value and isinstance(value[0], dict):
+                    for item in value:
+                        self.nested[f'{field}.id'][item['id']].append(position)
+        self.ranks: Dict[str, List[int]] = {}
+        self._sorted: OrderedDict = OrderedDict()
+        self._sorted_cache_size = sorted_cache_size
+
+    def search(self, body: dict) -> dict:
+        start = time.perf_counter()
+        query = body['query']['bool']
+        sort = tuple(self._sort_clause(clause) for clause in body.get('sort') or [{'_score': 'desc'}])
+        # Sorted hits of a query are kept for its other pages
+        key = json.dumps([query, sort])
+        hits = self._sorted.get(key)
+        if hits is None:
+            matches = self._match(query['should'])
+            for clause in query.get('filter', []):
+                nested = clause.get('nested')
+                if nested is None:
+                    continue
+                (id_field, value), = nested['query']['match'].items()
+                filtered = self.nested[id_field].get(value, [])
+                matches = {position: matches[position] for position in filtered if position in matches}
+            hits = sorted((tuple(self._sort_value(field, desc, position, matches) for field, desc in sort) + (position,)
+                           for position in matches))
+            self._sorted[key] = hits
+            while len(self._sorted) > self._sorted_cache_size:
+                self._sorted.popitem(last=False)
+        else:
+            self._sorted.move_to_end(key)
+
+        begin = body.get('from', 0)
+        if 'search_after' in body:
+            begin = bisect.bisect_right(hits, tuple(body['search_after']) + (float('inf'),))
+        source = body.get('_source')
+        page = [{'_source': self._source(self.documents[hit[-1]], source), 'sort': list(hit[:-1])}
+                for hit in hits[begin:begin + body['size']]]
+        return {'took': int((time.perf_counter() - start) * 1000), 'hits': {'hits': page}}
+
+    def _match(self, should: List[dict]) -> Dict[int, float]:
+        """Scores of the matching documents: the boosts of the fields with a term of the query."""
+        if 'match_all' in should[0]:
+            return dict.fromkeys(range(len(self.documents)), 1.0)
+        scores: Dict[int, float] = defaultdict(float)
+        for clause in should:
+            (field, options), = clause['match'].items()
+            matched = set()
+            for term in re.findall(r'\w+', options['query'].casefold()):
+                matched |= self.terms[field].get(term, set())
+            for position in matched:
+                scores[position] += options.get('boost', 1.0)
+        return scores
+
+    @staticmethod
+    def _sort_clause(clause: dict) -> Tuple[str, bool]:
+        (field, order), = clause.items()
+        order = order['order'] if isinstance(order, dict) else order
+        return field.split('.')[0], order == 'desc'
+
+    def _sort_value(self, field: str, desc: bool, position: int, matches: Dict[int, float]) -> float:
+        if field == '_score':
+            value = matches[position]
+        else:
+            if field not in self.ranks:
+                # Equal values get the same rank, so ties are broken by the next sort field
+                values = sorted({document[field] for document in self.documents if document.get(field) is not None})
+                rank = {value: i for i, value in enumerate(values)}
+                self.ranks[field] = [rank.get(document.get(field), -1) for document in self.documents]
+            value = self.ranks[field][position]
+        return -value if desc else value
+
+    @staticmethod
+    def _source(document: dict, source: Optional[List[str]]) -> dict:
+        if source is None:
+            return document
+        return {field: document[field] for field in source if field in document}
+
+
+class MemoryElastic:
+    """Answers the `ElasticDB` requests from `MemoryIndex`es: searches ignore fuzziness and score a document
+    by the boosts of its fields holding a term of the query."""
+
+    def __init__(self, documents: Dict[str, List[dict]]):
+        self.indexes = {index: MemoryIndex(index_documents) for index, index_documents in documents.items()}
+
+    async def get(self, index: str, id: str) -> dict:
+        memory_index = self.indexes[index]
+        position = memory_index.positions.get(id)
+        if position is None:
+            raise elastic_exceptions.NotFoundError(404, 'not_found', {'found': False})
+        return {'_id': id, 'found': True, '_source': memory_index.documents[position]}
+
+    async def mget(self, index: str, body: dict) -> dict:
+        memory_index = self.indexes[index]
+        docs = []
+        for item_id in body['ids']:
+            position = memory_index.positions.get(item_id)
+            if position is None:
+                docs.append({'_id': item_id, 'found': False})
+            else:
+                docs.append({'_id': item_id, 'found': True, '_source': memory_index.documents[position]})
+        return {'docs': docs}
+
+    async def search(self, index: str, body: dict) -> dict:
+        return self.indexes[index].search(body)
+
+    async def close(self):
+        pass
+
+
+async def seed(client: AsyncElasticsearch, catalogue: Catalogue) -> None:
+    for index, documents in catalogue.documents().items():
+        if await client.indices.exists(index=index):
+            await client.indices.delete(index=index)
+        schema = json.loads(INDEXES_DIR.joinpath(INDEX_SCHEMAS[index]).read_text())
+        await client.indices.create(index=index, body=schema)
+        await async_bulk(client, ({'_index': index, '_id': document['id'], '_source': document}
+                                  for document in documents), chunk_size=5000)
+        await client.indices.refresh(index=index)
+
+
+class KeySampler:
+    """Ranks 0..n-1, skewed to the first ones with the Zipf distribution."""
+
+    def __init__(self, n: int, distribution: str, s: float, rng: random.Random):
+        self.n = n
+        self._rng = rng
+        self._zipf = Zipf(n, s, seed=rng.randrange(2 ** 32)) if distribution == 'zipf' else None
+
+    def sample(self) -> int:
+        return self._zipf.sample() if self._zipf is not None else self._rng.randrange(self.n)
+
+
+class Workload:
+    """Requests of the scenarios drawn by their weights, as (scenario, path, query parameters)."""
+
+    def __init__(self, catalogue: Catalogue, mix: Dict[str, float], distribution: str, s: float, pages: int,
+                 seed: int = 0):
+        self.catalogue = catalogue
+        self.rng = random.Random(seed)
+        self.scenarios = list(mix)
+        self.weights = list(mix.values())
+
+        def sampler(n: int) -> KeySampler:
+            return KeySampler(n, distribution, s, self.rng)
+
+        self.films = sampler(len(catalogue.films))
+        self.persons = sampler(len(catalogue.persons))
+        self.genres = sampler(len(catalogue.genres))
+        self.words = sampler(len(WORDS))
+        self.pages = sampler(pages)
+        self.sorts = sampler(len(FILM_SORTS))
+
+    def __iter__(self) -> Iterator[Tuple[str, str, dict]]:
+        return self
+
+    def __next__(self) -> Tuple[str, str, dict]:
+        scenario = self.rng.choices(self.scenarios, self.weights)[0]
+        path, params = getattr(self, scenario)()
+        return scenario, path, params
+
+    def film_details(self):
+        return f'/api/v1/film/{self.catalogue.films[self.films.sample()]["id"]}', {}
+
+    def film_list(self):
+        params = {'page[number]': self.pages.sample()}
+        sort = FILM_SORTS[self.sorts.sample()]
+        if sort:
+            params['sort'] = sort
+        return '/api/v1/film/', params
+
+    def film_search(self):
+        return '/api/v1/film/search', {'query': WORDS[self.words.sample()], 'page[number]': self.pages.sample() % 3}
+
+    def film_filter(self):
+        return '/api/v1/film/', {'filter[genre]': self.catalogue.genres[self.genres.sample()]['id'],
+                                 'sort': '-imdb_rating', 'page[number]': self.pages.sample() % 5}
+
+    def person_details(self):
+        return f'/api/v1/person/{self.catalogue.persons[self.persons.sample()]["id"]}', {}
+
+    def person_search(self):
+        return '/api/v1/person/search', {'query': WORDS[self.words.sample()], 'page[size]': 20}
+
+    def person_filter(self):
+        return '/api/v1/person/', {'filter[film]': self.catalogue.films[self.films.sample()]['id']}
+
+    def genre_list(self):
+        return '/api/v1/genre/', {'sort': 'name'}
+
+
+class AsgiClient:
+    """Sends the requests straight to the app of this process."""
+
+    async def get(self, path: str, params: dict) -> int:
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': urlencode(params).encode(), 'root_path': '',
+            'headers': [], 'client': ('127.0.0.1', 50000), 'server': ('127.0.0.1', 8000),
+        }
+        status = 500
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        try:
+            await main.app(scope, receive, send)
+        except Exception:
+            # The error middleware sends the 500 response, then raises the error again
+            pass
+        return status
+
+    async def close(self):
+        pass
+
+
+class HttpClient:
+    """Sends the requests to a running API."""
+
+    def __init__(self, url: str, concurrency: int):
+        self.url = url.rstrip('/')
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency))
+
+    async def get(self, path: str, params: dict) -> int:
+        try:
+            async with self.session.get(self.url + path, params=params) as response:
+                await response.read()
+                return response.status
+        except aiohttp.ClientError:
+            return 599
+
+    async def close(self):
+        await self.session.close()
+
+
+async def drive(client, workload: Workload, requests: int, concurrency: int) -> Tuple[Dict[str, dict], float]:
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            scenario, path, params = next(workload)
+            start = time.perf_counter()
+            status = await client.get(path, params)
+            latencies[scenario].append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                errors[scenario] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    results = {}
+    for scenario in [scenario for scenario in SCENARIOS if scenario in latencies] + ['total']:
+        values = sorted(latencies[scenario] if scenario != 'total' else
+                        [latency for scenario_latencies in latencies.values() for latency in scenario_latencies])
+        results[scenario] = {
+            'requests': len(values),
+            'errors': errors[scenario] if scenario != 'total' else sum(errors.values()),
+            'throughput': len(values) / elapsed,
+            'p50': percentile(values, 0.5), 'p95': percentile(values, 0.95), 'p99': percentile(values, 0.99),
+        }
+    return results, elapsed
+
+
+def report(results: Dict[str, dict], baseline: Optional[Dict[str, dict]], tolerance: float) -> List[str]:
+    """Print the results, with the change against the baseline; return the scenarios that regressed."""
+    regressions = []
+    print(f'{"scenario":>15} | {"requests":>8} | {"errors":>6} | {"req/s":>8} | {"p50, ms":>8} | '
+          f'{"p95, ms":>8} | {"p99, ms":>8}' + (f' | {"p50 vs base":>11} | {"p95 vs base":>11}' if baseline else ''))
+    for scenario, result in results.items():
+        line = (f'{scenario:>15} | {result["requests"]:>8} | {result["errors"]:>6} | {result["throughput"]:>8.0f} | '
+                f'{result["p50"]:>8.2f} | {result["p95"]:>8.2f} | {result["p99"]:>8.2f}')
+        before = (baseline or {}).get(scenario)
+        if before:
+            change = result['p50'] / before['p50'] - 1
+            line += f' | {change:>+11.0%} | {result["p95"] / before["p95"] - 1:>+11.0%}'
+            if change > tolerance or result['errors'] > before['errors']:
+                regressions.append(scenario)
+                line += '  REGRESSION'
+        print(line)
+    return regressions
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(','):
+        scenario, _, weight = item.partition('=')
+        if scenario not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f'Unknown scenario {scenario}, expected one of {", ".join(SCENARIOS)}')
+        weights[scenario] = float(weight or 1)
+    return weights
+
+
+async def amain():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--films', type=int, default=100_000)
+    parser.add_argument('--persons', type=int, default=50_000)
+    parser.add_argument('--genres', type=int, default=30)
+    parser.add_argument('--elastic', action='store_true', help='Search in Elasticsearch, not in memory')
+    parser.add_argument('--seed', action='store_true', help='Fill the movies, persons and genres indexes first')
+    parser.add_argument('--url', help='Send the requests to the API running at this URL, not to this process')
+    parser.add_argument('--no-flush', action='store_true', help='Keep the Redis entries of a previous run')
+    parser.add_argument('--concurrency', type=int, default=50, help='Requests in flight at once')
+    parser.add_argument('--requests', type=int, default=20_000, help='Requests per round')
+    parser.add_argument('--warmup', type=int, default=2000, help='Requests sent before the measured ones')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='Measured rounds of --requests, the round with the lowest p50 of every scenario is kept')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'Weights of the scenarios, {DEFAULT_MIX} by default')
+    parser.add_argument('--distribution', choices=('zipf', 'uniform'), default='zipf')
+    parser.add_argument('--zipf-s', type=float, default=1.1, help='Skew of the Zipf distribution')
+    parser.add_argument('--pages', type=int, default=20, help='List pages the requests are spread over')
+    parser.add_argument('--output', type=Path, help='Save the results to this JSON file')
+    parser.add_argument('--baseline', type=Path, help='Compare the results with this saved JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p50 growth against the baseline')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    catalogue = Catalogue(args.films, args.persons, args.genres)
+    print(f'Catalogue of {args.films} films, {args.persons} persons and {args.genres} genres generated '
+          f'in {time.perf_counter() - started:.1f} s')
+
+    es_client = None
+    if args.elastic or args.seed:
+        es_client = AsyncElasticsearch(hosts=[f'{config.ELASTIC_HOST}:{config.ELASTIC_PORT}'])
+        if args.seed:
+            started = time.perf_counter()
+            await seed(es_client, catalogue)
+            print(f'Elasticsearch seeded in {time.perf_counter() - started:.1f} s')
+
+    redis_pool = redis_client(auto_pipeline=config.REDIS_AUTO_PIPELINE)
+    if not args.no_flush:
+        await redis_pool.flushdb()
+
+    if args.url:
+        client = HttpClient(args.url, args.concurrency)
+    else:
+        if args.elastic:
+            elastic.es = es_client
+        else:
+            # The stand-in answers plain searches only
+            config.ELASTIC_SEARCH_TEMPLATES = False
+            elastic.es = MemoryElastic(catalogue.documents())
+        if config.ELASTIC_SEARCH_TEMPLATES:
+            for db_class in (main.ElasticFilmDB, main.ElasticGenreDB, main.ElasticPersonDB):
+                await db_class(elastic.es).put_search_template()
+        redis.redis = redis_pool
+        client = AsgiClient()
+
+    workload = Workload(catalogue, args.mix, args.distribution, args.zipf_s, args.pages)
+    if args.warmup:
+        await drive(client, workload, args.warmup, args.concurrency)
+    results = {}
+    for _ in range(args.rounds):
+        round_results, elapsed = await drive(client, workload, args.requests, args.concurrency)
+        for scenario, result in round_results.items():
+            if scenario not in results or result['p50'] < results[scenario]['p50']:
+                results[scenario] = result
+
+    print(f'{args.rounds} rounds of {args.requests} requests by {args.concurrency} clients, '
+          f'{args.distribution} keys, {"HTTP to " + args.url if args.url else "in process"}, '
+          f'{"Elasticsearch" if args.elastic else "in-memory stand-in"}')
+    settings = json.loads(json.dumps({name: value for name, value in vars(args).items()
+                                      if name not in ('output', 'baseline', 'tolerance', 'no_flush')}, default=str))
+    baseline = None
+    if args.baseline:
+        saved = json.loads(args.baseline.read_text())
+        baseline = saved['results']
+        changed = [name for name, value in settings.items() if saved['settings'].get(name) != value]
+        if changed:
+            print(f'The baseline was run with other {", ".join(changed)}, the comparison may be meaningless')
+    regressions = report(results, baseline, args.tolerance)
+    if args.output:
+        args.output.write_text(json.dumps({'settings': settings, 'results': results}, indent=2))
+
+    await client.close()
+    await redis.close_redis(redis_pool)
+    if es_client is not None:
+        await es_client.close()
+    if regressions:
+        print(f'Slower than the baseline: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    asyncio.run(amain())
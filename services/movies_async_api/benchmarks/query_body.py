@@ -0,0 +1,109 @@
+"""CPU cost and size of the search requests of list and search pages.
+
+Compares the former per-request building of nested defaultdicts with `QueryBuilder.body`, whose clauses
+are prepared once per index, and shows how much smaller a request gets with a stored search template
+(ELASTIC_SEARCH_TEMPLATES), which sends only the template id and its parameters. No Elasticsearch is needed.
+
+    python benchmarks/query_body.py --requests 100000
+"""
+import argparse
+import time
+import uuid
+from collections import defaultdict
+from typing import Callable, List
+
+from common import ElasticFilmDB
+
+import orjson
+from models.film import BaseFilm
+from queryes.base import ServiceQueryInfo, decode_cursor, encode_cursor
+
+
+def legacy_body(query_info: ServiceQueryInfo, db=ElasticFilmDB) -> dict:
+    """The former `ElasticDB._elastic_request_for_query`."""
+    page_info = query_info.page
+    body = defaultdict(lambda: defaultdict(dict))
+    body['from'] = page_info.number * page_info.size
+    body['size'] = page_info.size
+    body['query']['bool']['should'] = [{'match_all': {}}]
+    body['query']['bool']['minimum_should_match'] = 1
+    body['_source'] = list(BaseFilm.__fields__)
+    if query_info.query:
+        body['query']['bool']['should'] = []
+        for field, weight in db.search_fields.items():
+            match = defaultdict(lambda: defaultdict(dict))
+            match['match'][field]['query'] = query_info.query
+            match['match'][field]['fuzziness'] = 'auto'
+            match['match'][field]['boost'] = weight
+            body['query']['bool']['should'].append(match)
+    if query_info.filter:
+        body['query']['bool']['filter'] = []
+        for field in db.filter_fields:
+            value = query_info.filter.dict().get(field)
+            if value is None:
+                continue
+            filter_info = defaultdict(lambda: defaultdict(dict))
+            filter_info['nested']['path'] = field
+            filter_info['nested']['query']['match'] = {f'{field}.id': str(value)}
+            body['query']['bool']['filter'].append(filter_info)
+    if query_info.sort:
+        sort = defaultdict(dict)
+        sort[db.sort_fields.get(query_info.sort.field)]['order'] = 'desc' if query_info.sort.desc else 'asc'
+        body['sort'] = [sort]
+    if page_info.cursor is not None:
+        del body['from']
+        if not query_info.sort:
+            body['sort'] = [{'_score': 'desc'}] if query_info.query else []
+        body['sort'].append({'id': 'asc'})
+        if page_info.cursor:
+            body['search_after'] = decode_cursor(page_info.cursor)
+        body['track_total_hits'] = False
+    return body
+
+
+def query_infos(count: int) -> List[ServiceQueryInfo]:
+    """Requests of the list and search pages: with and without a query, filter, sort and cursor."""
+    genre, person = str(uuid.uuid4()), str(uuid.uuid4())
+    cursor = encode_cursor([8.1, str(uuid.uuid4())])
+    variants = [
+        {'page': {'number': 3, 'size': 50}},
+        {'page': {'number': 0, 'size': 50}, 'sort': {'field': 'imdb_rating', 'desc': True}},
+        {'page': {'number': 1, 'size': 20}, 'filter': {'genre': genre}, 'sort': {'field': 'title', 'desc': False}},
+        {'page': {'number': 0, 'size': 50}, 'query': 'star wars'},
+        {'page': {'number': 2, 'size': 50}, 'query': 'star', 'filter': {'genre': genre, 'person': person}},
+        {'page': {'size': 50, 'cursor': cursor}, 'sort': {'field': 'imdb_rating', 'desc': True}},
+        {'page': {'size': 50, 'cursor': ''}, 'query': 'star wars'},
+    ]
+    return [ServiceQueryInfo(**variants[i % len(variants)]) for i in range(count)]
+
+
+def measure(name: str, build: Callable[[ServiceQueryInfo], dict], infos: List[ServiceQueryInfo]) -> float:
+    start = time.process_time()
+    size = sum(len(orjson.dumps(build(query_info))) for query_info in infos)
+    elapsed = time.process_time() - start
+    print(f'{name:>24} | {elapsed / len(infos) * 1e6:>12.2f} | {size / len(infos):>15.0f}')
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100_000)
+    args = parser.parse_args()
+
+    infos = query_infos(args.requests)
+    builder = ElasticFilmDB.query_builder
+    source = list(BaseFilm.__fields__)
+    for query_info in infos[:10]:
+        assert orjson.loads(orjson.dumps(legacy_body(query_info))) == builder.body(query_info, source)
+
+    print(f'{"request body":>24} | {"us/request":>12} | {"bytes/request":>15}')
+    legacy = measure('defaultdict per request', legacy_body, infos)
+    prepared = measure('QueryBuilder.body', lambda query_info: builder.body(query_info, source), infos)
+    measure('search template params', lambda query_info: {
+        'id': ElasticFilmDB.search_template_id, 'params': builder.template_params(query_info, source),
+    }, infos)
+    print(f'Body construction: {legacy / prepared:.1f}x faster')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""CPU per request of turning a cached 50-film list page into the HTTP response body.
+
+The former path parses the Redis payload into models, copies them into the endpoint models, then
+FastAPI validates them against `response_model` and `ORJSONResponse` serializes them again. The cached
+response body is only split from its entry header and returned as a `Response`.
+No Redis is needed: the cache entries are built in memory.
+
+    python benchmarks/response_path.py --page-size 50 --requests 2000
+"""
+import argparse
+import asyncio
+import time
+from typing import Awaitable, Callable, List
+
+import orjson
+from common import synthetic_films
+
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from models.film import BaseFilm, Film
+from services.base import BaseService
+
+HEADER = orjson.dumps({'expires_at': 0.0, 'delta': 0.0, 'raw': False})
+
+
+async def models_path(entry: bytes, response_field) -> bytes:
+    _, _, payload = entry.partition(b'\n')
+    films = [Film.parse_obj(obj) for obj in orjson.loads(payload)]
+    content = [Film(**film.dict()) for film in films]
+    return ORJSONResponse(await serialize_response(field=response_field, response_content=content)).body
+
+
+async def raw_path(entry: bytes, response_field) -> bytes:
+    _, _, payload = entry.partition(b'\n')
+    return Response(payload, media_type='application/json').body
+
+
+async def run(name: str, path: Callable[..., Awaitable[bytes]], entry: bytes, requests: int) -> float:
+    response_field = create_response_field(name='response', type_=List[BaseFilm])
+    start = time.process_time()
+    for _ in range(requests):
+        body = await path(entry, response_field)
+    elapsed = time.process_time() - start
+    print(f'{name:>20} | {elapsed / requests * 1e6:>12.1f} | {requests / elapsed:>10.0f} | {len(body):>10}')
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--page-size', type=int, default=50, help='Films per page')
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    films = synthetic_films(args.page_size)
+    models_entry = b'\n'.join((HEADER, orjson.dumps([film.dict() for film in films])))
+
+    async def load():
+        return films
+
+    raw_entry = b'\n'.join((HEADER, await BaseService._render_response(load, BaseFilm)))
+
+    print(f'{"path":>20} | {"us/request":>12} | {"req/s":>10} | {"body, B":>10}')
+    former = await run('models (former)', models_path, models_entry, args.requests)
+    current = await run('cached response body', raw_path, raw_entry, args.requests)
+    print(f'Speedup: {former / current:.0f}x')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+"""Response size and client-side parse time of a 50-film list page with full `_source` and with source filtering.
+
+Builds the Elasticsearch search response of a page the way the server returns it, once with the whole
+documents and once with the `_source` fields of `BaseFilm` only, then times what `ElasticDB.query_item`
+does with it: the client's JSON parsing and the model building. No Elasticsearch is needed.
+
+    python benchmarks/source_filtering.py --page-size 50 --persons-per-film 20
+"""
+import argparse
+import time
+from typing import List, Type
+
+from common import synthetic_films
+
+import orjson
+from elasticsearch import JSONSerializer
+from models.base import BaseGetAPIModel
+from models.film import BaseFilm, Film
+
+
+def search_response(films: List[Film], fields: List[str] = None) -> bytes:
+    hits = [
+        {'_index': 'movies', '_id': film.id, '_score': 1.0,
+         '_source': film.dict(include=set(fields) if fields else None, exclude_none=True)}
+        for film in films
+    ]
+    return orjson.dumps({'took': 1, 'timed_out': False, 'hits': {'max_score': 1.0, 'hits': hits}})
+
+
+def measure(name: str, response: bytes, model: Type[BaseGetAPIModel], repeat: int) -> float:
+    serializer = JSONSerializer()
+    text = response.decode()
+    start = time.process_time()
+    for _ in range(repeat):
+        doc = serializer.loads(text)
+        [model(**hit['_source']) for hit in doc['hits']['hits']]
+    elapsed = (time.process_time() - start) / repeat
+    print(f'{name:>16} | {len(response) / 1024:>14.1f} | {elapsed * 1000:>13.2f}')
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--persons-per-film', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    films = synthetic_films(args.page_size, persons_per_film=args.persons_per_film)
+    full = search_response(films)
+    filtered = search_response(films, list(BaseFilm.__fields__))
+
+    print(f'{"_source":>16} | {"response, KiB":>14} | {"parse, ms":>13}')
+    full_time = measure('full (Film)', full, Film, args.repeat)
+    filtered_time = measure('BaseFilm fields', filtered, BaseFilm, args.repeat)
+    print(f'Response size: {len(full) / len(filtered):.0f}x smaller, parse: {full_time / filtered_time:.0f}x faster')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+from typing import Optional
+
+import jwt
+from redis.asyncio import Redis
+
+from core import config
+from db.cache import LocalCache
+
+
+class LocalTokenVerifier:
+    """Verifies the signature, expiration and revocation of access tokens without calling the auth service."""
+
+    REVOKED = b'revoked'
+
+    def __init__(self, key: Optional[str] = config.AUTH_JWT_KEY, algorithm: str = config.AUTH_JWT_ALGORITHM,
+                 revocation_cache: Optional[LocalCache] = None):
+        self.key = key
+        self.algorithm = algorithm
+        self.revocation_cache = revocation_cache or LocalCache(config.AUTH_CACHE_SIZE, config.AUTH_REVOCATION_CACHE_TTL)
+
+    def decode(self, token: str) -> dict:
+        """Return the claims of a valid access token, raise `jwt.InvalidTokenError` otherwise."""
+        claims = jwt.decode(token, self.key, algorithms=[self.algorithm], options={'require': ['exp', 'sub', 'jti']})
+        if claims.get('type', 'access') != 'access':
+            raise jwt.InvalidTokenError('Only non-refresh tokens are allowed')
+        return claims
+
+    async def is_revoked(self, jti: str, redis: Redis) -> bool:
+        """Look the token id up in the blocklist, errors of Redis are raised as they are."""
+        revoked = self.revocation_cache.get(jti)
+        if revoked is None:
+            revoked = await redis.get(jti) == self.REVOKED
+            self.revocation_cache.set(jti, revoked)
+        return revoked
+
+
+token_verifier = LocalTokenVerifier()
@@ -1,15 +1,22 @@
+import asyncio
 import json
 from typing import Union, Optional
 
 import jwt
-from aiohttp.client_exceptions import ClientConnectorError
+from aiohttp import ClientConnectionError
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
 from fastapi import Depends, HTTPException, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN
 
+from api.auth.local import token_verifier
 from api.utils.http_client import HTTPClient, http_client
+from core import config
 from core.config import AUTH_TOKEN_VALIDATION_URL, AUTH_PERMISSIONS_AND_TOKEN_VALIDATION_URL
+from db.cache import LocalCache
+from db.redis import get_auth_redis
 
 
 class AuthInfo(BaseModel):
@@ -51,8 +58,12 @@ class AuthRequired:
         :param permissions_optional
             If True, permissions are not strictly required to access an endpoint. An info on whether permissions are
             valid or not are provided in permissions_valid field of auth info.
+
+        With AUTH_LOCAL_VERIFICATION, the token is verified by `LocalTokenVerifier` and permission checks are cached.
         """
     _http_bearer = HTTPBearer(auto_error=False)
+    # Shared by all dependencies of a worker process: the key holds the permissions query
+    _permissions_cache = LocalCache(config.AUTH_CACHE_SIZE, config.AUTH_PERMISSIONS_CACHE_TTL)
 
     def __init__(
             self, *permissions: str, condition: Optional[dict] = None, token_optional=True, permissions_optional=True):
@@ -63,7 +74,8 @@ class AuthRequired:
 
     async def __call__(self, request: Request,
                        bearer_info: HTTPAuthorizationCredentials = Depends(_http_bearer),
-                       client: HTTPClient = Depends(http_client)):
+                       client: HTTPClient = Depends(http_client),
+                       auth_redis: Optional[Redis] = Depends(get_auth_redis)):
         if not bearer_info or not bearer_info.credentials:
             if not self.token_optional:
                 raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail="Authorization header is missing")
@@ -71,6 +83,9 @@ class AuthRequired:
                 return None
 
         token = bearer_info.credentials
+        if config.AUTH_LOCAL_VERIFICATION:
+            return await self._verify_locally(token, client, auth_redis)
+
         user_id = jwt.decode(token, options={'verify_signature': False})['sub']
         auth_info = AuthInfo(user_id=user_id)
 
@@ -84,7 +99,7 @@ class AuthRequired:
 
         try:
             auth_response = await client.get(url, params=params, token=token)
-        except ClientConnectorError:
+        except (ClientConnectionError, asyncio.TimeoutError):
             # graceful degradation
             return auth_info
 
@@ -104,6 +119,48 @@ class AuthRequired:
 
         return auth_info
 
+    async def _verify_locally(self, token: str, client: HTTPClient, auth_redis: Redis) -> AuthInfo:
+        try:
+            claims = token_verifier.decode(token)
+        except jwt.InvalidTokenError as error:
+            raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail=str(error))
+        user_id = claims['sub']
+        auth_info = AuthInfo(user_id=user_id)
+
+        try:
+            revoked = await token_verifier.is_revoked(claims['jti'], auth_redis)
+        except (RedisError, OSError):
+            # graceful degradation
+            return auth_info
+        if revoked:
+            raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail='Token has been revoked')
+        auth_info.token_valid = True
+
+        if not self.permissions and not self.condition:
+            return auth_info
+
+        permissions_query = json.dumps(self._get_permissions_query(), sort_keys=True)
+        cache_key = f'{user_id}:{permissions_query}'
+        permissions_valid = self._permissions_cache.get(cache_key)
+        if permissions_valid is None:
+            url = AUTH_PERMISSIONS_AND_TOKEN_VALIDATION_URL.format(user_id=user_id)
+            try:
+                auth_response = await client.get(url, params={'permissions': permissions_query}, token=token)
+            except (ClientConnectionError, asyncio.TimeoutError):
+                # graceful degradation
+                return auth_info
+
+            if auth_response.status != 200:
+                raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail=auth_response.json.get('msg'))
+            permissions_valid = bool(auth_response.json.get('valid'))
+            self._permissions_cache.set(cache_key, permissions_valid)
+
+        if not permissions_valid and not self.permissions_optional:
+            raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail='No permissions')
+        auth_info.permissions_valid = permissions_valid
+
+        return auth_info
+
     def _get_permissions_query(self) -> dict:
         permissions_query: dict[str, list[Union[str, dict]]] = {'any': ['all_all']}
         if self.condition:
@@ -0,0 +1,44 @@
+import time
+
+from fastapi import APIRouter, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core import metrics
+
+router = APIRouter()
+
+# Starlette appends the charset
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+@router.get('', include_in_schema=False)
+async def metrics_info() -> Response:
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    """Observes the latency of every request by method, endpoint function and status."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            endpoint = scope.get('endpoint')
+            handler = endpoint.__name__ if endpoint is not None else 'unmatched'
+            metrics.REQUEST_DURATION.observe(time.perf_counter() - start, scope['method'], handler, str(status))
@@ -1,8 +1,17 @@
+import asyncio
+import logging
+import time
 from dataclasses import dataclass
+from typing import Dict, Optional
 
 import aiohttp
 from fastapi import Request
 from multidict import CIMultiDictProxy
+from yarl import URL
+
+from core import config
+
+module_logger = logging.getLogger('HTTPClient')
 
 
 @dataclass
@@ -12,29 +21,107 @@ class HTTPClientResponse:
     json: dict
 
 
+class CircuitOpenError(aiohttp.ClientConnectionError):
+    """The host failed too many times in a row, calls to it are not made for a while."""
+
+
+class CircuitBreaker:
+    """Stops calls to a host after `failures` failed calls in a row, then lets one trial call through at a time."""
+
+    def __init__(self, failures: int = config.HTTP_CLIENT_BREAKER_FAILURES,
+                 reset_timeout: float = config.HTTP_CLIENT_BREAKER_RESET_TIMEOUT):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self._failed = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+
+    def before_call(self) -> bool:
+        """Raise `CircuitOpenError` if the call is not to be made, return True if it is the trial call."""
+        if self._opened_at is None:
+            return False
+        if self._trial or time.monotonic() - self._opened_at < self.reset_timeout:
+            raise CircuitOpenError('Circuit is open')
+        self._trial = True
+        return True
+
+    def end_trial(self):
+        """Let another trial call through if this one ended without a result, e.g. it was cancelled."""
+        self._trial = False
+
+    def on_success(self):
+        self._failed = 0
+        self._opened_at = None
+        self._trial = False
+
+    def on_failure(self):
+        self._failed += 1
+        self._trial = False
+        if self._failed >= self.failures:
+            if self._opened_at is None:
+                module_logger.warning('Circuit is open after %d failed calls', self._failed)
+            self._opened_at = time.monotonic()
+
+
+class HTTPClientPool:
+    """One aiohttp session of the worker process, started and closed with the application."""
+
+    def __init__(self):
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def start(self):
+        connector = aiohttp.TCPConnector(limit=config.HTTP_CLIENT_LIMIT,
+                                         limit_per_host=config.HTTP_CLIENT_LIMIT_PER_HOST,
+                                         keepalive_timeout=config.HTTP_CLIENT_KEEPALIVE_TIMEOUT,
+                                         ttl_dns_cache=config.HTTP_CLIENT_DNS_CACHE_TTL)
+        timeout = aiohttp.ClientTimeout(total=config.HTTP_CLIENT_TIMEOUT, connect=config.HTTP_CLIENT_CONNECT_TIMEOUT)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        host = URL(url).origin().human_repr()
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker()
+        return breaker
+
+
 class HTTPClient:
     """Simple async HTTP client based on aiohttp with some convenient features, such as X-Request-Id headers transmission
       and authorization header generation"""
-    def __init__(self):
-        self.request_id_header = None
-
-    def __call__(self, request: Request):
-        if request_id := request.headers.get('X-Request-Id'):
-            self.request_id_header = {'X-Request-Id': request_id}
-        return self
+    def __init__(self, pool: HTTPClientPool, request_id_header: Optional[dict] = None):
+        self.pool = pool
+        self.request_id_header = request_id_header
 
     async def get(self, url, params=None, headers=None, token=None) -> HTTPClientResponse:
         final_headers = self._get_updated_headers(headers, token)
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=final_headers, params=params) as response:
+        breaker = self.pool.breaker(url)
+        trial = breaker.before_call()
+        try:
+            async with self.pool.session.get(url, headers=final_headers, params=params) as response:
+                if response.status >= 500:
+                    breaker.on_failure()
+                else:
+                    breaker.on_success()
                 return HTTPClientResponse(
                     status=response.status,
                     headers=response.headers,
                     json=await response.json()
                 )
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            breaker.on_failure()
+            raise
+        finally:
+            if trial:
+                breaker.end_trial()
 
     def _get_updated_headers(self, initial_headers, token):
-        headers = initial_headers or {}
+        headers = dict(initial_headers or {})
         if self.request_id_header:
             headers.update(self.request_id_header)
         if token:
@@ -43,4 +130,9 @@ class HTTPClient:
         return headers or initial_headers
 
 
-http_client = HTTPClient()
+http_pool = HTTPClientPool()
+
+
+def http_client(request: Request) -> HTTPClient:
+    request_id = request.headers.get('X-Request-Id')
+    return HTTPClient(http_pool, {'X-Request-Id': request_id} if request_id else None)
@@ -3,26 +3,36 @@ from http import HTTPStatus
 from typing import List
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 
+from core import config
+from core.logger import SampledLogger
 from models.film import BaseFilm, Film
-from queryes.base import QueryParamsBase, ServiceQueryInfo
+from queryes.base import BatchInfo, QueryParamsBase, ServiceQueryInfo
 from queryes.film import FilmQueryParamsInfo, FilmQueryParamsSearch
 from services.film import FilmService, get_film_service
 
 router = APIRouter()
 
-module_logger = logging.getLogger('FilmAPI')
+module_logger = SampledLogger(logging.getLogger('FilmAPI'), config.LOG_SAMPLE_RATE)
 
 
-async def get_films(params: QueryParamsBase, film_service: FilmService) -> List[BaseFilm]:
+async def get_films(params: QueryParamsBase, film_service: FilmService) -> Response:
     module_logger.info('Getting films with query (%s)', params)
     service_query_info = ServiceQueryInfo.parse_obj(params.asdict())
-    films = await film_service.get_by_query(service_query_info)
+    next_cursor = None
+    if service_query_info.page.cursor is None:
+        films = await film_service.get_response_by_query(service_query_info, BaseFilm)
+    else:
+        page = await film_service.get_page_response_by_query(service_query_info, BaseFilm)
+        films, next_cursor = page or (None, None)
     if not films:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='films not found')
 
-    return [Film(**film.dict()) for film in films]
+    response = Response(films, media_type='application/json')
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 
 @router.get('/',
@@ -30,7 +40,7 @@ async def get_films(params: QueryParamsBase, film_service: FilmService) -> List[
             description='Info about films with pagination, filtering by genre and sorting by rating and title',
             response_description='Films list with base info')
 async def films_info(params: FilmQueryParamsInfo = Depends(),
-                     film_service: FilmService = Depends(get_film_service)) -> List[BaseFilm]:
+                     film_service: FilmService = Depends(get_film_service)) -> Response:
     return await get_films(params, film_service)
 
 
@@ -40,18 +50,28 @@ async def films_info(params: FilmQueryParamsInfo = Depends(),
                         and relevance''',
             response_description='Films list with base info')
 async def films_search(params: FilmQueryParamsSearch = Depends(),
-                       film_service: FilmService = Depends(get_film_service)) -> List[BaseFilm]:
+                       film_service: FilmService = Depends(get_film_service)) -> Response:
     return await get_films(params, film_service)
 
 
+@router.post('/batch',
+             response_model=List[Film],
+             description='Detailed info about several films at once, the films not found are left out',
+             response_description='Film details list in the order of the requested ids')
+async def films_batch(batch: BatchInfo, film_service: FilmService = Depends(get_film_service)) -> Response:
+    module_logger.info('Getting films with ids (%s)', batch.ids)
+    films = await film_service.get_response_by_ids([str(film_id) for film_id in batch.ids], Film)
+    return Response(films, media_type='application/json')
+
+
 @router.get('/{film_id}',
             response_model=Film,
             description='Detailed info about film including description, rating, genres, persons etc',
             response_description='Film details')
-async def film_details(film_id: UUID, film_service: FilmService = Depends(get_film_service)) -> Film:
+async def film_details(film_id: UUID, film_service: FilmService = Depends(get_film_service)) -> Response:
     module_logger.info('Getting film with id (%s)', film_id)
-    film = await film_service.get_by_id(str(film_id))
+    film = await film_service.get_response_by_id(str(film_id), Film)
     if not film:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='film not found')
 
-    return Film(**film.dict())
+    return Response(film, media_type='application/json')
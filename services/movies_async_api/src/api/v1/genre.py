@@ -3,26 +3,36 @@ from http import HTTPStatus
 from typing import List
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 
+from core import config
+from core.logger import SampledLogger
 from models.genre import BaseGenre, Genre
-from queryes.base import QueryParamsBase, ServiceQueryInfo
+from queryes.base import BatchInfo, QueryParamsBase, ServiceQueryInfo
 from queryes.genre import GenreQueryParamsInfo, GenreQueryParamsSearch
 from services.genre import GenreService, get_genre_service
 
 router = APIRouter()
 
-module_logger = logging.getLogger('GenreAPI')
+module_logger = SampledLogger(logging.getLogger('GenreAPI'), config.LOG_SAMPLE_RATE)
 
 
-async def get_genres(params: QueryParamsBase, genre_service: GenreService) -> List[BaseGenre]:
+async def get_genres(params: QueryParamsBase, genre_service: GenreService) -> Response:
     module_logger.info('Getting genres with query (%s)', params)
     service_query_info = ServiceQueryInfo.parse_obj(params.asdict())
-    genres = await genre_service.get_by_query(service_query_info)
+    next_cursor = None
+    if service_query_info.page.cursor is None:
+        genres = await genre_service.get_response_by_query(service_query_info, BaseGenre)
+    else:
+        page = await genre_service.get_page_response_by_query(service_query_info, BaseGenre)
+        genres, next_cursor = page or (None, None)
     if not genres:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='genres not found')
 
-    return [Genre(**genre.dict()) for genre in genres]
+    response = Response(genres, media_type='application/json')
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 
 @router.get('/',
@@ -30,7 +40,7 @@ async def get_genres(params: QueryParamsBase, genre_service: GenreService) -> Li
             description='Info about genres with pagination and sorting by name',
             response_description='Genres list with base info')
 async def genres_info(params: GenreQueryParamsInfo = Depends(),
-                      genre_service: GenreService = Depends(get_genre_service)) -> List[BaseGenre]:
+                      genre_service: GenreService = Depends(get_genre_service)) -> Response:
     genres = await get_genres(params, genre_service)
     return genres
 
@@ -40,19 +50,29 @@ async def genres_info(params: GenreQueryParamsInfo = Depends(),
             description='Genres full-text search with pagination and sorting by name and relevance',
             response_description='Genres list with base info')
 async def genres_search(params: GenreQueryParamsSearch = Depends(),
-                        genre_service: GenreService = Depends(get_genre_service)) -> List[BaseGenre]:
+                        genre_service: GenreService = Depends(get_genre_service)) -> Response:
     genres = await get_genres(params, genre_service)
     return genres
 
 
+@router.post('/batch',
+             response_model=List[Genre],
+             description='Detailed info about several genres at once, the genres not found are left out',
+             response_description='Genre details list in the order of the requested ids')
+async def genres_batch(batch: BatchInfo, genre_service: GenreService = Depends(get_genre_service)) -> Response:
+    module_logger.info('Getting genres with ids (%s)', batch.ids)
+    genres = await genre_service.get_response_by_ids([str(genre_id) for genre_id in batch.ids], Genre)
+    return Response(genres, media_type='application/json')
+
+
 @router.get('/{genre_id}',
             response_model=Genre,
             description='Detailed info about genre including description',
             response_description='Genre details')
-async def genre_details(genre_id: UUID, genre_service: GenreService = Depends(get_genre_service)) -> Genre:
+async def genre_details(genre_id: UUID, genre_service: GenreService = Depends(get_genre_service)) -> Response:
     module_logger.info('Getting genre with id (%s)', genre_id)
-    genre = await genre_service.get_by_id(str(genre_id))
+    genre = await genre_service.get_response_by_id(str(genre_id), Genre)
     if not genre:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='genre not found')
 
-    return Genre(**genre.dict())
+    return Response(genre, media_type='application/json')
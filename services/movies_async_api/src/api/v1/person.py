@@ -3,26 +3,36 @@ from http import HTTPStatus
 from typing import List
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 
+from core import config
+from core.logger import SampledLogger
 from models.person import BasePerson, Person
-from queryes.base import QueryParamsBase, ServiceQueryInfo
+from queryes.base import BatchInfo, QueryParamsBase, ServiceQueryInfo
 from queryes.person import PersonQueryParamsInfo, PersonQueryParamsSearch
 from services.person import PersonService, get_person_service
 
 router = APIRouter()
 
-module_logger = logging.getLogger('PersonAPI')
+module_logger = SampledLogger(logging.getLogger('PersonAPI'), config.LOG_SAMPLE_RATE)
 
 
-async def get_persons(params: QueryParamsBase, person_service: PersonService) -> List[BasePerson]:
+async def get_persons(params: QueryParamsBase, person_service: PersonService) -> Response:
     module_logger.info('Getting persons with query (%s)', params)
     service_query_info = ServiceQueryInfo.parse_obj(params.asdict())
-    persons = await person_service.get_by_query(service_query_info)
+    next_cursor = None
+    if service_query_info.page.cursor is None:
+        persons = await person_service.get_response_by_query(service_query_info, BasePerson)
+    else:
+        page = await person_service.get_page_response_by_query(service_query_info, BasePerson)
+        persons, next_cursor = page or (None, None)
     if not persons:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='persons not found')
 
-    return [Person(**person.dict()) for person in persons]
+    response = Response(persons, media_type='application/json')
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 
 @router.get('/',
@@ -30,7 +40,7 @@ async def get_persons(params: QueryParamsBase, person_service: PersonService) ->
             description='Info about persons with pagination, filtering by film and sorting by full name',
             response_description='Persons list with base info')
 async def persons_info(params: PersonQueryParamsInfo = Depends(),
-                       person_service: PersonService = Depends(get_person_service)) -> List[BasePerson]:
+                       person_service: PersonService = Depends(get_person_service)) -> Response:
     persons = await get_persons(params, person_service)
     return persons
 
@@ -42,19 +52,29 @@ async def persons_info(params: PersonQueryParamsInfo = Depends(),
             response_description='Persons list with base info'
             )
 async def persons_search(params: PersonQueryParamsSearch = Depends(),
-                         person_service: PersonService = Depends(get_person_service)) -> List[BasePerson]:
+                         person_service: PersonService = Depends(get_person_service)) -> Response:
     persons = await get_persons(params, person_service)
     return persons
 
 
+@router.post('/batch',
+             response_model=List[Person],
+             description='Detailed info about several persons at once, the persons not found are left out',
+             response_description='Person details list in the order of the requested ids')
+async def persons_batch(batch: BatchInfo, person_service: PersonService = Depends(get_person_service)) -> Response:
+    module_logger.info('Getting persons with ids (%s)', batch.ids)
+    persons = await person_service.get_response_by_ids([str(person_id) for person_id in batch.ids], Person)
+    return Response(persons, media_type='application/json')
+
+
 @router.get('/{person_id}',
             response_model=Person,
             description='Detailed info about person including its roles and films',
             response_description='Person details')
-async def person_details(person_id: UUID, person_service: PersonService = Depends(get_person_service)) -> Person:
+async def person_details(person_id: UUID, person_service: PersonService = Depends(get_person_service)) -> Response:
     module_logger.info('Getting person with id (%s)', person_id)
-    person = await person_service.get_by_id(str(person_id))
+    person = await person_service.get_response_by_id(str(person_id), Person)
     if not person:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='person not found')
 
-    return Person(**person.dict())
+    return Response(person, media_type='application/json')
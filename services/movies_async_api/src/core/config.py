@@ -7,16 +7,87 @@ logging_config.dictConfig(LOGGING)
 
 PROJECT_NAME = 'Movies Async API v1'
 
+# Share of the per-request info and debug records that are logged, 1 logs them all
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 0.01))
+
 CACHE_EXPIRATION = int(os.getenv('CACHE_EXPIRATION', 60 * 5))
+# A stale entry is still served this many seconds while it is refreshed in background
+CACHE_STALE_EXPIRATION = int(os.getenv('CACHE_STALE_EXPIRATION', 60))
+# How early entries are refreshed: 0 disables early refreshes, values above 1 favour earlier ones
+CACHE_EARLY_REFRESH_BETA = float(os.getenv('CACHE_EARLY_REFRESH_BETA', 1.0))
+
+# In-process cache in front of Redis: entries per service and their lifetime in seconds
+LOCAL_CACHE_SIZE = int(os.getenv('LOCAL_CACHE_SIZE', 1024))
+LOCAL_CACHE_TTL = float(os.getenv('LOCAL_CACHE_TTL', 10))
+
+# Lock a missing key in Redis so that only one worker loads it from Elasticsearch, the others poll the cache
+CACHE_LOCK = os.getenv('CACHE_LOCK', 'false').lower() == 'true'
+CACHE_LOCK_TIMEOUT = float(os.getenv('CACHE_LOCK_TIMEOUT', 5))
+CACHE_LOCK_POLL_INTERVAL = float(os.getenv('CACHE_LOCK_POLL_INTERVAL', 0.05))
+
+# Evict the cached items of the documents the ETL announces on this Redis stream as it indexes them
+CACHE_INVALIDATION = os.getenv('CACHE_INVALIDATION', 'false').lower() == 'true'
+CACHE_INVALIDATION_STREAM = os.getenv('CACHE_INVALIDATION_STREAM', 'cache_invalidation')
 
 PAGE_SIZE = int(os.getenv('PAGE_SIZE', 50))
+# List and search pages are sliced from blocks of this many hits cached once per query, 0 caches every page apart.
+# Keep it a divisor of the index max_result_window (10000) so that the blocks of reachable pages stay within it
+QUERY_BLOCK_SIZE = int(os.getenv('QUERY_BLOCK_SIZE', 200))
+
+# Maximum number of ids requested at once from the batch endpoints
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', 100))
 
 TIME_LIMIT = int(os.getenv('TIME_LIMIT', 5))
 
 REDIS_HOST = os.getenv('REDIS_HOST', '127.0.0.1')
 REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+# Connections per worker process, made as they are needed; a command waits this many seconds for a free one
+REDIS_POOL_SIZE = int(os.getenv('REDIS_POOL_SIZE', 100))
+REDIS_POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', 5))
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 5))
+REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT', 1))
+# Connections idle this many seconds are checked with a PING before they are used again
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30))
+# Retries of a command failed by a broken connection, on a new one
+REDIS_RETRIES = int(os.getenv('REDIS_RETRIES', 3))
+# Send the cache commands issued at the same time in one pipeline, at most this many at once
+REDIS_AUTO_PIPELINE = os.getenv('REDIS_AUTO_PIPELINE', 'true').lower() == 'true'
+REDIS_PIPELINE_MAX_SIZE = int(os.getenv('REDIS_PIPELINE_MAX_SIZE', 256))
+# Evict the local cache entries of the keys written to Redis by other workers (Redis 6+)
+REDIS_CLIENT_TRACKING = os.getenv('REDIS_CLIENT_TRACKING', 'false').lower() == 'true'
 
 ELASTIC_HOST = os.getenv('ELASTICSEARCH_HOST', '127.0.0.1')
 ELASTIC_PORT = int(os.getenv('ELASTICSEARCH_PORT', 9200))
+# Search with templates stored at startup: requests carry only the template id and its parameters.
+# Off until the templates are checked against a real Elasticsearch, see the README
+ELASTIC_SEARCH_TEMPLATES = os.getenv('ELASTIC_SEARCH_TEMPLATES', 'false').lower() == 'true'
+
+# Connections to the other services: pool limits, keep-alive and timeouts in seconds
+HTTP_CLIENT_LIMIT = int(os.getenv('HTTP_CLIENT_LIMIT', 200))
+HTTP_CLIENT_LIMIT_PER_HOST = int(os.getenv('HTTP_CLIENT_LIMIT_PER_HOST', 100))
+HTTP_CLIENT_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_CLIENT_KEEPALIVE_TIMEOUT', 30))
+HTTP_CLIENT_DNS_CACHE_TTL = int(os.getenv('HTTP_CLIENT_DNS_CACHE_TTL', 300))
+HTTP_CLIENT_TIMEOUT = float(os.getenv('HTTP_CLIENT_TIMEOUT', 3))
+HTTP_CLIENT_CONNECT_TIMEOUT = float(os.getenv('HTTP_CLIENT_CONNECT_TIMEOUT', 1))
+# Calls to a service stop after this many failures in a row and are tried again every reset timeout seconds
+HTTP_CLIENT_BREAKER_FAILURES = int(os.getenv('HTTP_CLIENT_BREAKER_FAILURES', 5))
+HTTP_CLIENT_BREAKER_RESET_TIMEOUT = float(os.getenv('HTTP_CLIENT_BREAKER_RESET_TIMEOUT', 10))
+
+AUTH_HOST = os.getenv('AUTH_HOST', '127.0.0.1')
+AUTH_PORT = int(os.getenv('AUTH_PORT', 5000))
+AUTH_URL = 'http://{host}:{port}/auth/v1'.format(host=AUTH_HOST, port=AUTH_PORT)
+AUTH_TOKEN_VALIDATION_URL = AUTH_URL + '/auth_token/validation'
+AUTH_PERMISSIONS_AND_TOKEN_VALIDATION_URL = AUTH_URL + '/users/{user_id}/combined_permissions/validation'
+
+# Verify the signature and revocation of access tokens in the API, permissions are still checked by the auth service
+AUTH_LOCAL_VERIFICATION = os.getenv('AUTH_LOCAL_VERIFICATION', 'false').lower() == 'true'
+AUTH_JWT_KEY = os.getenv('AUTH_JWT_KEY', os.getenv('FLASK_SECRET_KEY'))
+AUTH_JWT_ALGORITHM = os.getenv('AUTH_JWT_ALGORITHM', 'HS256')
+AUTH_REDIS_HOST = os.getenv('REDIS_AUTH_HOST', '127.0.0.1')
+AUTH_REDIS_PORT = int(os.getenv('REDIS_AUTH_PORT', 6380))
+# Seconds a revocation lookup and a permission check result are reused in the worker process
+AUTH_REVOCATION_CACHE_TTL = float(os.getenv('AUTH_REVOCATION_CACHE_TTL', 5))
+AUTH_PERMISSIONS_CACHE_TTL = float(os.getenv('AUTH_PERMISSIONS_CACHE_TTL', 60))
+AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', 10000))
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -1,3 +1,6 @@
+import logging
+import random
+
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 LOG_DEFAULT_HANDLERS = ['console', ]
 
@@ -54,4 +57,17 @@ LOGGING = {
         'formatter': 'verbose',
         'handlers': LOG_DEFAULT_HANDLERS,
     },
-}
\ No newline at end of file
+}
+
+
+class SampledLogger(logging.LoggerAdapter):
+    """Passes only a `rate` share of the records below WARNING, picked at random; warnings and errors all pass."""
+
+    def __init__(self, logger: logging.Logger, rate: float):
+        super().__init__(logger, {})
+        self.rate = rate
+
+    def isEnabledFor(self, level: int) -> bool:
+        if level < logging.WARNING and random.random() >= self.rate:
+            return False
+        return self.logger.isEnabledFor(level)
@@ -0,0 +1,101 @@
+"""Metrics of the worker process in the Prometheus text exposition format, served at /metrics."""
+import bisect
+from typing import Dict, List, Sequence, Tuple
+
+# Seconds, for the latency of whole requests
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Seconds, for round trips and CPU work within a request
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+Labels = Tuple[str, ...]
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        registry.append(self)
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+
+    def _labels(self, labels: Labels, **extra: str) -> str:
+        pairs = list(zip(self.labelnames, labels)) + list(extra.items())
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines.extend(f'{self.name}{self._labels(labels)} {value}' for labels, value in self._values.items())
+        return lines
+
+
+class Histogram(Metric):
+    """Observations counted in buckets of upper bounds, rendered cumulative as Prometheus expects."""
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = REQUEST_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # Count of every bucket, the last one for values above all bounds, and the sum of the values
+        self._values: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        counts = self._values.get(labels)
+        if counts is None:
+            counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, counts in self._values.items():
+            total = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                total += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{self._labels(labels, le=le)} {total}')
+            lines.append(f'{self.name}_sum{self._labels(labels)} {counts[-1]}')
+            lines.append(f'{self.name}_count{self._labels(labels)} {total}')
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def render() -> str:
+    return '\n'.join(line for metric in registry for line in metric.render()) + '\n'
+
+
+registry: List[Metric] = []
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Time to serve an API request',
+                             ('method', 'handler', 'status'))
+CACHE_LOOKUPS = Counter('cache_lookups_total', 'Cache lookups of the services by key prefix and result',
+                        ('service', 'prefix', 'result'))
+ELASTIC_DURATION = Histogram('elastic_request_duration_seconds', 'Round trip of Elasticsearch requests',
+                             ('index', 'operation'), FAST_BUCKETS)
+ELASTIC_TOOK = Histogram('elastic_took_seconds', 'Time Elasticsearch reports it spent on searches',
+                         ('index', 'operation'), FAST_BUCKETS)
+REDIS_DURATION = Histogram('redis_command_duration_seconds', 'Round trip of the cache commands to Redis',
+                           ('command',), FAST_BUCKETS)
+SERIALIZATION_DURATION = Histogram('serialization_duration_seconds',
+                                   'Time to render response bodies and to encode and decode cache entries',
+                                   ('operation',), FAST_BUCKETS)
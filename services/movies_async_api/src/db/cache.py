@@ -1,15 +1,38 @@
 import logging
+import math
+import random
+import time
+import uuid
 from abc import ABC, abstractmethod
-from typing import List, Optional, Type, Union
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type, Union
 
 import orjson
-from aioredis import Redis
+from redis.asyncio import Redis
 
-from core import config
+from core import config, metrics
+from core.logger import SampledLogger
 from models.base import BaseGetAPIModel
 
 
-cache_logger = logging.getLogger('Cache')
+cache_logger = SampledLogger(logging.getLogger('Cache'), config.LOG_SAMPLE_RATE)
+
+# Models or the JSON response body rendered from them
+CacheItem = Union[BaseGetAPIModel, List[BaseGetAPIModel], bytes]
+
+
+@dataclass
+class CacheEntry:
+    """Cached item with the time it becomes stale at and the time its loading took, both in seconds."""
+    item: CacheItem
+    expires_at: float
+    delta: float = 0.0
+
+    def should_refresh(self) -> bool:
+        """Probabilistic early expiration: the closer to `expires_at` and the slower the loading, the likelier it is."""
+        early = -self.delta * config.CACHE_EARLY_REFRESH_BETA * math.log(1 - random.random())
+        return time.time() + early >= self.expires_at
 
 
 class BaseCache(ABC):
@@ -20,35 +43,272 @@ class BaseCache(ABC):
         pass
 
     @abstractmethod
-    async def get(self, key: str, default=None) -> Optional[Union[BaseGetAPIModel, List[BaseGetAPIModel]]]:
+    async def get_entry(self, key: str) -> Optional[CacheEntry]:
         pass
 
     @abstractmethod
-    async def set(self, item: Union[BaseGetAPIModel, List[BaseGetAPIModel]], key: str):
+    async def get_entries(self, keys: List[str]) -> List[Optional[CacheEntry]]:
+        """Return the entries of `keys` in one request, None for the missing ones."""
         pass
 
+    @abstractmethod
+    async def set(self, item: CacheItem, key: str, delta: float = 0.0):
+        """Put `item` loaded in `delta` seconds, it becomes stale in `CACHE_EXPIRATION` seconds."""
+        pass
+
+    @abstractmethod
+    async def set_many(self, items: Dict[str, CacheItem], delta: float = 0.0):
+        """Put the items by their keys in one request."""
+        pass
+
+    @abstractmethod
+    async def delete(self, keys: List[str]):
+        """Evict the items of `keys` in one request."""
+        pass
+
+    async def get(self, key: str, default=None) -> Optional[CacheItem]:
+        entry = await self.get_entry(key)
+        return default if entry is None else entry.item
+
 
 class RedisCache(BaseCache):
+    """Entries are a JSON header line with the expiration, then the models as JSON or a raw response body."""
+
+    async def get_entry(self, key: str) -> Optional[CacheEntry]:
+        return self._load_entry(key, await self._command('get', self.redis.get(key)))
 
-    async def get(self, key: str, default=None) -> Optional[Union[BaseGetAPIModel, List[BaseGetAPIModel]]]:
-        data = await self.redis.get(key)
+    async def get_entries(self, keys: List[str]) -> List[Optional[CacheEntry]]:
+        values = await self._command('mget', self.redis.mget(*keys))
+        return [self._load_entry(key, data) for key, data in zip(keys, values)]
+
+    async def set(self, item: CacheItem, key: str, delta: float = 0.0):
+        await self._command('set', self.redis.set(key, self._dump_entry(item, delta), ex=self._expiration()))
+
+    async def set_many(self, items: Dict[str, CacheItem], delta: float = 0.0):
+        pipeline = self.redis.pipeline(transaction=False)
+        for key, item in items.items():
+            pipeline.set(key, self._dump_entry(item, delta), ex=self._expiration())
+        await self._command('pipeline', pipeline.execute())
+
+    async def delete(self, keys: List[str]):
+        await self._command('del', self.redis.delete(*keys))
+
+    @staticmethod
+    async def _command(name: str, command: Awaitable):
+        start = time.perf_counter()
+        try:
+            return await command
+        finally:
+            metrics.REDIS_DURATION.observe(time.perf_counter() - start, name)
+
+    def _load_entry(self, key: str, data: Optional[bytes]) -> Optional[CacheEntry]:
         if not data:
-            return default
+            return None
+
+        header, separator, payload = data.partition(b'\n')
+        if not separator:
+            cache_logger.info('Cache entry of a former format is ignored (key %s)', key)
+            return None
 
         cache_logger.info('Cache hit (key %s)', key)
-        data_obj = orjson.loads(data)
-        if isinstance(data_obj, list):
-            return [self.response_model.parse_obj(obj) for obj in data_obj]
-        return self.response_model.parse_obj(data_obj)
-
-    async def set(self, item: Union[BaseGetAPIModel, List[BaseGetAPIModel]], key: str):
-        if isinstance(item, list):
-            item_json_obj = [sub_item.dict() for sub_item in item]
+        start = time.perf_counter()
+        header = orjson.loads(header)
+        if header['raw']:
+            item = payload
         else:
-            item_json_obj = item.dict()
-        item_json = orjson.dumps(item_json_obj)
-        await self.redis.set(key, item_json, expire=config.CACHE_EXPIRATION)
+            item_obj = orjson.loads(payload)
+            if isinstance(item_obj, list):
+                item = [self.response_model.parse_obj(obj) for obj in item_obj]
+            else:
+                item = self.response_model.parse_obj(item_obj)
+        metrics.SERIALIZATION_DURATION.observe(time.perf_counter() - start, 'cache_load')
+        return CacheEntry(item, header['expires_at'], header['delta'])
+
+    @staticmethod
+    def _expiration() -> int:
+        return config.CACHE_EXPIRATION + config.CACHE_STALE_EXPIRATION
+
+    @staticmethod
+    def _dump_entry(item: CacheItem, delta: float) -> bytes:
+        start = time.perf_counter()
+        if isinstance(item, bytes):
+            payload = item
+        elif isinstance(item, list):
+            payload = orjson.dumps([sub_item.dict() for sub_item in item])
+        else:
+            payload = orjson.dumps(item.dict())
+        header = orjson.dumps({
+            'expires_at': time.time() + config.CACHE_EXPIRATION,
+            'delta': delta,
+            'raw': isinstance(item, bytes),
+        })
+        entry = b'\n'.join((header, payload))
+        metrics.SERIALIZATION_DURATION.observe(time.perf_counter() - start, 'cache_dump')
+        return entry
 
     def __init__(self, redis: Redis):
         self.redis = redis
 
+
+class LocalCache:
+    """Bounded in-process LRU cache whose entries also expire `ttl` seconds after they are put."""
+
+    def __init__(self, max_size: int = config.LOCAL_CACHE_SIZE, ttl: float = config.LOCAL_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # Bumped by every invalidation, including the announcements of the writes of this process
+        self.epoch = 0
+        # Bumped by the invalidations evicting keys, that is not by the announcements of the writes of this process
+        self.evictions = 0
+        # Set by `ClientTracking` while Redis announces the writes of the tracked keys
+        self.tracked = False
+        self._own_writes: Dict[str, int] = {}
+        self._items: OrderedDict[str, Tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: str, default=None):
+        entry = self._items.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._items[key]
+            self.misses += 1
+            return default
+
+        self._items.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value) -> None:
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def set_read(self, key: str, value, epoch: int) -> None:
+        """Put `value` read from the remote cache at `epoch`, unless a write of the key may have overtaken the read."""
+        if epoch == self.epoch and key not in self._own_writes:
+            self.set(key, value)
+
+    def set_written(self, key: str, value, evictions: int) -> None:
+        """Put `value` written to the remote cache, unless a key was evicted after `evictions`."""
+        if evictions == self.evictions:
+            self.set(key, value)
+
+    def delete(self, key: str) -> None:
+        self.epoch += 1
+        self.evictions += 1
+        self._items.pop(key, None)
+
+    def clear(self) -> None:
+        self.epoch += 1
+        self.evictions += 1
+        self._own_writes.clear()
+        self._items.clear()
+
+    def expect_invalidation(self, key: str) -> None:
+        """Note a write of `key` by this process, so that its announcement does not evict the written value."""
+        if self.tracked:
+            self._own_writes[key] = self._own_writes.get(key, 0) + 1
+
+    def cancel_invalidation(self, key: str) -> None:
+        """Forget a write noted with `expect_invalidation`, when it failed or once it is announced."""
+        count = self._own_writes.pop(key, 0) - 1
+        if count > 0:
+            self._own_writes[key] = count
+
+    def invalidate(self, key: str) -> None:
+        """Evict `key` announced by client-side caching, unless the announcement is of a write of this process."""
+        if key not in self._own_writes:
+            self.delete(key)
+            return
+        self.epoch += 1
+        self.cancel_invalidation(key)
+
+
+class TwoLevelCache(BaseCache):
+    """`LocalCache` of the worker process in front of a shared cache, usually `RedisCache`."""
+
+    @property
+    def response_model(self) -> Type[BaseGetAPIModel]:
+        return self.remote.response_model
+
+    async def get_entry(self, key: str) -> Optional[CacheEntry]:
+        entry = self.local.get(key)
+        if entry is not None:
+            cache_logger.debug('Local cache hit (key %s)', key)
+            return entry
+
+        epoch = self.local.epoch
+        entry = await self.remote.get_entry(key)
+        if entry is not None:
+            self.local.set_read(key, entry, epoch)
+        return entry
+
+    async def get_entries(self, keys: List[str]) -> List[Optional[CacheEntry]]:
+        entries = [self.local.get(key) for key in keys]
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        if missing:
+            epoch = self.local.epoch
+            remote_entries = await self.remote.get_entries([keys[i] for i in missing])
+            for i, entry in zip(missing, remote_entries):
+                if entry is not None:
+                    self.local.set_read(keys[i], entry, epoch)
+                    entries[i] = entry
+        return entries
+
+    async def set(self, item: CacheItem, key: str, delta: float = 0.0):
+        await self._write({key: item}, delta, lambda: self.remote.set(item, key, delta))
+
+    async def set_many(self, items: Dict[str, CacheItem], delta: float = 0.0):
+        await self._write(items, delta, lambda: self.remote.set_many(items, delta))
+
+    async def _write(self, items: Dict[str, CacheItem], delta: float, write: Callable[[], Awaitable]):
+        evictions = self.local.evictions
+        for key in items:
+            self.local.expect_invalidation(key)
+        try:
+            await write()
+        except BaseException:
+            for key in items:
+                self.local.cancel_invalidation(key)
+            raise
+        expires_at = time.time() + config.CACHE_EXPIRATION
+        for key, item in items.items():
+            self.local.set_written(key, CacheEntry(item, expires_at, delta), evictions)
+
+    async def delete(self, keys: List[str]):
+        for key in keys:
+            self.local.delete(key)
+        await self.remote.delete(keys)
+
+    def __init__(self, local: LocalCache, remote: BaseCache):
+        self.local = local
+        self.remote = remote
+
+
+class RedisLock:
+    """Lock of a cache key shared by all workers, it expires by itself if the holder dies."""
+
+    # Delete the lock only if it is still held with the token, not after it expired and was taken by another worker
+    RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    async def acquire(self, key: str) -> Optional[str]:
+        """Return a token to release the lock with, or None if the lock is held by someone else."""
+        token = uuid.uuid4().hex
+        acquired = await self.redis.set(self._lock_key(key), token, px=int(self.timeout * 1000), nx=True)
+        return token if acquired else None
+
+    async def release(self, key: str, token: str):
+        await self.redis.eval(self.RELEASE_SCRIPT, 1, self._lock_key(key), token)
+
+    @staticmethod
+    def _lock_key(key: str) -> str:
+        return '{key}:Lock'.format(key=key)
+
+    def __init__(self, redis: Redis, timeout: float = config.CACHE_LOCK_TIMEOUT):
+        self.redis = redis
+        self.timeout = timeout
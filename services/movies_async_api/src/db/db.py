@@ -1,16 +1,19 @@
 import logging
+import time
 from abc import ABC, abstractmethod
-from collections import defaultdict
-from typing import DefaultDict, List, Optional, Type
+from typing import Awaitable, List, Optional, Tuple, Type
 
 from elasticsearch import AsyncElasticsearch
 from elasticsearch import exceptions as elastic_exceptions
 
+from core import config, metrics
+from core.logger import SampledLogger
+from db.query import QueryBuilder
 from models.base import BaseGetAPIModel
-from queryes.base import FilterInfo, PageInfo, ServiceQueryInfo, SortInfo
+from queryes.base import ServiceQueryInfo, encode_cursor
 
 
-db_logger = logging.getLogger('DB')
+db_logger = SampledLogger(logging.getLogger('DB'), config.LOG_SAMPLE_RATE)
 
 
 class BaseDB(ABC):
@@ -45,7 +48,20 @@ class BaseDB(ABC):
         pass
 
     @abstractmethod
-    async def query_item(self, query: ServiceQueryInfo) -> List[BaseGetAPIModel]:
+    async def get_many(self, item_ids: List[str]) -> List[BaseGetAPIModel]:
+        """Return the found items of `item_ids` in one request."""
+        pass
+
+    @abstractmethod
+    async def query_item(self, query: ServiceQueryInfo,
+                         model: Type[BaseGetAPIModel] = None) -> List[BaseGetAPIModel]:
+        """Return the found items as `model`, only its fields are fetched; `response_model` by default."""
+        pass
+
+    @abstractmethod
+    async def query_page(self, query: ServiceQueryInfo,
+                         model: Type[BaseGetAPIModel] = None) -> Tuple[List[BaseGetAPIModel], Optional[str]]:
+        """Return the page after `query.page.cursor` and the cursor of the next page, if there may be one."""
         pass
 
 
@@ -53,70 +69,68 @@ class ElasticDB(BaseDB):
 
     async def get(self, item_id: str) -> Optional[BaseGetAPIModel]:
         try:
-            doc = await self.elastic.get(index=self.index, id=item_id)
+            doc = await self._request('get', self.elastic.get(index=self.index, id=item_id))
             db_logger.info('Getting item %s in %s', item_id, self.index)
             return self.response_model(**doc['_source'])
         except elastic_exceptions.NotFoundError:
             db_logger.info('Item %s not found in %s', item_id, self.index)
             return None
 
-    async def query_item(self, query: ServiceQueryInfo) -> List[BaseGetAPIModel]:
-        body = self._elastic_request_for_query(query)
-        doc = await self.elastic.search(index=self.index, body=body)
+    async def get_many(self, item_ids: List[str]) -> List[BaseGetAPIModel]:
+        doc = await self._request('mget', self.elastic.mget(index=self.index, body={'ids': item_ids}))
+        db_logger.info('Getting %d items in %s', len(item_ids), self.index)
+        return [self.response_model(**item['_source']) for item in doc['docs'] if item.get('found')]
+
+    async def query_item(self, query: ServiceQueryInfo,
+                         model: Type[BaseGetAPIModel] = None) -> List[BaseGetAPIModel]:
+        model = model or self.response_model
+        doc = await self._search(query, model)
         db_logger.info('Searching in %s', self.index)
-        return [self.response_model(**hit['_source']) for hit in doc['hits']['hits']]
+        return [model(**hit['_source']) for hit in doc['hits']['hits']]
+
+    async def query_page(self, query: ServiceQueryInfo,
+                         model: Type[BaseGetAPIModel] = None) -> Tuple[List[BaseGetAPIModel], Optional[str]]:
+        model = model or self.response_model
+        doc = await self._search(query, model)
+        db_logger.info('Searching page after %s in %s', query.page.cursor or 'start', self.index)
+        hits = doc['hits']['hits']
+        next_cursor = encode_cursor(hits[-1]['sort']) if len(hits) == query.page.size else None
+        return [model(**hit['_source']) for hit in hits], next_cursor
 
     def __init__(self, elastic: AsyncElasticsearch):
         self.elastic = elastic
 
-    def _elastic_pagination_request(self, page_info: PageInfo) -> DefaultDict[str, DefaultDict[str, dict]]:
-        body = defaultdict(lambda: defaultdict(dict))
-        body['from'] = page_info.number * page_info.size
-        body['size'] = page_info.size
-        body['query']['bool']['should'] = [{'match_all': {}}]
-        body['query']['bool']['minimum_should_match'] = 1
-        return body
-
-    def _elastic_request_add_query(self, query: str, body: DefaultDict[str, DefaultDict[str, dict]]):
-        if not query:
-            return
-        body['query']['bool']['should'] = []
-        for field, weight in self.search_fields.items():
-            match = defaultdict(lambda: defaultdict(dict))
-            match['match'][field]['query'] = query
-            match['match'][field]['fuzziness'] = 'auto'
-            match['match'][field]['boost'] = weight
-            body['query']['bool']['should'].append(match)
-
-    def _elastic_request_add_filter(self, filter_request: FilterInfo, body: DefaultDict[str, DefaultDict[str, dict]]):
-        if not filter_request:
-            return
-        body['query']['bool']['filter'] = []
-        for field in self.filter_fields:
-            uuid = filter_request.dict().get(field)
-            if uuid is None:
-                continue
-            filter_info = defaultdict(lambda: defaultdict(dict))
-            filter_info['nested']['path'] = field
-            filter_info['nested']['query']['match'] = {f'{field}.id': str(uuid)}
-            body['query']['bool']['filter'].append(filter_info)
-
-    def _elastic_request_add_sort(self, sort_request: SortInfo, body: DefaultDict[str, DefaultDict[str, dict]]):
-        if not sort_request:
-            return
-        body['sort'] = []
-        sort = defaultdict(dict)
-        elastic_sort_field = self.sort_fields.get(sort_request.field)
-        sort[elastic_sort_field]['order'] = 'desc' if sort_request.desc else 'asc'
-        body['sort'].append(sort)
-
-    def _elastic_request_for_query(self, query_info: ServiceQueryInfo) -> dict:
-        body = self._elastic_pagination_request(query_info.page)
-        if query_info.query:
-            self._elastic_request_add_query(query_info.query, body)
-        if query_info.filter:
-            self._elastic_request_add_filter(query_info.filter, body)
-        if query_info.sort:
-            self._elastic_request_add_sort(query_info.sort, body)
-
-        return body
+    async def put_search_template(self) -> None:
+        """Store the mustache template of the index searches, used with ELASTIC_SEARCH_TEMPLATES."""
+        await self.elastic.put_script(id=self.search_template_id,
+                                      body={'script': {'lang': 'mustache', 'source': self.query_builder.template}})
+        db_logger.logger.info('Search template %s is stored', self.search_template_id)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if isinstance(cls.__dict__.get('search_fields'), dict):
+            # Clauses of the index searches are prepared once, requests only fill in their parameters
+            cls.query_builder = QueryBuilder(cls.search_fields, cls.filter_fields, cls.sort_fields)
+            cls.search_template_id = f'{cls.index}_search'
+
+    async def _search(self, query_info: ServiceQueryInfo, model: Type[BaseGetAPIModel]) -> dict:
+        # Fetch only the fields the model is built from, e.g. no persons and files for film lists
+        source = list(model.__fields__) if model is not self.response_model else None
+        if config.ELASTIC_SEARCH_TEMPLATES:
+            params = self.query_builder.template_params(query_info, source)
+            operation = 'search_template'
+            request = self.elastic.search_template(index=self.index,
+                                                   body={'id': self.search_template_id, 'params': params})
+        else:
+            operation = 'search'
+            request = self.elastic.search(index=self.index, body=self.query_builder.body(query_info, source))
+        doc = await self._request(operation, request)
+        metrics.ELASTIC_TOOK.observe(doc['took'] / 1000, self.index, operation)
+        return doc
+
+    async def _request(self, operation: str, request: Awaitable[dict]) -> dict:
+        start = time.perf_counter()
+        try:
+            return await request
+        finally:
+            metrics.ELASTIC_DURATION.observe(time.perf_counter() - start, self.index, operation)
@@ -0,0 +1,109 @@
+import json
+from typing import Dict, List, Optional, Tuple
+
+from queryes.base import ServiceQueryInfo, decode_cursor
+
+
+class QueryBuilder:
+    """Search request bodies of one index, or the parameters of its stored `template`, from prepared clauses."""
+
+    def __init__(self, search_fields: Dict[str, float], filter_fields: List[str], sort_fields: Dict[str, str]):
+        self.search_fields = search_fields
+        self.filter_fields = filter_fields
+        self._match_options = [(field, {'fuzziness': 'auto', 'boost': weight})
+                               for field, weight in search_fields.items()]
+        self._filter_paths = [(field, f'{field}.id') for field in filter_fields]
+        self._sorts = {
+            (field, desc): {es_field: {'order': 'desc' if desc else 'asc'}}
+            for field, es_field in sort_fields.items() for desc in (False, True)
+        }
+        self.template = self._compile_template()
+
+    def body(self, query_info: ServiceQueryInfo, source: Optional[List[str]] = None) -> dict:
+        page = query_info.page
+        body = {'from': page.number * page.size, 'size': page.size}
+        if query_info.query:
+            should = [{'match': {field: {'query': query_info.query, **options}}}
+                      for field, options in self._match_options]
+        else:
+            should = [{'match_all': {}}]
+        body['query'] = {'bool': {'should': should, 'minimum_should_match': 1}}
+        if source is not None:
+            body['_source'] = source
+        if query_info.filter:
+            body['query']['bool']['filter'] = [
+                {'nested': {'path': field, 'query': {'match': {id_field: str(value)}}}}
+                for field, id_field, value in self._filter_values(query_info)
+            ]
+        sort = self._sort(query_info)
+        if sort is not None:
+            body['sort'] = sort
+        if page.cursor is not None:
+            # search_after: the cost of a page does not grow with its number, unlike `from`
+            del body['from']
+            if page.cursor:
+                body['search_after'] = decode_cursor(page.cursor)
+            # Hits are not counted past the page, the cursor tells whether to go on
+            body['track_total_hits'] = False
+        return body
+
+    def template_params(self, query_info: ServiceQueryInfo, source: Optional[List[str]] = None) -> dict:
+        """Parameters of the stored `template` which renders the same request as `body`."""
+        page = query_info.page
+        params = {'from': 0 if page.cursor is not None else page.number * page.size, 'size': page.size}
+        if query_info.query:
+            params['query'] = query_info.query
+        if source is not None:
+            params['has_source'], params['source'] = True, source
+        if query_info.filter:
+            params['has_filter'] = True
+            params.update((field, str(value)) for field, _, value in self._filter_values(query_info))
+        sort = self._sort(query_info)
+        if sort:
+            params['has_sort'], params['sort'] = True, sort
+        if page.cursor is not None:
+            params['cursor'] = True
+            if page.cursor:
+                params['has_search_after'], params['search_after'] = True, decode_cursor(page.cursor)
+        return params
+
+    def _sort(self, query_info: ServiceQueryInfo) -> Optional[List[dict]]:
+        sort = [self._sorts[query_info.sort.field, query_info.sort.desc]] if query_info.sort else None
+        if query_info.page.cursor is not None:
+            # The id tiebreaker makes the sort total, so the sort values of the last hit pinpoint the next page
+            if sort is None:
+                sort = [{'_score': 'desc'}] if query_info.query else []
+            sort.append({'id': 'asc'})
+        return sort
+
+    def _filter_values(self, query_info: ServiceQueryInfo) -> List[Tuple[str, str, str]]:
+        filter_values = query_info.filter.dict()
+        return [(field, id_field, filter_values[field]) for field, id_field in self._filter_paths
+                if filter_values.get(field) is not None]
+
+    def _compile_template(self) -> str:
+        """Mustache source of the search request."""
+        # List parameters are guarded by `has_*` flags: a mustache section over a list repeats for every item
+        matches = ', '.join(
+            '{"match": {%s: {"query": "{{query}}", "fuzziness": "auto", "boost": %s}}}' % (json.dumps(field), weight)
+            for field, weight in self.search_fields.items()
+        )
+        filters = ''.join(
+            '{{#%s}}{"nested": {"path": %s, "query": {"match": {%s: "{{%s}}"}}}}, {{/%s}}' % (
+                field, json.dumps(field), json.dumps(f'{field}.id'), field, field
+            )
+            for field in self.filter_fields
+        )
+        return (
+            '{"query": {"bool": {'
+            '"should": [{{#query}}%s{{/query}}{{^query}}{"match_all": {}}{{/query}}], '
+            '"minimum_should_match": 1'
+            # The last filter clause takes the comma of the ones before it and matches any document
+            '{{#has_filter}}, "filter": [%s{"match_all": {}}]{{/has_filter}}'
+            '}}, '
+            '{{#has_source}}"_source": {{#toJson}}source{{/toJson}}, {{/has_source}}'
+            '{{#has_sort}}"sort": {{#toJson}}sort{{/toJson}}, {{/has_sort}}'
+            '{{#has_search_after}}"search_after": {{#toJson}}search_after{{/toJson}}, {{/has_search_after}}'
+            '{{#cursor}}"track_total_hits": false, {{/cursor}}'
+            '"from": {{from}}, "size": {{size}}}'
+        ) % (matches, filters)
@@ -1,9 +1,193 @@
-from typing import Optional
+import asyncio
+import logging
+from typing import List, Optional, Set, Tuple
+
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.asyncio.connection import Connection
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError, RedisError, ResponseError, TimeoutError
+
+from core import config
+from db.cache import LocalCache
+
+module_logger = logging.getLogger('Redis')
+
+
+class AutoPipelineRedis(Redis):
+    """Sends the commands issued within one iteration of the event loop in one pipeline; no blocking commands."""
+
+    def __init__(self, *args, max_batch: int = config.REDIS_PIPELINE_MAX_SIZE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_batch = max_batch
+        self._batch: List[Tuple[tuple, dict, asyncio.Future]] = []
+        self._flushes: Set[asyncio.Task] = set()
+
+    async def execute_command(self, *args, **options):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._batch.append((args, options, future))
+        if len(self._batch) == 1:
+            loop.call_soon(self._flush)
+        elif len(self._batch) >= self.max_batch:
+            self._flush()
+        return await future
+
+    def _flush(self):
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._send(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _send(self, batch: List[Tuple[tuple, dict, asyncio.Future]]):
+        try:
+            pipeline = self.pipeline(transaction=False)
+            for args, options, _ in batch:
+                pipeline.execute_command(*args, **options)
+            replies = await pipeline.execute(raise_on_error=False)
+        except Exception as error:
+            replies = [error] * len(batch)
+        except asyncio.CancelledError:
+            for _, _, future in batch:
+                future.cancel()
+            raise
+
+        for (_, _, future), reply in zip(batch, replies):
+            # The caller may have been cancelled meanwhile
+            if future.done():
+                continue
+            if isinstance(reply, Exception):
+                future.set_exception(reply)
+            else:
+                future.set_result(reply)
+
+
+def create_redis(host: str, port: int, max_connections: int = config.REDIS_POOL_SIZE,
+                 socket_timeout: Optional[float] = config.REDIS_SOCKET_TIMEOUT,
+                 auto_pipeline: bool = False) -> Redis:
+    """Client over a pool of at most `max_connections` connections, made as they are needed."""
+    pool = BlockingConnectionPool(host=host, port=port, max_connections=max_connections,
+                                  timeout=config.REDIS_POOL_TIMEOUT,
+                                  socket_timeout=socket_timeout,
+                                  socket_connect_timeout=config.REDIS_CONNECT_TIMEOUT,
+                                  socket_keepalive=True,
+                                  health_check_interval=config.REDIS_HEALTH_CHECK_INTERVAL,
+                                  retry=Retry(ExponentialBackoff(cap=1, base=0.01), config.REDIS_RETRIES),
+                                  retry_on_error=[ConnectionError, TimeoutError])
+    client_class = AutoPipelineRedis if auto_pipeline else Redis
+    return client_class(connection_pool=pool)
+
+
+async def close_redis(client: Redis):
+    await client.close()
+    await client.connection_pool.disconnect()
+
+
+class ClientTracking:
+    """Evicts the keys under `prefixes` that Redis announces as written or expired from the local caches."""
+
+    CHANNEL = '__redis__:invalidate'
+
+    def __init__(self, host: str, port: int, prefixes: List[str], local_caches: List[LocalCache]):
+        self.host = host
+        self.port = port
+        self.prefixes = prefixes
+        self.local_caches = local_caches
+        self._tracking: Optional[Connection] = None
+        self._subscriber: Optional[Connection] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> bool:
+        """Enable tracking, return False if Redis does not support it."""
+        try:
+            await self._connect()
+        except ResponseError as error:
+            module_logger.warning('Client-side caching is not available: %r', error)
+            await self._disconnect()
+            return False
+        for local_cache in self.local_caches:
+            local_cache.tracked = True
+        self._task = asyncio.ensure_future(self._listen())
+        return True
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        for local_cache in self.local_caches:
+            local_cache.tracked = False
+        self._clear()
+        await self._disconnect()
+
+    async def _connect(self):
+        self._subscriber = Connection(host=self.host, port=self.port, socket_keepalive=True,
+                                      socket_connect_timeout=config.REDIS_CONNECT_TIMEOUT)
+        await self._subscriber.connect()
+        await self._subscriber.send_command('CLIENT', 'ID')
+        subscriber_id = await self._subscriber.read_response()
+        await self._subscriber.send_command('SUBSCRIBE', self.CHANNEL)
+        await self._subscriber.read_response()
+
+        self._tracking = Connection(host=self.host, port=self.port, socket_keepalive=True,
+                                    socket_connect_timeout=config.REDIS_CONNECT_TIMEOUT)
+        await self._tracking.connect()
+        prefixes = [arg for prefix in self.prefixes for arg in ('PREFIX', prefix)]
+        await self._tracking.send_command('CLIENT', 'TRACKING', 'ON', 'REDIRECT', subscriber_id, 'BCAST', *prefixes)
+        await self._tracking.read_response()
+
+    async def _disconnect(self):
+        for connection in (self._subscriber, self._tracking):
+            if connection is not None:
+                await connection.disconnect()
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._subscriber.read_response()
+            except (RedisError, OSError) as error:
+                module_logger.warning('Lost the client-side caching connection: %r', error)
+                self._clear()
+                await self._reconnect()
+                continue
+            if message[0] != b'message':
+                continue
+            # No keys when the whole database is flushed
+            if message[2] is None:
+                self._clear()
+                continue
+            for key in message[2]:
+                key = key.decode()
+                for local_cache in self.local_caches:
+                    local_cache.invalidate(key)
+
+    async def _reconnect(self):
+        while True:
+            await self._disconnect()
+            try:
+                await self._connect()
+                return
+            except (RedisError, OSError) as error:
+                module_logger.warning('Failed to enable client-side caching again: %r', error)
+                await asyncio.sleep(1)
+
+    def _clear(self):
+        for local_cache in self.local_caches:
+            local_cache.clear()
 
-from aioredis import Redis
 
 redis: Optional[Redis] = None
+# Client-side caching of the `redis` keys, with REDIS_CLIENT_TRACKING
+tracking: Optional[ClientTracking] = None
 
 
 async def get_redis() -> Redis:
     return redis
+
+
+# Redis of the auth service with the blocklist of revoked tokens, connected with AUTH_LOCAL_VERIFICATION
+auth_redis: Optional[Redis] = None
+
+
+async def get_auth_redis() -> Optional[Redis]:
+    return auth_redis
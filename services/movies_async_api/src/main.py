@@ -1,38 +1,78 @@
 import logging
 
-import aioredis
 import uvicorn as uvicorn
 from elasticsearch import AsyncElasticsearch
 from fastapi import FastAPI
 from fastapi.responses import ORJSONResponse
 
+from api import metrics
+from api.utils.http_client import http_pool
 from api.v1 import film, genre, person
 from core import config
 from core.logger import LOGGING
 from db import elastic, redis
+from services import invalidation
+from services.film import ElasticFilmDB, FilmService, film_local_cache, get_film_cache
+from services.genre import ElasticGenreDB, GenreService, genre_local_cache, get_genre_cache
+from services.person import ElasticPersonDB, PersonService, get_person_cache, person_local_cache
 
 app = FastAPI(title=config.PROJECT_NAME,
               description='Info about movies, genres and corresponding persons (e.g. actors, directors and writers)',
               docs_url='/api/openapi',
               openapi_url='/api/openapi.json',
               default_response_class=ORJSONResponse)
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 @app.on_event('startup')
 async def startup():
-    redis.redis = await aioredis.create_redis_pool((config.REDIS_HOST, config.REDIS_PORT), minsize=10, maxsize=20)
+    if config.AUTH_LOCAL_VERIFICATION and not config.AUTH_JWT_KEY:
+        # Otherwise every authenticated request would fail on decoding the token
+        raise RuntimeError('AUTH_LOCAL_VERIFICATION needs the key tokens are signed with: '
+                           'set AUTH_JWT_KEY or FLASK_SECRET_KEY')
+    redis.redis = redis.create_redis(config.REDIS_HOST, config.REDIS_PORT, auto_pipeline=config.REDIS_AUTO_PIPELINE)
+    if config.REDIS_CLIENT_TRACKING:
+        tracking = redis.ClientTracking(config.REDIS_HOST, config.REDIS_PORT,
+                                        ['{name}:'.format(name=cls.__name__)
+                                         for cls in (FilmService, GenreService, PersonService)],
+                                        [film_local_cache, genre_local_cache, person_local_cache])
+        if await tracking.start():
+            redis.tracking = tracking
     elastic.es = AsyncElasticsearch(hosts=['{host}:{port}'.format(host=config.ELASTIC_HOST, port=config.ELASTIC_PORT)])
+    http_pool.start()
+    if config.ELASTIC_SEARCH_TEMPLATES:
+        for db_class in (ElasticFilmDB, ElasticGenreDB, ElasticPersonDB):
+            await db_class(elastic.es).put_search_template()
+    if config.AUTH_LOCAL_VERIFICATION:
+        redis.auth_redis = redis.create_redis(config.AUTH_REDIS_HOST, config.AUTH_REDIS_PORT, max_connections=10)
+    if config.CACHE_INVALIDATION:
+        # Reading the stream blocks a connection of its own, so it is neither pipelined nor timed out
+        stream_redis = redis.create_redis(config.REDIS_HOST, config.REDIS_PORT, max_connections=1, socket_timeout=None)
+        invalidation.listener = invalidation.CacheInvalidationListener(stream_redis, {
+            ElasticFilmDB.index: FilmService(get_film_cache(redis.redis), ElasticFilmDB(elastic.es)),
+            ElasticGenreDB.index: GenreService(get_genre_cache(redis.redis), ElasticGenreDB(elastic.es)),
+            ElasticPersonDB.index: PersonService(get_person_cache(redis.redis), ElasticPersonDB(elastic.es)),
+        })
+        await invalidation.listener.start()
 
 
 @app.on_event('shutdown')
 async def shutdown():
-    await redis.redis.close()
+    if invalidation.listener is not None:
+        await invalidation.listener.close()
+    if redis.tracking is not None:
+        await redis.tracking.close()
+    if redis.auth_redis is not None:
+        await redis.close_redis(redis.auth_redis)
+    await http_pool.close()
+    await redis.close_redis(redis.redis)
     await elastic.es.close()
 
 
 app.include_router(film.router, prefix='/api/v1/film', tags=['film'])
 app.include_router(genre.router, prefix='/api/v1/genre', tags=['genre'])
 app.include_router(person.router, prefix='/api/v1/person', tags=['person'])
+app.include_router(metrics.router, prefix='/metrics')
 
 
 if __name__ == '__main__':
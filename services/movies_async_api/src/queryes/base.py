@@ -1,14 +1,42 @@
-from typing import Optional
+import base64
+from http import HTTPStatus
+from typing import List, Optional
 from uuid import UUID
 
-from pydantic import BaseModel, Field
+import orjson
+from fastapi import HTTPException
+from pydantic import BaseModel, Field, validator
 
 from core import config
 
 
+def encode_cursor(sort_values: list) -> str:
+    """Opaque page cursor: the sort values of the last item of the previous page."""
+    return base64.urlsafe_b64encode(orjson.dumps(sort_values)).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, size: Optional[int] = None) -> list:
+    """Return the sort values of `cursor`, raise ValueError if it is not a cursor of a sort of `size` values."""
+    sort_values = orjson.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    if not isinstance(sort_values, list):
+        raise ValueError('Cursor is not a list of sort values')
+    if any(isinstance(value, bool) or not isinstance(value, (str, int, float, type(None))) for value in sort_values):
+        raise ValueError('Cursor sort values are not scalars')
+    if size is not None and (len(sort_values) != size or not isinstance(sort_values[-1], str)):
+        raise ValueError('Cursor does not match the sort')
+    return sort_values
+
+
+def cursor_size(sort: Optional[str], query: Optional[str]) -> int:
+    """Number of sort values of a cursor page: the sort field or the score of a query, then the id tiebreaker."""
+    return 2 if sort or (query and query.strip()) else 1
+
+
 class PageInfo(BaseModel):
     number: int = 0
     size: int = config.PAGE_SIZE
+    # Pages follow one another with search_after instead of an offset, an empty cursor is the first page
+    cursor: Optional[str] = None
 
 
 class FilterInfo(BaseModel):
@@ -28,22 +56,44 @@ class ServiceQueryInfo(BaseModel):
     sort: Optional[SortInfo] = None
     query: Optional[str] = None
 
+    @validator('query')
+    def normalize_query(cls, query: Optional[str]) -> Optional[str]:
+        """Queries which differ in case and whitespace only share their results, lowercased as by the ES analyzer."""
+        if query is None:
+            return None
+        return ' '.join(query.split()).lower() or None
+
     def as_key(self):
         """
         Key for caching
-        like: 1-50:039ab4ce-1497-45d7-9a6d-f153d82fb70a-None:imdb_rating-1:star
-          or  10-20:None:imdb_rating-0:None
+        like: 1-50:genre-039ab4ce-1497-45d7-9a6d-f153d82fb70a:imdb_rating-1:star
+          or  10-20:films-8e9fc0c4-91c2-4d4e-b3b0-b6fa2dbc64f1,genre-039ab4ce-1497-45d7-9a6d-f153d82fb70a:title-0:None
+          or  after-WzkuNSwiMDM5YWIiXQ-20:None:imdb_rating-1:None
+        Filters are listed by name and only when set, so equivalent queries get the same key.
         """
-        page_key = '{page_num}-{page_size}'.format(page_num=self.page.number, page_size=self.page.size)
-        filter_key = '{genre}-{person}'.format(genre=self.filter.genre,
-                                               person=self.filter.person) if self.filter else None
+        if self.page.cursor is None:
+            page_key = '{page_num}-{page_size}'.format(page_num=self.page.number, page_size=self.page.size)
+        else:
+            page_key = 'after-{cursor}-{page_size}'.format(cursor=self.page.cursor, page_size=self.page.size)
+        filter_key = ','.join(
+            '{field}-{value}'.format(field=field, value=value)
+            for field, value in sorted(self.filter.dict(exclude_none=True).items())
+        ) if self.filter else None
         sort_key = '{field}-{desc}'.format(field=self.sort.field,
                                            desc=int(self.sort.desc)) if self.sort else None
         query_key = self.query
 
-        key = f'{page_key}:{filter_key}:{sort_key}:{query_key}'
+        key = f'{page_key}:{filter_key or None}:{sort_key}:{query_key}'
         return key
 
+    def block(self, number: int, size: int) -> 'ServiceQueryInfo':
+        """The same query for the `number`-th block of `size` hits."""
+        return self.copy(update={'page': PageInfo(number=number, size=size)})
+
+
+class BatchInfo(BaseModel):
+    ids: List[UUID] = Field(..., min_items=1, max_items=config.BATCH_MAX_SIZE)
+
 
 class QueryParamsBase:
     def __init__(self,
@@ -53,10 +103,17 @@ class QueryParamsBase:
                  filter_genre: UUID = None,
                  filter_person: UUID = None,
                  filter_film: UUID = None,
-                 query: str = None):
+                 query: str = None,
+                 page_cursor: str = None):
         self.query = query
+        if page_cursor:
+            try:
+                decode_cursor(page_cursor, cursor_size(sort, query))
+            except ValueError:
+                raise HTTPException(status_code=HTTPStatus.UNPROCESSABLE_ENTITY, detail='invalid page cursor')
         self.page = {'number': page_number,
-                     'size': page_size}
+                     'size': page_size,
+                     'cursor': page_cursor}
 
         self.filter = None
         if filter_film or filter_genre or filter_person:
@@ -9,10 +9,13 @@ class GenreQueryParamsInfo(QueryParamsBase):
                  page_number: int = Query(0, ge=0, alias='page[number]', description='Page number'),
                  page_size: int = Query(config.PAGE_SIZE, gt=0, alias='page[size]',
                                         description='Number of items per page'),
+                 page_cursor: str = Query(None, alias='page[cursor]',
+                                          description='Cursor of the next page from the X-Next-Cursor header '
+                                                      'of the previous one, empty for the first page'),
                  sort: str = Query(None, regex='^-?(name)$',
                                    description='Field to sort by name'),
                  ):
-        super().__init__(page_number=page_number, page_size=page_size, sort=sort)
+        super().__init__(page_number=page_number, page_size=page_size, sort=sort, page_cursor=page_cursor)
 
 
 class GenreQueryParamsSearch(QueryParamsBase):
@@ -20,8 +23,11 @@ class GenreQueryParamsSearch(QueryParamsBase):
                  page_number: int = Query(0, ge=0, alias='page[number]', description='Page number'),
                  page_size: int = Query(config.PAGE_SIZE, gt=0, alias='page[size]',
                                         description='Number of items per page'),
+                 page_cursor: str = Query(None, alias='page[cursor]',
+                                          description='Cursor of the next page from the X-Next-Cursor header '
+                                                      'of the previous one, empty for the first page'),
                  sort: str = Query(None, regex='^-?(name)$',
                                    description='Field to sort results by name. Default - by relevance'),
                  query: str = Query(None, min_length=1, max_length=256,
                                     description='Search query (title and description fields will be inspected)')):
-        super().__init__(page_number=page_number, page_size=page_size, sort=sort, query=query)
+        super().__init__(page_number=page_number, page_size=page_size, sort=sort, query=query, page_cursor=page_cursor)
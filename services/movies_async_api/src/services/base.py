@@ -1,26 +1,43 @@
+import asyncio
 import logging
+import time
 from abc import ABC
-from typing import List, Optional, Union
+from functools import partial
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, Type, Union
 
 import backoff
+import orjson
+from redis.asyncio import Redis
 from elasticsearch import exceptions as elastic_exceptions
+from fastapi import Depends
 
-from core import config
-from db.cache import BaseCache
+from core import config, metrics
+from core.logger import SampledLogger
+from db.cache import BaseCache, RedisLock
 from db.db import BaseDB
+from db.redis import get_redis
+from models.base import BaseGetAPIModel
 from models.film import Film
 from models.genre import Genre
 from models.person import Person
 from queryes.base import ServiceQueryInfo
+from services.single_flight import SingleFlight
 
-module_logger = logging.getLogger('Service')
+module_logger = SampledLogger(logging.getLogger('Service'), config.LOG_SAMPLE_RATE)
 
 
 class BaseService(ABC):
+    # Shared by the services of a worker process: cache keys are prefixed with the service name
+    single_flight = SingleFlight()
+    # Background refreshes are referenced until they are done, the event loop keeps weak references only
+    _refresh_tasks: Set[asyncio.Task] = set()
+    # Version of the List and Search entries of every service, replaced when the ETL changes any of its documents
+    query_versions: Dict[str, str] = {}
 
-    def __init__(self, cache: BaseCache, db: BaseDB):
+    def __init__(self, cache: BaseCache, db: BaseDB, lock: Optional[RedisLock] = None):
         self.cache = cache
         self.db = db
+        self.lock = lock
 
     def _prefixed_key(self, key, prefix=None):
         prefix = prefix or self.__class__.__name__
@@ -37,48 +54,236 @@ class BaseService(ABC):
         complete_key = self._prefixed_key(complete_key)  # e.g.  FilmService:List:1-30:039ab...
         return complete_key
 
+    def _query_key(self, query_info: ServiceQueryInfo) -> str:
+        version = self.query_versions.get(self.__class__.__name__)
+        key = query_info.as_key()
+        return 'v{version}:{key}'.format(version=version, key=key) if version else key
+
+    async def evict(self, item_ids: List[str], version: Optional[str] = None):
+        """Evict the cached details of the changed items and switch the List and Search entries to `version`."""
+        if version is not None:
+            self.query_versions[self.__class__.__name__] = version
+        if not item_ids:
+            return
+        details_prefix = self._prefixed_key(self.cache.response_model.__name__, 'Details')
+        keys = [self._complete_prefixed_key(item_id, prefix) for item_id in item_ids
+                for prefix in ('Details', details_prefix)]
+        # Not a per-request record, it is never sampled out
+        module_logger.logger.info('Evicting %d items from cache', len(item_ids))
+        await self.cache.delete(keys)
+
+    async def get_by_id(self, item_id: str) -> Optional[Union[Film, Genre, Person]]:
+        return await self._get(item_id, 'Details', partial(self._get_from_db, item_id))
+
+    async def get_by_query(self, query_info: ServiceQueryInfo) -> Optional[List[Union[Film, Genre, Person]]]:
+        key_prefix = 'Search' if query_info.query else 'List'
+        return await self._get(self._query_key(query_info), key_prefix, partial(self._query_item_from_db, query_info))
+
+    async def get_response_by_id(self, item_id: str, response_model: Type[BaseGetAPIModel]) -> Optional[bytes]:
+        """Return the JSON response body of the item rendered with `response_model`, cached as is."""
+        key_prefix = self._prefixed_key(response_model.__name__, 'Details')
+        return await self._get(item_id, key_prefix,
+                               partial(self._render_response, partial(self._get_from_db, item_id), response_model))
+
+    async def get_response_by_query(self, query_info: ServiceQueryInfo,
+                                    response_model: Type[BaseGetAPIModel]) -> Optional[bytes]:
+        """Return the JSON response body of the items of the page rendered with `response_model`."""
+        key_prefix = self._prefixed_key(response_model.__name__, 'Search' if query_info.query else 'List')
+        block_size = config.QUERY_BLOCK_SIZE
+        if not block_size:
+            return await self._get(self._query_key(query_info), key_prefix,
+                                   partial(self._render_response,
+                                           partial(self._query_item_from_db, query_info, response_model),
+                                           response_model))
+
+        start = query_info.page.number * query_info.page.size
+        end = start + query_info.page.size
+        first_block = start // block_size
+        lines = []
+        for number in range(first_block, (end - 1) // block_size + 1):
+            block_info = query_info.block(number, block_size)
+            block = await self._get(self._query_key(block_info), self._prefixed_key(key_prefix, 'Block'),
+                                    partial(self._render_block,
+                                            partial(self._query_item_from_db, block_info, response_model),
+                                            response_model))
+            if not block:
+                break
+            block_lines = block.split(b'\n')
+            lines.extend(block_lines)
+            if len(block_lines) < block_size:
+                break
+
+        offset = first_block * block_size
+        items = lines[start - offset:end - offset]
+        return b'[' + b','.join(items) + b']' if items else None
+
+    async def get_page_response_by_query(self, query_info: ServiceQueryInfo, response_model: Type[BaseGetAPIModel]
+                                         ) -> Optional[Tuple[bytes, Optional[str]]]:
+        """Return the JSON response body of the page after `query_info.page.cursor` and the next page cursor."""
+        key_prefix = self._prefixed_key(response_model.__name__, 'Search' if query_info.query else 'List')
+        page = await self._get(self._query_key(query_info), key_prefix,
+                               partial(self._render_page,
+                                       partial(self._query_page_from_db, query_info, response_model), response_model))
+        if not page:
+            return None
+        next_cursor, _, body = page.partition(b'\n')
+        return body, orjson.loads(next_cursor)
+
     @backoff.on_exception(backoff.expo,
                           (elastic_exceptions.ConnectionError,),
                           max_time=config.TIME_LIMIT)
-    async def get_by_id(self, item_id: str) -> Optional[Union[Film, Genre, Person]]:
-        key_prefix = 'Details'
-        item = await self._item_from_cache(item_id, key_prefix)
-        if not item:
-            item = await self._get_from_db(item_id)
-            if not item:
-                return None
-            await self._put_item_to_cache(item, item.id, key_prefix)
+    async def get_response_by_ids(self, item_ids: List[str], response_model: Type[BaseGetAPIModel]) -> bytes:
+        """Return the JSON array of the found items rendered with `response_model`, in the order of `item_ids`."""
+        item_ids = list(dict.fromkeys(item_ids))
+        key_prefix = self._prefixed_key(response_model.__name__, 'Details')
+        cache_keys = [self._complete_prefixed_key(item_id, key_prefix) for item_id in item_ids]
+        module_logger.info('Looking for %d items in cache', len(item_ids))
 
-        return item
+        bodies, missing = {}, []
+        for item_id, entry in zip(item_ids, await self.cache.get_entries(cache_keys)):
+            metrics.CACHE_LOOKUPS.inc(self.__class__.__name__, key_prefix, 'miss' if entry is None else 'hit')
+            if entry is None:
+                missing.append(item_id)
+                continue
+            bodies[item_id] = entry.item
+            if entry.should_refresh():
+                self._refresh_in_background(item_id, key_prefix, partial(
+                    self._render_response, partial(self._get_from_db, item_id), response_model
+                ))
+
+        if missing:
+            start = time.monotonic()
+            loaded = {item.id: self._render(item, response_model) for item in await self.db.get_many(missing)}
+            if loaded:
+                module_logger.info('Putting %d items to cache', len(loaded))
+                await self.cache.set_many({
+                    self._complete_prefixed_key(item_id, key_prefix): body for item_id, body in loaded.items()
+                }, delta=time.monotonic() - start)
+            bodies.update(loaded)
+
+        return b'[' + b','.join(bodies[item_id] for item_id in item_ids if item_id in bodies) + b']'
 
     @backoff.on_exception(backoff.expo,
                           (elastic_exceptions.ConnectionError,),
                           max_time=config.TIME_LIMIT)
-    async def get_by_query(self, query_info: ServiceQueryInfo) -> Optional[List[Union[Film, Genre, Person]]]:
-        key_prefix = 'Search' if query_info.query else 'List'
-        items = await self._item_from_cache(query_info.as_key(), key_prefix)
-        if not items:
-            items = await self._query_item_from_db(query_info)
-            if not items:
-                return None
-            await self._put_item_to_cache(items, query_info.as_key(), key_prefix)
+    async def _get(self, key: str, prefix: str, load: Callable[[], Awaitable]):
+        item = await self._item_from_cache(key, prefix, refresh=load)
+        metrics.CACHE_LOOKUPS.inc(self.__class__.__name__, prefix, 'hit' if item else 'miss')
+        if not item:
+            item = await self._load_once(key, prefix, load)
+
+        return item
+
+    @classmethod
+    async def _render_response(cls, load: Callable[[], Awaitable],
+                               response_model: Type[BaseGetAPIModel]) -> Optional[bytes]:
+        item = await load()
+        return cls._render(item, response_model) if item else None
+
+    @classmethod
+    async def _render_page(cls, load: Callable[[], Awaitable],
+                           response_model: Type[BaseGetAPIModel]) -> Optional[bytes]:
+        items, next_cursor = await load()
+        return b'\n'.join((orjson.dumps(next_cursor), cls._render(items, response_model))) if items else None
+
+    @classmethod
+    async def _render_block(cls, load: Callable[[], Awaitable],
+                            response_model: Type[BaseGetAPIModel]) -> Optional[bytes]:
+        """Render the items one per line, a page is a slice of the lines."""
+        items = await load()
+        return b'\n'.join(cls._render(item, response_model) for item in items) if items else None
+
+    @staticmethod
+    def _render(item: Union[BaseGetAPIModel, List[BaseGetAPIModel]], response_model: Type[BaseGetAPIModel]) -> bytes:
+        """Serialize items the way FastAPI does for `response_model`: by alias, other fields left out."""
+        start = time.perf_counter()
+        fields = response_model.__fields__.keys()
+        if isinstance(item, list):
+            body = orjson.dumps([sub_item.dict(include=fields, by_alias=True) for sub_item in item])
+        else:
+            body = orjson.dumps(item.dict(include=fields, by_alias=True))
+        metrics.SERIALIZATION_DURATION.observe(time.perf_counter() - start, 'render')
+        return body
+
+    async def _load_once(self, key: str, prefix: str, load: Callable[[], Awaitable], refresh: bool = False):
+        """Load a missing or stale item and put it to cache once for all concurrent requests of the key."""
+        if self.lock is None:
+            load_to_cache = partial(self._load_to_cache, key, prefix, load)
+        else:
+            load_to_cache = partial(self._load_to_cache_locked, key, prefix, load, refresh)
+        return await self.single_flight.do(self._complete_prefixed_key(key, prefix), load_to_cache)
 
-        return items
+    def _refresh_in_background(self, key: str, prefix: str, load: Callable[[], Awaitable]):
+        if self._complete_prefixed_key(key, prefix) in self.single_flight:
+            return
+        task = asyncio.ensure_future(self._load_once(key, prefix, load, refresh=True))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_done)
 
-    async def _query_item_from_db(self, query_info: ServiceQueryInfo) -> List[Union[Film, Genre, Person]]:
-        return await self.db.query_item(query=query_info)
+    def _refresh_done(self, task: asyncio.Task):
+        self._refresh_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            module_logger.warning('Failed to refresh cached item: %r', task.exception())
+
+    async def _load_to_cache(self, key: str, prefix: str, load: Callable[[], Awaitable]):
+        start = time.monotonic()
+        item = await load()
+        if item:
+            await self._put_item_to_cache(item, key, prefix, delta=time.monotonic() - start)
+        return item or None
+
+    async def _load_to_cache_locked(self, key: str, prefix: str, load: Callable[[], Awaitable],
+                                    refresh: bool = False):
+        cache_key = self._complete_prefixed_key(key, prefix)
+        token = await self.lock.acquire(cache_key)
+        if token is None:
+            module_logger.info('Waiting for another worker to put item to cache (key %s)', cache_key)
+            deadline = time.monotonic() + self.lock.timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(config.CACHE_LOCK_POLL_INTERVAL)
+                item = await self._item_from_cache(key, prefix)
+                if item:
+                    return item
+            module_logger.warning('Lock of key %s has expired, loading item without it', cache_key)
+            return await self._load_to_cache(key, prefix, load)
+
+        try:
+            # The previous holder may have put the item between the cache miss and the lock
+            item = None if refresh else await self._item_from_cache(key, prefix)
+            return item or await self._load_to_cache(key, prefix, load)
+        finally:
+            await self.lock.release(cache_key, token)
+
+    async def _query_item_from_db(self, query_info: ServiceQueryInfo,
+                                  model: Type[BaseGetAPIModel] = None) -> List[Union[Film, Genre, Person]]:
+        return await self.db.query_item(query=query_info, model=model)
+
+    async def _query_page_from_db(self, query_info: ServiceQueryInfo, model: Type[BaseGetAPIModel] = None
+                                  ) -> Tuple[List[Union[Film, Genre, Person]], Optional[str]]:
+        return await self.db.query_page(query=query_info, model=model)
 
     async def _get_from_db(self, item_id: str) -> Optional[Union[Film, Genre, Person]]:
         return await self.db.get(item_id)
 
-    async def _item_from_cache(self, key: str, prefix: str = None) -> Optional[Union[Union[Film, Genre, Person],
-                                                                                     List[Union[Film, Genre, Person]]]]:
+    async def _item_from_cache(self, key: str, prefix: str = None, refresh: Callable[[], Awaitable] = None
+                               ) -> Optional[Union[Union[Film, Genre, Person], List[Union[Film, Genre, Person]]]]:
+        """Return the cached item, a stale one is returned too while `refresh` loads it again in background."""
         cache_key = self._complete_prefixed_key(key, prefix)
         module_logger.info('Looking for item in cache (key %s)', cache_key)
-        return await self.cache.get(cache_key)
+        entry = await self.cache.get_entry(cache_key)
+        if entry is None:
+            return None
+        if refresh is not None and entry.should_refresh():
+            module_logger.info('Refreshing item in background (key %s)', cache_key)
+            self._refresh_in_background(key, prefix, refresh)
+        return entry.item
 
     async def _put_item_to_cache(self, item: Union[Union[Film, Genre, Person], List[Union[Film, Genre, Person]]],
-                                 key: str, prefix: str = None):
+                                 key: str, prefix: str = None, delta: float = 0.0):
         cache_key = self._complete_prefixed_key(key, prefix)
         module_logger.info('Putting item to cache for key %s)', cache_key)
-        await self.cache.set(item, cache_key)
+        await self.cache.set(item, cache_key, delta)
+
+
+async def get_cache_lock(redis: Redis = Depends(get_redis)) -> Optional[RedisLock]:
+    return RedisLock(redis) if config.CACHE_LOCK else None
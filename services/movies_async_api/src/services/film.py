@@ -1,15 +1,16 @@
 from functools import lru_cache
+from typing import Optional
 
-from aioredis import Redis
+from redis.asyncio import Redis
 from elasticsearch import AsyncElasticsearch
 from fastapi import Depends
 
-from db.cache import BaseCache, RedisCache
+from db.cache import BaseCache, LocalCache, RedisCache, RedisLock, TwoLevelCache
 from db.db import BaseDB, ElasticDB
 from db.elastic import get_elastic
 from db.redis import get_redis
 from models.film import Film
-from services.base import BaseService
+from services.base import BaseService, get_cache_lock
 
 
 class FilmService(BaseService):
@@ -32,11 +33,15 @@ class RedisFilmCache(RedisCache):
     response_model = Film
 
 
+film_local_cache = LocalCache()
+
+
 def get_film_cache(redis: Redis = Depends(get_redis)) -> BaseCache:
-    return RedisFilmCache(redis)
+    return TwoLevelCache(film_local_cache, RedisFilmCache(redis))
 
 
 @lru_cache()
 def get_film_service(cache: BaseCache = Depends(get_film_cache),
-                     db: BaseDB = Depends(get_film_db)) -> FilmService:
-    return FilmService(cache, db)
+                     db: BaseDB = Depends(get_film_db),
+                     lock: Optional[RedisLock] = Depends(get_cache_lock)) -> FilmService:
+    return FilmService(cache, db, lock)
@@ -1,15 +1,16 @@
 from functools import lru_cache
+from typing import Optional
 
-from aioredis import Redis
+from redis.asyncio import Redis
 from elasticsearch import AsyncElasticsearch
 from fastapi import Depends
 
-from db.cache import BaseCache, RedisCache
+from db.cache import BaseCache, LocalCache, RedisCache, RedisLock, TwoLevelCache
 from db.db import BaseDB, ElasticDB
 from db.elastic import get_elastic
 from db.redis import get_redis
 from models.genre import Genre
-from services.base import BaseService
+from services.base import BaseService, get_cache_lock
 
 
 class GenreService(BaseService):
@@ -32,11 +33,15 @@ class RedisGenreCache(RedisCache):
     response_model = Genre
 
 
+genre_local_cache = LocalCache()
+
+
 def get_genre_cache(redis: Redis = Depends(get_redis)) -> BaseCache:
-    return RedisGenreCache(redis)
+    return TwoLevelCache(genre_local_cache, RedisGenreCache(redis))
 
 
 @lru_cache()
 def get_genre_service(cache: BaseCache = Depends(get_genre_cache),
-                      db: BaseDB = Depends(get_genre_db)) -> GenreService:
-    return GenreService(cache, db)
+                      db: BaseDB = Depends(get_genre_db),
+                      lock: Optional[RedisLock] = Depends(get_cache_lock)) -> GenreService:
+    return GenreService(cache, db, lock)
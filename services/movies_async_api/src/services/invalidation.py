@@ -0,0 +1,65 @@
+import asyncio
+import logging
+from typing import Dict, Optional
+
+import orjson
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from core import config
+from db.redis import close_redis
+from services.base import BaseService
+
+module_logger = logging.getLogger('CacheInvalidation')
+
+# Milliseconds a read waits for new entries, the connection is checked at least that often
+READ_TIMEOUT = 5000
+
+
+class CacheInvalidationListener:
+    """Evicts the cached items of the documents the ETL indexes, announced on `CACHE_INVALIDATION_STREAM`."""
+
+    def __init__(self, redis: Redis, services: Dict[str, BaseService], stream: str = config.CACHE_INVALIDATION_STREAM):
+        self.redis = redis
+        self.services = services
+        self.stream = stream
+        self._last_id = '0-0'
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Take the current List and Search versions of the indexes and start reading the stream after them."""
+        latest = await self.redis.xrevrange(self.stream, count=1)
+        if latest:
+            self._last_id = latest[0][0]
+        for index, version in (await self.redis.hgetall(f'{self.stream}:versions')).items():
+            service = self.services.get(index.decode())
+            if service is not None:
+                service.query_versions[service.__class__.__name__] = version.decode()
+        self._task = asyncio.ensure_future(self._listen())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        await close_redis(self.redis)
+
+    async def _listen(self):
+        while True:
+            try:
+                for _, entries in await self.redis.xread({self.stream: self._last_id}, block=READ_TIMEOUT):
+                    for entry_id, fields in entries:
+                        await self._evict(entry_id.decode(), fields)
+                        self._last_id = entry_id
+            except (RedisError, OSError) as error:
+                module_logger.warning('Failed to read cache invalidation stream: %r', error)
+                await asyncio.sleep(1)
+
+    async def _evict(self, entry_id: str, fields: Dict[bytes, bytes]):
+        service = self.services.get(fields[b'index'].decode())
+        if service is None:
+            return
+        # Entries of former ETL versions have no flag and bump the version
+        bump = fields.get(b'bump', b'1') != b'0'
+        await service.evict(orjson.loads(fields[b'ids']), version=entry_id if bump else None)
+
+
+listener: Optional[CacheInvalidationListener] = None
@@ -1,15 +1,16 @@
 from functools import lru_cache
+from typing import Optional
 
-from aioredis import Redis
+from redis.asyncio import Redis
 from elasticsearch import AsyncElasticsearch
 from fastapi import Depends
 
-from db.cache import BaseCache, RedisCache
+from db.cache import BaseCache, LocalCache, RedisCache, RedisLock, TwoLevelCache
 from db.db import BaseDB, ElasticDB
 from db.elastic import get_elastic
 from db.redis import get_redis
 from models.person import Person
-from services.base import BaseService
+from services.base import BaseService, get_cache_lock
 
 
 class PersonService(BaseService):
@@ -32,11 +33,15 @@ class RedisPersonCache(RedisCache):
     response_model = Person
 
 
+person_local_cache = LocalCache()
+
+
 def get_person_cache(redis: Redis = Depends(get_redis)) -> BaseCache:
-    return RedisPersonCache(redis)
+    return TwoLevelCache(person_local_cache, RedisPersonCache(redis))
 
 
 @lru_cache()
 def get_person_service(cache: BaseCache = Depends(get_person_cache),
-                       db: BaseDB = Depends(get_person_db)) -> PersonService:
-    return PersonService(cache, db)
+                       db: BaseDB = Depends(get_person_db),
+                       lock: Optional[RedisLock] = Depends(get_cache_lock)) -> PersonService:
+    return PersonService(cache, db, lock)
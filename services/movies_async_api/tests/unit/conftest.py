@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The application is in `src` of the repository and right above `tests` in the image
+SRC_DIR = os.path.join(BASE_DIR, 'src')
+sys.path.insert(0, SRC_DIR if os.path.isdir(SRC_DIR) else BASE_DIR)
+
+from db.cache import BaseCache, CacheEntry  # noqa: E402
+
+
+class DictCache(BaseCache):
+    """Remote cache kept in a dict, counting its requests."""
+
+    response_model = None
+
+    def __init__(self):
+        self.items = {}
+        self.requests = 0
+
+    async def get_entry(self, key):
+        self.requests += 1
+        return self.items.get(key)
+
+    async def get_entries(self, keys):
+        self.requests += 1
+        return [self.items.get(key) for key in keys]
+
+    async def set(self, item, key, delta=0.0):
+        self.requests += 1
+        self.items[key] = CacheEntry(item, time.time() + 60, delta)
+
+    async def set_many(self, items, delta=0.0):
+        self.requests += 1
+        for key, item in items.items():
+            self.items[key] = CacheEntry(item, time.time() + 60, delta)
+
+    async def delete(self, keys):
+        self.requests += 1
+        for key in keys:
+            self.items.pop(key, None)
+
+
+@pytest.fixture
+def dict_cache():
+    return DictCache()
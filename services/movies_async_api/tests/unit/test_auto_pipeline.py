@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+from redis.exceptions import ConnectionError, ResponseError
+
+from db.redis import AutoPipelineRedis
+
+
+pytestmark = pytest.mark.asyncio
+
+
+class FakePipeline:
+    """Replies to every command with its last argument, an error to NOPE."""
+
+    def __init__(self, client: 'RecordingRedis'):
+        self.client = client
+        self.commands = []
+
+    def execute_command(self, *args, **options):
+        self.commands.append(args)
+
+    async def execute(self, raise_on_error=True):
+        self.client.pipelines.append([args[-1] for args in self.commands])
+        if self.client.broken:
+            raise ConnectionError('Connection closed by server.')
+        await asyncio.sleep(0)
+        return [ResponseError('unknown command') if args[0] == 'NOPE' else args[-1] for args in self.commands]
+
+
+class RecordingRedis(AutoPipelineRedis):
+    """Records the commands of every pipeline instead of sending them."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pipelines = []
+        self.broken = False
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return FakePipeline(self)
+
+
+@pytest.fixture
+def redis():
+    return RecordingRedis(max_batch=4)
+
+
+async def test_concurrent_commands_share_pipeline(redis):
+    replies = await asyncio.gather(*[redis.execute_command('ECHO', i) for i in range(3)])
+
+    assert replies == [0, 1, 2]
+    assert redis.pipelines == [[0, 1, 2]]
+
+
+async def test_batches_are_split_at_max_size(redis):
+    replies = await asyncio.gather(*[redis.execute_command('ECHO', i) for i in range(6)])
+
+    assert replies == list(range(6))
+    assert redis.pipelines == [[0, 1, 2, 3], [4, 5]]
+
+
+async def test_error_is_raised_to_its_caller_only(redis):
+    replies = await asyncio.gather(redis.execute_command('ECHO', 0), redis.execute_command('NOPE', 1),
+                                   redis.execute_command('ECHO', 2), return_exceptions=True)
+
+    assert replies[0] == 0 and replies[2] == 2
+    assert isinstance(replies[1], ResponseError)
+
+
+async def test_broken_connection_fails_the_batch(redis):
+    redis.broken = True
+    replies = await asyncio.gather(*[redis.execute_command('ECHO', i) for i in range(2)], return_exceptions=True)
+
+    assert all(isinstance(reply, ConnectionError) for reply in replies)
+
+
+async def test_cancelled_caller_does_not_fail_the_batch(redis):
+    first = asyncio.ensure_future(redis.execute_command('ECHO', 0))
+    second = asyncio.ensure_future(redis.execute_command('ECHO', 1))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == 1
+    assert first.cancelled()
@@ -0,0 +1,161 @@
+import asyncio
+import time
+
+import pytest
+
+from db.cache import CacheEntry, LocalCache, TwoLevelCache
+
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+def remote(dict_cache):
+    return dict_cache
+
+
+@pytest.fixture
+def cache(remote):
+    return TwoLevelCache(LocalCache(max_size=2, ttl=60), remote)
+
+
+def test_local_cache_evicts_least_recently_used():
+    local = LocalCache(max_size=2, ttl=60)
+    local.set('a', 1)
+    local.set('b', 2)
+    assert local.get('a') == 1
+    local.set('c', 3)
+
+    assert local.get('b') is None
+    assert (local.get('a'), local.get('c')) == (1, 3)
+    assert len(local) == 2
+
+
+def test_local_cache_entries_expire(monkeypatch):
+    local = LocalCache(max_size=2, ttl=10)
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now)
+    local.set('a', 1)
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 10)
+
+    assert local.get('a', 'missing') == 'missing'
+    assert len(local) == 0
+    assert (local.hits, local.misses) == (0, 1)
+
+
+async def test_two_level_cache_reads_remote_once(cache, remote):
+    await remote.set(b'body', 'key')
+    remote.requests = 0
+
+    assert (await cache.get_entry('key')).item == b'body'
+    assert (await cache.get_entry('key')).item == b'body'
+    assert remote.requests == 1
+    assert await cache.get_entry('missing') is None
+
+
+async def test_two_level_cache_reads_missing_entries_in_one_request(cache, remote):
+    await remote.set_many({'a': b'a', 'b': b'b'})
+    await cache.get_entry('a')
+    remote.requests = 0
+
+    entries = await cache.get_entries(['a', 'b', 'c'])
+    assert [entry and entry.item for entry in entries] == [b'a', b'b', None]
+    assert remote.requests == 1
+
+
+async def test_two_level_cache_writes_and_deletes_both_levels(cache, remote):
+    await cache.set(b'body', 'key', delta=0.5)
+    assert cache.local.get('key').item == b'body'
+    assert remote.items['key'].delta == 0.5
+
+    await cache.delete(['key'])
+    assert cache.local.get('key') is None
+    assert 'key' not in remote.items
+
+
+def hold(monkeypatch, remote, method: str) -> asyncio.Event:
+    """Hold back the results of the `method` of `remote` until the returned event is set."""
+    release = asyncio.Event()
+    call = getattr(remote, method)
+
+    async def held(*args, **kwargs):
+        result = await call(*args, **kwargs)
+        await release.wait()
+        return result
+
+    monkeypatch.setattr(remote, method, held)
+    return release
+
+
+@pytest.fixture
+def tracked_cache(cache):
+    cache.local.tracked = True
+    return cache
+
+
+async def test_read_overtaken_by_invalidation_is_not_kept(cache, remote, monkeypatch):
+    await remote.set(b'old', 'key')
+    release = hold(monkeypatch, remote, 'get_entry')
+    read = asyncio.ensure_future(cache.get_entry('key'))
+    await asyncio.sleep(0)
+    cache.local.invalidate('key')
+    release.set()
+
+    assert (await read).item == b'old'
+    assert cache.local.get('key') is None
+    assert (await cache.get_entry('key')).item == b'old'
+    assert cache.local.get('key') is not None
+
+
+async def test_read_during_own_write_is_not_kept(tracked_cache, remote, monkeypatch):
+    await remote.set(b'old', 'key')
+    release = hold(monkeypatch, remote, 'get_entries')
+    read = asyncio.ensure_future(tracked_cache.get_entries(['key']))
+    await asyncio.sleep(0)
+    await tracked_cache.set(b'new', 'key')
+    release.set()
+
+    assert (await read)[0].item == b'old'
+    assert tracked_cache.local.get('key').item == b'new'
+
+
+async def test_own_write_is_not_evicted_by_its_announcement(tracked_cache):
+    await tracked_cache.set_many({'a': b'a', 'b': b'b'})
+    tracked_cache.local.invalidate('a')
+    assert tracked_cache.local.get('a').item == b'a'
+
+    # A write by another worker
+    tracked_cache.local.invalidate('a')
+    assert tracked_cache.local.get('a') is None
+
+
+async def test_own_write_overtaken_by_other_write_is_not_kept(tracked_cache, remote, monkeypatch):
+    release = hold(monkeypatch, remote, 'set')
+    write = asyncio.ensure_future(tracked_cache.set(b'mine', 'key'))
+    await asyncio.sleep(0)
+    tracked_cache.local.invalidate('key')
+    tracked_cache.local.invalidate('key')
+    release.set()
+    await write
+
+    assert tracked_cache.local.get('key') is None
+
+
+async def test_failed_write_is_not_expected(tracked_cache, remote, monkeypatch):
+    async def fail(*args, **kwargs):
+        raise ConnectionError
+
+    local = tracked_cache.local
+    local.set('key', CacheEntry(b'old', time.time() + 60))
+    monkeypatch.setattr(remote, 'set', fail)
+    with pytest.raises(ConnectionError):
+        await tracked_cache.set(b'new', 'key')
+
+    local.invalidate('key')
+    assert local.get('key') is None
+
+
+async def test_untracked_cache_evicts_written_keys(cache):
+    await cache.set(b'body', 'key')
+    cache.local.invalidate('key')
+    assert cache.local.get('key') is None
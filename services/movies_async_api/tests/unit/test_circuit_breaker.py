@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+from api.utils.http_client import CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(failures=3, reset_timeout=10)
+
+
+def open_breaker(breaker: CircuitBreaker):
+    for _ in range(breaker.failures):
+        assert breaker.before_call() is False
+        breaker.on_failure()
+
+
+def test_closed_until_failures_in_a_row(breaker):
+    for _ in range(2):
+        breaker.on_failure()
+    breaker.on_success()
+    for _ in range(2):
+        breaker.on_failure()
+
+    assert breaker.before_call() is False
+
+
+def test_open_after_failures_in_a_row(breaker):
+    open_breaker(breaker)
+
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_one_trial_call_after_reset_timeout(breaker, clock):
+    open_breaker(breaker)
+    clock.now += 10
+
+    assert breaker.before_call() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_successful_trial_closes(breaker, clock):
+    open_breaker(breaker)
+    clock.now += 10
+    breaker.before_call()
+    breaker.on_success()
+
+    assert breaker.before_call() is False
+    breaker.on_failure()
+    assert breaker.before_call() is False
+
+
+def test_failed_trial_opens_again(breaker, clock):
+    open_breaker(breaker)
+    clock.now += 10
+    breaker.before_call()
+    breaker.on_failure()
+
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    clock.now += 10
+    assert breaker.before_call() is True
+
+
+def test_trial_without_result_lets_another_through(breaker, clock):
+    open_breaker(breaker)
+    clock.now += 10
+    assert breaker.before_call() is True
+    breaker.end_trial()
+
+    assert breaker.before_call() is True
@@ -0,0 +1,78 @@
+from http import HTTPStatus
+
+import pytest
+from fastapi import HTTPException
+
+from queryes.base import QueryParamsBase, ServiceQueryInfo, decode_cursor, encode_cursor
+from services.film import ElasticFilmDB
+
+
+@pytest.mark.parametrize('sort_values', [
+    [],
+    [7.5, 'e7d2a4c6-3f1b-4c1e-9a8e-0b6c5d4e3f21'],
+    [None, 'title', 1650000000000],
+    ['Амели', 'ff'],
+])
+def test_cursor_round_trip(sort_values):
+    cursor = encode_cursor(sort_values)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == sort_values
+
+
+@pytest.mark.parametrize('cursor', ['!!!', 'e30', encode_cursor([1, 'abc'])[:-3]])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+    with pytest.raises(HTTPException) as error:
+        QueryParamsBase(page_cursor=cursor)
+    assert error.value.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.parametrize('sort, query, sort_values', [
+    # A cursor of a sorted page given to an unsorted one and the other way round
+    (None, None, [7.5, 'abc']),
+    ('-imdb_rating', None, ['abc']),
+    (None, 'star', ['abc']),
+    ('title', None, ['Амели', 'abc', 'def']),
+    # The id tiebreaker is a string, sort values are scalars
+    ('-imdb_rating', None, ['abc', 7.5]),
+    ('-imdb_rating', None, [[7.5], 'abc']),
+    (None, None, [{'id': 'abc'}]),
+])
+def test_cursor_of_another_sort_is_rejected(sort, query, sort_values):
+    with pytest.raises(HTTPException) as error:
+        QueryParamsBase(sort=sort, query=query, page_cursor=encode_cursor(sort_values))
+    assert error.value.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.parametrize('sort, query, sort_values', [
+    (None, None, ['abc']),
+    (None, '  ', ['abc']),
+    ('-imdb_rating', None, [7.5, 'abc']),
+    ('-imdb_rating', None, [None, 'abc']),
+    (None, 'star', [1.25, 'abc']),
+])
+def test_cursor_of_the_sort_is_accepted(sort, query, sort_values):
+    cursor = encode_cursor(sort_values)
+    assert QueryParamsBase(sort=sort, query=query, page_cursor=cursor).page['cursor'] == cursor
+
+
+def test_cursor_page_body():
+    cursor = encode_cursor([7.5, 'abc'])
+    query_info = ServiceQueryInfo.parse_obj({'page': {'cursor': cursor, 'size': 10},
+                                             'sort': {'field': 'imdb_rating', 'desc': True}})
+    body = ElasticFilmDB.query_builder.body(query_info)
+
+    assert 'from' not in body
+    assert body['search_after'] == [7.5, 'abc']
+    assert body['sort'] == [{'rating': {'order': 'desc'}}, {'id': 'asc'}]
+    assert body['track_total_hits'] is False
+    assert query_info.as_key() == f'after-{cursor}-10:None:imdb_rating-1:None'
+
+
+def test_first_cursor_page_body():
+    body = ElasticFilmDB.query_builder.body(ServiceQueryInfo.parse_obj({'page': {'cursor': ''}, 'query': 'star'}))
+
+    assert 'from' not in body and 'search_after' not in body
+    # Hits of the same score are ordered by id, so that the sort values of the last one pinpoint the next page
+    assert body['sort'] == [{'_score': 'desc'}, {'id': 'asc'}]
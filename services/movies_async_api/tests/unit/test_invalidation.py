@@ -0,0 +1,45 @@
+import orjson
+import pytest
+
+from models.genre import Genre
+from services.base import BaseService
+from services.genre import GenreService
+from services.invalidation import CacheInvalidationListener
+
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+def service(dict_cache, monkeypatch):
+    monkeypatch.setattr(BaseService, 'query_versions', {})
+    monkeypatch.setattr(dict_cache, 'response_model', Genre)
+    return GenreService(dict_cache, db=None)
+
+
+@pytest.fixture
+def listener(service):
+    return CacheInvalidationListener(redis=None, services={'genres': service})
+
+
+def entry(ids, bump=None):
+    fields = {b'index': b'genres', b'ids': orjson.dumps(ids)}
+    if bump is not None:
+        fields[b'bump'] = bump
+    return fields
+
+
+async def test_entry_without_bump_keeps_query_version(listener, service, dict_cache):
+    dict_cache.items['GenreService:Details:a'] = 'cached'
+    await listener._evict('1-0', entry(['a'], b'1'))
+    await listener._evict('2-0', entry(['b'], b'0'))
+    assert service.query_versions == {'GenreService': '1-0'}
+    assert 'GenreService:Details:a' not in dict_cache.items
+
+    # A deferred bump comes without ids, entries of former ETL versions have no flag
+    requests = dict_cache.requests
+    await listener._evict('3-0', entry([], b'1'))
+    assert service.query_versions == {'GenreService': '3-0'}
+    assert dict_cache.requests == requests
+    await listener._evict('4-0', entry(['c']))
+    assert service.query_versions == {'GenreService': '4-0'}
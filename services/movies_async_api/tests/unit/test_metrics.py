@@ -0,0 +1,80 @@
+import logging
+
+import pytest
+
+from core import metrics
+from core.logger import SampledLogger
+
+
+@pytest.fixture
+def histogram():
+    histogram = metrics.Histogram('test_duration_seconds', 'Test durations', ('operation',), (0.1, 1.0))
+    yield histogram
+    metrics.registry.remove(histogram)
+
+
+@pytest.fixture
+def counter():
+    counter = metrics.Counter('test_total', 'Test events', ('name',))
+    yield counter
+    metrics.registry.remove(counter)
+
+
+def test_histogram_buckets_are_cumulative(histogram):
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, 'load')
+
+    assert histogram.render() == [
+        '# HELP test_duration_seconds Test durations',
+        '# TYPE test_duration_seconds histogram',
+        'test_duration_seconds_bucket{operation="load",le="0.1"} 2',
+        'test_duration_seconds_bucket{operation="load",le="1.0"} 3',
+        'test_duration_seconds_bucket{operation="load",le="+Inf"} 4',
+        'test_duration_seconds_sum{operation="load"} 2.65',
+        'test_duration_seconds_count{operation="load"} 4',
+    ]
+
+
+def test_counter_label_values_are_escaped(counter):
+    counter.inc('say "hi"\\\n')
+    counter.inc('say "hi"\\\n', amount=2)
+
+    assert counter.render()[-1] == 'test_total{name="say \\"hi\\"\\\\\\n"} 3.0'
+    assert 'test_total{name=' in metrics.render()
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger('SampledTest')
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def test_sampled_logger_passes_rate_of_records(logger, monkeypatch):
+    sampled = SampledLogger(logger, 0.25)
+    monkeypatch.setattr('random.random', lambda: 0.2)
+    assert sampled.isEnabledFor(logging.INFO)
+    monkeypatch.setattr('random.random', lambda: 0.25)
+    assert not sampled.isEnabledFor(logging.INFO)
+
+
+def test_sampled_logger_passes_warnings_and_errors(logger, monkeypatch):
+    sampled = SampledLogger(logger, 0.0)
+    monkeypatch.setattr('random.random', lambda: 0.99)
+
+    assert sampled.isEnabledFor(logging.WARNING)
+    assert sampled.isEnabledFor(logging.ERROR)
+    assert not sampled.isEnabledFor(logging.INFO)
+
+
+def test_sampled_logger_keeps_logger_level(logger):
+    logger.setLevel(logging.WARNING)
+    assert not SampledLogger(logger, 1.0).isEnabledFor(logging.INFO)
+
+
+def test_sampled_out_records_are_not_written(logger, caplog):
+    caplog.set_level(logging.INFO, logger='SampledTest')
+    SampledLogger(logger, 0.0).info('sampled out')
+    SampledLogger(logger, 1.0).info('passed')
+
+    assert [record.getMessage() for record in caplog.records] == ['passed']
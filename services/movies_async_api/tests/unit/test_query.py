@@ -0,0 +1,90 @@
+import json
+import re
+
+import pytest
+
+from queryes.base import ServiceQueryInfo, encode_cursor
+from services.film import ElasticFilmDB
+from services.genre import ElasticGenreDB
+from services.person import ElasticPersonDB
+
+
+SECTION = re.compile(r'\{\{([#^])(\w+)\}\}(.*?)\{\{/\2\}\}', re.S)
+VARIABLE = re.compile(r'\{\{(\w+)\}\}')
+
+
+def render(template: str, params: dict) -> str:
+    """The mustache of Elasticsearch the search templates use: sections, `toJson` and JSON-escaped variables."""
+    def section(match):
+        kind, name, content = match.groups()
+        if name == 'toJson':
+            return json.dumps(params[content])
+        shown = bool(params.get(name))
+        return render(content, params) if shown == (kind == '#') else ''
+
+    def variable(match):
+        value = params[match.group(1)]
+        return json.dumps(value)[1:-1] if isinstance(value, str) else json.dumps(value)
+
+    return VARIABLE.sub(variable, SECTION.sub(section, template))
+
+
+def rendered_body(builder, query_info: ServiceQueryInfo, source=None) -> dict:
+    body = json.loads(render(builder.template, builder.template_params(query_info, source)))
+    filters = body['query']['bool'].get('filter')
+    if filters is not None:
+        # Takes the comma of the filter clauses before it
+        assert filters.pop() == {'match_all': {}}
+    if query_info.page.cursor is not None:
+        assert body.pop('from') == 0
+    return body
+
+
+GENRE = 'a3b5c1d2-0000-4000-8000-000000000001'
+PERSON = 'a3b5c1d2-0000-4000-8000-000000000002'
+
+QUERIES = [
+    {},
+    {'page': {'number': 3, 'size': 20}},
+    {'query': 'Star "Wars" \\ episode'},
+    {'sort': {'field': 'imdb_rating', 'desc': True}, 'filter': {'genre': GENRE}},
+    {'filter': {'genre': GENRE, 'person': PERSON}, 'query': 'star', 'page': {'number': 1}},
+    {'page': {'cursor': ''}},
+    {'page': {'cursor': ''}, 'query': 'star'},
+    {'page': {'cursor': encode_cursor([7.5, 'abc']), 'size': 10}, 'sort': {'field': 'title', 'desc': False}},
+]
+
+
+@pytest.mark.parametrize('params', QUERIES)
+@pytest.mark.parametrize('source', [None, ['id', 'title', 'imdb_rating']])
+def test_film_template_renders_body(params, source):
+    query_info = ServiceQueryInfo.parse_obj(params)
+    builder = ElasticFilmDB.query_builder
+    assert rendered_body(builder, query_info, source) == builder.body(query_info, source)
+
+
+@pytest.mark.parametrize('db_class, params', [
+    (ElasticGenreDB, {'query': 'drama', 'sort': {'field': 'name', 'desc': True}}),
+    (ElasticGenreDB, {'page': {'cursor': encode_cursor(['drama', 'id'])}}),
+    (ElasticPersonDB, {'filter': {'films': GENRE}, 'sort': {'field': 'full_name', 'desc': False}}),
+    (ElasticPersonDB, {'query': 'george', 'page': {'cursor': ''}}),
+])
+def test_template_renders_body(db_class, params):
+    query_info = ServiceQueryInfo.parse_obj(params)
+    builder = db_class.query_builder
+    assert rendered_body(builder, query_info) == builder.body(query_info)
+
+
+def test_body_of_filtered_search():
+    query_info = ServiceQueryInfo.parse_obj({'query': 'star', 'filter': {'genre': GENRE}, 'page': {'number': 2}})
+    body = ElasticFilmDB.query_builder.body(query_info)
+
+    assert (body['from'], body['size']) == (2 * query_info.page.size, query_info.page.size)
+    assert body['query']['bool']['should'] == [
+        {'match': {'title': {'query': 'star', 'fuzziness': 'auto', 'boost': 1.5}}},
+        {'match': {'description': {'query': 'star', 'fuzziness': 'auto', 'boost': 1.0}}},
+    ]
+    assert body['query']['bool']['filter'] == [
+        {'nested': {'path': 'genre', 'query': {'match': {'genre.id': GENRE}}}},
+    ]
+    assert 'sort' not in body
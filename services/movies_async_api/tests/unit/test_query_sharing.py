@@ -0,0 +1,104 @@
+import orjson
+import pytest
+
+from core import config
+from models.genre import BaseGenre, Genre
+from queryes.base import QueryParamsBase, ServiceQueryInfo
+from services.genre import GenreService
+
+
+pytestmark = pytest.mark.asyncio
+
+BLOCK_SIZE = 7
+GENRE = 'a3b5c1d2-0000-4000-8000-000000000001'
+
+
+class ListDB:
+    """Database of the genres `0`, `1`, ... in this order, counting the blocks it is asked for."""
+
+    def __init__(self, count: int):
+        self.genres = [Genre(id=str(i), name=f'Genre {i}') for i in range(count)]
+        self.blocks = []
+
+    async def query_item(self, query, model=None):
+        self.blocks.append(query.page.number)
+        start = query.page.number * query.page.size
+        return [model(**genre.dict()) for genre in self.genres[start:start + query.page.size]]
+
+
+async def get_page(service: GenreService, number: int, size: int):
+    query_info = ServiceQueryInfo.parse_obj({'page': {'number': number, 'size': size}})
+    body = await service.get_response_by_query(query_info, BaseGenre)
+    return None if body is None else [genre['uuid'] for genre in orjson.loads(body)]
+
+
+@pytest.fixture(autouse=True)
+def block_size(monkeypatch):
+    monkeypatch.setattr(config, 'QUERY_BLOCK_SIZE', BLOCK_SIZE)
+
+
+@pytest.fixture
+def db():
+    # The last block is short: 30 genres are 4 blocks of 7 and one of 2
+    return ListDB(30)
+
+
+@pytest.fixture
+def service(dict_cache, db):
+    return GenreService(dict_cache, db)
+
+
+async def test_page_within_block(service, db):
+    assert await get_page(service, 1, 3) == ['3', '4', '5']
+    assert db.blocks == [0]
+
+
+async def test_page_straddling_blocks(service, db):
+    assert await get_page(service, 1, 5) == ['5', '6', '7', '8', '9']
+    assert db.blocks == [0, 1]
+    # Pages of any number and size are sliced from the cached blocks
+    assert await get_page(service, 0, 14) == [str(i) for i in range(14)]
+    assert db.blocks == [0, 1]
+
+
+async def test_page_ending_in_short_last_block(service, db):
+    assert await get_page(service, 2, 10) == [str(i) for i in range(20, 30)]
+    assert db.blocks == [2, 3, 4]
+
+
+async def test_page_larger_than_the_rest(service, db):
+    assert await get_page(service, 1, 20) == [str(i) for i in range(20, 30)]
+    # The short block is the last one, the blocks after it are not asked for
+    assert db.blocks == [2, 3, 4]
+
+
+async def test_page_past_the_end(service, db):
+    assert await get_page(service, 3, 10) is None
+    assert await get_page(service, 10, 10) is None
+    assert db.blocks == [4, 14]
+
+
+async def test_list_ending_on_block_boundary(dict_cache):
+    db = ListDB(2 * BLOCK_SIZE)
+    service = GenreService(dict_cache, db)
+
+    assert await get_page(service, 0, 20) == [str(i) for i in range(2 * BLOCK_SIZE)]
+    assert db.blocks == [0, 1, 2]
+
+
+def test_equivalent_queries_share_key():
+    first = ServiceQueryInfo.parse_obj(QueryParamsBase(query='  Star   WARS ', filter_genre=GENRE, sort='-imdb_rating',
+                                                       page_number=2).asdict())
+    second = ServiceQueryInfo.parse_obj({'query': 'star wars', 'filter': {'genre': GENRE},
+                                         'sort': {'field': 'imdb_rating', 'desc': True}, 'page': {'number': 2}})
+    assert first.as_key() == second.as_key()
+    assert first.as_key() != first.copy(update={'query': 'star'}).as_key()
+
+
+def test_query_is_lowercased_like_the_analyzer():
+    # Case folding would turn ß into ss, which the standard analyzer keeps, and share the results of other terms
+    assert ServiceQueryInfo(query='Straße').query == 'straße'
+
+
+def test_blank_query_is_no_query():
+    assert ServiceQueryInfo(query='   ').query is None
@@ -0,0 +1,89 @@
+import time
+
+import orjson
+import pytest
+
+from core import config
+from db.cache import CacheEntry, RedisCache
+from models.genre import Genre
+
+
+pytestmark = pytest.mark.asyncio
+
+
+class FakeRedis:
+    """The commands of `RedisCache` on a dict, with the expiration each key was set with."""
+
+    def __init__(self):
+        self.values = {}
+        self.expirations = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def mget(self, *keys):
+        return [self.values.get(key) for key in keys]
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value
+        self.expirations[key] = ex
+        return True
+
+
+class GenreCache(RedisCache):
+    response_model = Genre
+
+
+@pytest.fixture
+def redis():
+    return FakeRedis()
+
+
+@pytest.fixture
+def cache(redis):
+    return GenreCache(redis)
+
+
+def test_entry_is_refreshed_once_it_is_stale():
+    assert CacheEntry(None, time.time() - 1).should_refresh()
+    assert not CacheEntry(None, time.time() + 60).should_refresh()
+
+
+def test_slow_loading_entry_is_refreshed_early(monkeypatch):
+    # With the same draw, only the entry that took long to load is refreshed 10 seconds before it is stale
+    monkeypatch.setattr('random.random', lambda: 0.99)
+    expires_at = time.time() + 10
+    assert CacheEntry(None, expires_at, delta=5).should_refresh()
+    assert not CacheEntry(None, expires_at, delta=0.001).should_refresh()
+
+
+async def test_entry_keeps_models_and_loading_time(cache, redis):
+    genres = [Genre(id='1', name='Drama', description='Serious'), Genre(id='2', name='Comedy')]
+    await cache.set(genres, 'key', delta=0.25)
+
+    header, _, payload = redis.values['key'].partition(b'\n')
+    header = orjson.loads(header)
+    assert header['delta'] == 0.25 and not header['raw']
+    assert header['expires_at'] == pytest.approx(time.time() + config.CACHE_EXPIRATION, abs=5)
+    # A stale entry is kept in Redis to be served while it is refreshed
+    assert redis.expirations['key'] == config.CACHE_EXPIRATION + config.CACHE_STALE_EXPIRATION
+
+    entry = await cache.get_entry('key')
+    assert entry.item == genres
+    assert (entry.expires_at, entry.delta) == (header['expires_at'], 0.25)
+
+
+async def test_missing_and_former_format_entries_are_misses(cache, redis):
+    redis.values['former'] = orjson.dumps({'id': '1', 'name': 'Drama'})
+    assert await cache.get_entry('former') is None
+    assert await cache.get_entry('missing') is None
+
+
+async def test_response_body_is_returned_as_is(cache, redis):
+    body = b'[{"uuid":"1","name":"Drama"}]'
+    await cache.set(body, 'key')
+
+    header, _, payload = redis.values['key'].partition(b'\n')
+    assert orjson.loads(header)['raw']
+    assert payload == body
+    assert (await cache.get_entry('key')).item == body
@@ -0,0 +1,22 @@
+import orjson
+import pytest
+
+from models.genre import BaseGenre, Genre
+from services.base import BaseService
+
+
+pytestmark = pytest.mark.asyncio
+
+
+def test_render_uses_aliases_and_response_model_fields():
+    genre = Genre(id='1', name='Drama', description='Serious')
+
+    assert orjson.loads(BaseService._render(genre, Genre)) == {'uuid': '1', 'name': 'Drama', 'description': 'Serious'}
+    assert orjson.loads(BaseService._render([genre], BaseGenre)) == [{'uuid': '1', 'name': 'Drama'}]
+
+
+async def test_render_response_of_missing_item_is_none():
+    async def load():
+        return None
+
+    assert await BaseService._render_response(load, Genre) is None
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from services.single_flight import SingleFlight
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_concurrent_callers_share_one_call():
+    single_flight = SingleFlight()
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(*[single_flight.do('key', load) for _ in range(10)])
+    assert results == [1] * 10
+    assert calls == 1
+    assert 'key' not in single_flight
+    assert await single_flight.do('key', load) == 2
+
+
+async def test_keys_do_not_share_calls():
+    single_flight = SingleFlight()
+
+    async def load(value):
+        await asyncio.sleep(0.01)
+        return value
+
+    assert await asyncio.gather(single_flight.do('a', lambda: load('a')),
+                                single_flight.do('b', lambda: load('b'))) == ['a', 'b']
+
+
+async def test_error_is_raised_to_every_caller():
+    single_flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError('load failed')
+
+    results = await asyncio.gather(single_flight.do('key', fail), single_flight.do('key', fail),
+                                   return_exceptions=True)
+    assert [type(result) for result in results] == [ValueError, ValueError]
+    assert len(single_flight) == 0
+
+
+async def test_cancelled_caller_does_not_cancel_the_call():
+    single_flight = SingleFlight()
+    loaded = asyncio.Event()
+
+    async def load():
+        await asyncio.sleep(0.01)
+        loaded.set()
+        return 'item'
+
+    first = asyncio.ensure_future(single_flight.do('key', load))
+    second = asyncio.ensure_future(single_flight.do('key', load))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == 'item'
+    assert loaded.is_set()
+    assert first.cancelled()
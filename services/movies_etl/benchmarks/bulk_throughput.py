@@ -0,0 +1,70 @@
+"""Bulk indexing throughput of `ElasticsearchLoader`.
+
+Compares the former behaviour (one bulk request at a time and a refresh after every chunk)
+with byte-sized batches sent by several workers and a single refresh per cycle.
+By default documents go to a local Elasticsearch stand-in with a fixed bulk latency;
+pass `--host` to measure a real cluster instead.
+
+    python benchmarks/bulk_throughput.py --documents 50000 --workers 1 2 4 8
+"""
+import argparse
+import time
+from typing import List
+
+from common import synthetic_films
+from es_standin import ElasticsearchStandIn
+
+import config
+from elastic import ElasticsearchLoader
+
+INDEX = 'benchmark_movies'
+
+
+def run(name: str, loader: ElasticsearchLoader, documents: List[dict], refresh_per_chunk: bool = False) -> None:
+    start = time.perf_counter()
+    for i in range(0, len(documents), config.ETL_CHUNK_SIZE):
+        loader.load_to_es(documents[i:i + config.ETL_CHUNK_SIZE], INDEX)
+        if refresh_per_chunk:
+            loader.refresh()
+    loader.refresh()
+    elapsed = time.perf_counter() - start
+    loader.close()
+
+    print(f'{name:>40} | {elapsed:>10.2f} | {len(documents) / elapsed:>12.0f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=50_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--bulk-size', type=int, default=config.ETL_BULK_SIZE, help='Bulk body size, bytes')
+    parser.add_argument('--host', help='Real Elasticsearch url, e.g. http://127.0.0.1:9200')
+    parser.add_argument('--bulk-latency', type=float, default=0.05, help='Stand-in bulk latency, seconds')
+    parser.add_argument('--refresh-latency', type=float, default=0.2, help='Stand-in refresh latency, seconds')
+    parser.add_argument('--reject-ratio', type=float, default=0.0, help='Stand-in share of items rejected with 429')
+    args = parser.parse_args()
+
+    standin = None
+    host = args.host
+    if not host:
+        standin = ElasticsearchStandIn(bulk_latency=args.bulk_latency, refresh_latency=args.refresh_latency,
+                                       reject_ratio=args.reject_ratio).start()
+        host = standin.url
+
+    documents = synthetic_films(args.documents)
+
+    print(f'{"mode":>40} | {"time, s":>10} | {"docs/s":>12}')
+    # Unlimited batches flushed after every chunk: one bulk request per chunk, as before the parallel engine
+    run('sequential, refresh per chunk', ElasticsearchLoader([host], bulk_size=2 ** 62, workers=1),
+        documents, refresh_per_chunk=True)
+    for workers in args.workers:
+        run(f'{workers} in flight, {args.bulk_size} bytes batches',
+            ElasticsearchLoader([host], bulk_size=args.bulk_size, workers=workers), documents)
+
+    if standin:
+        print(f'Stand-in: {standin.bulk_requests} bulk and {standin.refresh_requests} refresh requests')
+        standin.stop()
+
+
+if __name__ == '__main__':
+    main()
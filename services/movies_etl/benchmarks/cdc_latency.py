@@ -0,0 +1,121 @@
+"""Latency from a committed film update to its document reaching the loader.
+
+Films are updated one by one while the film pipeline runs in a background thread,
+first polling every `--sync-delay` seconds, then listening for NOTIFY events of the
+`content` triggers (ETL_CDC). The database must have the triggers from
+`movies_admin/entrypoint.initdb.sh`.
+
+    python benchmarks/cdc_latency.py --seed --films 10000 --updates 200
+"""
+import argparse
+import datetime as dt
+import statistics
+import threading
+import time
+from typing import Dict, List
+
+from common import DSN, NullLoader, seed
+
+import config
+import psycopg2
+from models import Film
+from pipelines import FilmWorkPipeline
+from postgres import FIRST_ID, PostgresProducer
+from state import JsonFileStorage, State
+
+SAMPLE_QUERY = 'SELECT id FROM content.film_work ORDER BY random() LIMIT %s;'
+UPDATE_QUERY = 'UPDATE content.film_work SET modified = now() WHERE id = %s;'
+
+
+class StopBenchmark(Exception):
+    pass
+
+
+class LatencyLoader(NullLoader):
+    """Records when every document is loaded and stops the pipeline thread on the next refresh once asked."""
+
+    def __init__(self):
+        super().__init__()
+        self.loaded_at: Dict[str, float] = {}
+        self.ready = threading.Event()
+        self.stopped = False
+
+    def load_to_es(self, documents: List[Film], index_name: str) -> None:
+        now = time.perf_counter()
+        for document in documents:
+            self.loaded_at.setdefault(document.id, now)
+
+    def refresh(self) -> None:
+        if self.stopped:
+            raise StopBenchmark
+        self.ready.set()
+
+
+def run(name: str, cdc: bool, ids: List[str], interval: float, timeout: float) -> None:
+    config.ETL_CDC = cdc
+    loader = LatencyLoader()
+    pipeline = FilmWorkPipeline(State(JsonFileStorage()), PostgresProducer(DSN), loader)
+    for source in ('film_work', 'person', 'genre'):
+        pipeline.set_checkpoint(source, {'modified': str(dt.datetime.now()), 'id': FIRST_ID})
+
+    def target():
+        try:
+            pipeline.etl_process()
+        except StopBenchmark:
+            pass
+
+    threading.Thread(target=target, daemon=True).start()
+    loader.ready.wait()
+
+    committed_at = {}
+    with psycopg2.connect(**DSN) as conn, conn.cursor() as cursor:
+        for film_id in ids:
+            cursor.execute(UPDATE_QUERY, (film_id,))
+            conn.commit()
+            committed_at[film_id] = time.perf_counter()
+            time.sleep(interval)
+    conn.close()
+
+    deadline = time.perf_counter() + timeout
+    while not committed_at.keys() <= loader.loaded_at.keys() and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    loader.stopped = True
+
+    latencies = sorted((loader.loaded_at[film_id] - committed_at[film_id]) * 1000
+                       for film_id in committed_at if film_id in loader.loaded_at)
+    if not latencies:
+        print(f'{name:>20} | no updates were indexed in {timeout} s')
+        return
+    p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+    print(f'{name:>20} | {len(latencies):>8} | {statistics.median(latencies):>10.0f} | {p95:>10.0f} | '
+          f'{latencies[-1]:>10.0f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--films', type=int, default=10_000)
+    parser.add_argument('--seed', action='store_true', help='Insert the synthetic catalogue before the run')
+    parser.add_argument('--updates', type=int, default=200, help='Number of film updates per mode')
+    parser.add_argument('--interval', type=float, default=0.05, help='Pause between updates, seconds')
+    parser.add_argument('--sync-delay', type=int, default=5, help='ETL_SYNC_DELAY of the polling mode, seconds')
+    args = parser.parse_args()
+
+    if args.seed:
+        print(f'Seeding {args.films} films...')
+        seed(args.films)
+
+    with psycopg2.connect(**DSN) as conn, conn.cursor() as cursor:
+        cursor.execute(SAMPLE_QUERY, (args.updates,))
+        ids = [row[0] for row in cursor.fetchall()]
+    conn.close()
+
+    config.ETL_SYNC_DELAY = args.sync_delay
+    timeout = args.sync_delay * 2 + 10
+
+    print(f'{"mode":>20} | {"indexed":>8} | {"p50, ms":>10} | {"p95, ms":>10} | {"max, ms":>10}')
+    run(f'polling every {args.sync_delay} s', False, ids, args.interval, timeout)
+    run('LISTEN/NOTIFY', True, ids, args.interval, timeout)
+
+
+if __name__ == '__main__':
+    main()
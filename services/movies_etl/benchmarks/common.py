@@ -0,0 +1,161 @@
+"""Shared helpers for the ETL benchmarks.
+
+Benchmarks are run from the `movies_etl` directory, e.g. `python benchmarks/streaming_rss.py`.
+They import the ETL modules the same way `postgres_to_es/main.py` does and therefore need
+the usual ETL/Postgres environment variables; sensible local defaults are provided here.
+"""
+import os
+import resource
+import sys
+import uuid
+from pathlib import Path
+from typing import List, Optional
+
+ETL_DIR = Path(__file__).resolve(strict=True).parent.parent.joinpath('postgres_to_es')
+sys.path.insert(1, str(ETL_DIR))
+
+os.environ.setdefault('ETL_CHUNK_SIZE', '500')
+os.environ.setdefault('ETL_SYNC_DELAY', '0')
+os.environ.setdefault('ETL_DEFAULT_DATE', '1970-01-01 00:00:00')
+os.environ.setdefault('POSTGRES_NAME', 'etl_benchmark')
+os.environ.setdefault('POSTGRES_USER', 'postgres')
+os.environ.setdefault('POSTGRES_PASSWORD', 'postgres')
+os.environ.setdefault('POSTGRES_HOST', '127.0.0.1')
+os.environ.setdefault('POSTGRES_PORT', '5432')
+os.environ.setdefault('ELASTICSEARCH_HOST', '127.0.0.1')
+os.environ.setdefault('ELASTICSEARCH_PORT', '9200')
+
+import config  # noqa: E402
+import psycopg2  # noqa: E402
+from elastic import ElasticsearchLoader  # noqa: E402
+from models import Film, ShortFile, ShortGenre, ShortPerson  # noqa: E402
+
+DSN = {
+    'dbname': config.POSTGRES_NAME,
+    'user': config.POSTGRES_USER,
+    'password': config.POSTGRES_PASSWORD,
+    'host': config.POSTGRES_HOST,
+    'port': config.POSTGRES_PORT,
+}
+
+SEED_QUERY = '''
+-- Keep the ETL triggers quiet: bulk inserts would flood the NOTIFY queue
+SET session_replication_role = replica;
+
+INSERT INTO content.genre (id, name, description, created, modified)
+SELECT md5('genre' || i)::uuid, 'Genre ' || i, 'Synthetic genre ' || i, now(), now()
+FROM generate_series(1, %(genres)s) AS i
+ON CONFLICT DO NOTHING;
+
+INSERT INTO content.person (id, full_name, created, modified)
+SELECT md5('person' || i)::uuid, 'Person ' || i, now(), now()
+FROM generate_series(1, %(persons)s) AS i
+ON CONFLICT DO NOTHING;
+
+INSERT INTO content.film_work (id, title, description, rating, type, file_path, created, modified)
+SELECT md5('film' || i)::uuid, 'Film ' || i, repeat('Synthetic description. ', 10), (i %% 100) / 10.0,
+       'movie', '', now(), now() - (i || ' seconds')::interval
+FROM generate_series(1, %(films)s) AS i
+ON CONFLICT DO NOTHING;
+
+INSERT INTO content.genre_film_work (id, film_work_id, genre_id, created)
+SELECT md5('gfw' || i || '-' || j)::uuid, md5('film' || i)::uuid,
+       md5('genre' || ((i + j) %% %(genres)s + 1))::uuid, now()
+FROM generate_series(1, %(films)s) AS i, generate_series(1, %(genres_per_film)s) AS j
+ON CONFLICT DO NOTHING;
+
+INSERT INTO content.person_film_work (id, film_work_id, person_id, role, created)
+SELECT md5('pfw' || i || '-' || j)::uuid, md5('film' || i)::uuid,
+       md5('person' || ((i * 7 + j) %% %(persons)s + 1))::uuid, (ARRAY['actor', 'writer', 'director'])[j %% 3 + 1],
+       now()
+FROM generate_series(1, %(films)s) AS i, generate_series(1, %(persons_per_film)s) AS j
+ON CONFLICT DO NOTHING;
+
+INSERT INTO content.file (id, file_path, file_format, video_codec, video_width, video_height, video_fps,
+                          audio_codec, audio_sample_rate, audio_channels, created, modified)
+SELECT md5('file' || i || '-' || j)::uuid, 'files/' || i || '-' || j || '.mp4', 'mp4', 'h264',
+       (ARRAY[1920, 576, 360])[j %% 3 + 1], (ARRAY[1080, 480, 240])[j %% 3 + 1], 25, 'aac', 44100, 2, now(), now()
+FROM generate_series(1, %(films)s) AS i, generate_series(1, %(files_per_film)s) AS j
+ON CONFLICT DO NOTHING;
+
+INSERT INTO content.file_film_work (id, film_work_id, file_id, created)
+SELECT md5('ffw' || i || '-' || j)::uuid, md5('film' || i)::uuid, md5('file' || i || '-' || j)::uuid, now()
+FROM generate_series(1, %(films)s) AS i, generate_series(1, %(files_per_film)s) AS j
+ON CONFLICT DO NOTHING;
+'''
+
+
+def seed(films: int, persons: int = 50_000, genres: int = 30,
+         persons_per_film: int = 10, genres_per_film: int = 2, files_per_film: int = 3) -> None:
+    """Fill `content` tables of the benchmark database with a synthetic catalogue.
+
+    Never point it to a real database: rows are inserted in place.
+    """
+    with psycopg2.connect(**DSN) as conn, conn.cursor() as cursor:
+        cursor.execute(SEED_QUERY, {
+            'films': films,
+            'persons': persons,
+            'genres': genres,
+            'persons_per_film': persons_per_film,
+            'genres_per_film': genres_per_film,
+            'files_per_film': files_per_film,
+        })
+    conn.close()
+
+
+def synthetic_films(count: int, persons_per_film: int = 10, genres_per_film: int = 2) -> List[Film]:
+    """Film documents shaped like the output of `FilmWorkPipeline.transform`."""
+    def uid(kind: str, number: int) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_OID, f'{kind}{number}'))
+
+    def person(number: int) -> ShortPerson:
+        return ShortPerson(id=uid('person', number), name=f'Person {number}')
+
+    return [
+        Film(
+            id=uid('film', i),
+            title=f'Film {i}',
+            type='movie',
+            rating=i % 100 / 10,
+            description='Synthetic description. ' * 10,
+            genre=[ShortGenre(id=uid('genre', (i + j) % 30), name=f'Genre {(i + j) % 30}')
+                   for j in range(genres_per_film)],
+            actors=[person(i * 7 + j) for j in range(0, persons_per_film, 3)],
+            writers=[person(i * 7 + j) for j in range(1, persons_per_film, 3)],
+            directors=[person(i * 7 + j) for j in range(2, persons_per_film, 3)],
+            high_quality_file=[ShortFile(id=uid('file', i), path=f'File {i}')],
+        )
+        for i in range(count)
+    ]
+
+
+def current_rss_mb() -> float:
+    with open('/proc/self/statm') as statm:
+        pages = int(statm.read().split()[1])
+    return pages * resource.getpagesize() / 1024 / 1024
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class NullLoader(ElasticsearchLoader):
+    """Elasticsearch stand-in which only counts documents, so benchmarks measure the extraction side."""
+
+    def __init__(self, on_load: Optional[callable] = None):
+        self.on_load = on_load
+        self.loaded = 0
+
+    def init(self, index_name: str):
+        pass
+
+    def load_to_es(self, documents: List[Film], index_name: str) -> None:
+        self.loaded += len(documents)
+        if self.on_load:
+            self.on_load(self.loaded)
+
+    def checkpoint(self, callback: callable) -> None:
+        callback()
+
+    def refresh(self) -> None:
+        pass
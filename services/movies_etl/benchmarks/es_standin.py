@@ -0,0 +1,106 @@
+"""Minimal local Elasticsearch stand-in for loader benchmarks.
+
+Answers `_bulk` and `_refresh` requests after a configurable delay, so the client side
+of the ETL can be measured without a real cluster. A share of bulk items can be rejected
+with 429 to exercise per-item retries, and the items of `fail_ids` fail with 400.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable
+
+
+class ElasticsearchStandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, bulk_latency: float = 0.02, refresh_latency: float = 0.2,
+                 reject_ratio: float = 0.0, fail_ids: Iterable[str] = ()):
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.bulk_latency = bulk_latency
+        self.refresh_latency = refresh_latency
+        self.reject_ratio = reject_ratio
+        self.fail_ids = set(fail_ids)
+        self.indexed = 0
+        self.bulk_requests = 0
+        self.refresh_requests = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return 'http://{host}:{port}'.format(host=self.server_address[0], port=self.server_address[1])
+
+    def start(self) -> 'ElasticsearchStandIn':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def bulk(self, body: bytes) -> dict:
+        time.sleep(self.bulk_latency)
+        lines = body.splitlines()
+        items, errors = [], False
+        for action_line in lines[::2]:
+            action = json.loads(action_line)['index']
+            if action['_id'] in self.fail_ids:
+                errors = True
+                items.append({'index': {'_id': action['_id'], 'status': 400,
+                                        'error': {'type': 'mapper_parsing_exception'}}})
+            elif random.random() < self.reject_ratio:
+                errors = True
+                items.append({'index': {'_id': action['_id'], 'status': 429,
+                                        'error': {'type': 'es_rejected_execution_exception'}}})
+            else:
+                items.append({'index': {'_id': action['_id'], 'status': 201, 'result': 'created'}})
+        with self._lock:
+            self.bulk_requests += 1
+            self.indexed += sum(1 for item in items if item['index']['status'] == 201)
+        return {'took': int(self.bulk_latency * 1000), 'errors': errors, 'items': items}
+
+    def refresh(self) -> dict:
+        time.sleep(self.refresh_latency)
+        with self._lock:
+            self.refresh_requests += 1
+        return {'_shards': {'total': 1, 'successful': 1, 'failed': 0}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: ElasticsearchStandIn
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        path = self.path.split('?')[0]
+        if path.endswith('/_bulk'):
+            self._reply(self.server.bulk(body))
+        elif path.endswith('/_refresh'):
+            self._reply(self.server.refresh())
+        else:
+            self._reply({'acknowledged': True})
+
+    do_PUT = do_POST
+
+    def do_GET(self):
+        if '/_alias/' in self.path:
+            # No aliases: the loader uses the index names as they are
+            self._reply({'error': 'alias missing', 'status': 404}, 404)
+            return
+        self._reply({'version': {'number': '7.11.0'}, 'tagline': 'You Know, for Search'})
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, data: dict, status: int = 200):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
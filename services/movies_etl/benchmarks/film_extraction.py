@@ -0,0 +1,138 @@
+"""Film documents extraction: LEFT JOIN fan-out versus per-relation `json_agg` sub-selects.
+
+Reports rows transferred from Postgres, client CPU time and wall time needed to turn
+the same set of films into Elasticsearch documents.
+
+    python benchmarks/film_extraction.py --seed --films 20000
+"""
+import argparse
+import time
+from typing import Callable, Generator, List
+
+from common import DSN, NullLoader, seed
+
+import config
+import queries
+from models import Film, ShortFile, ShortGenre, ShortPerson
+from pipelines import FilmWorkPipeline
+from postgres import PostgresProducer
+from state import JsonFileStorage, State
+from utils import coroutine
+
+# The cartesian join the film ETL used before the aggregated FW_QUERY
+JOIN_FW_QUERY = '''
+SELECT
+    fw.id as fw_id,
+    fw.title,
+    fw.description,
+    fw.rating,
+    fw.type,
+    fw.creation_date,
+    fw.modified,
+    pfw.role as person_role,
+    p.id as person_id,
+    p.full_name as person_name,
+    g.id as genre_id,
+    g.name as genre_name,
+    f.id as file_id,
+    f.file_path as file_path,
+    f.video_width as video_width
+FROM content.film_work fw
+LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id
+LEFT JOIN content.person p ON p.id = pfw.person_id
+LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id
+LEFT JOIN content.genre g ON g.id = gfw.genre_id
+LEFT JOIN content.file_film_work ffw ON ffw.film_work_id = fw.id
+LEFT JOIN content.file f ON f.id = ffw.file_id
+WHERE fw.id IN %s;
+'''
+
+SAMPLE_QUERY = 'SELECT id FROM content.film_work ORDER BY id LIMIT %s;'
+
+
+@coroutine
+def join_transform(target: Generator) -> Generator:
+    while rows := (yield):
+        movies = {}
+        for row in rows:
+            if row['fw_id'] not in movies:
+                movies[row['fw_id']] = Film(
+                    id=row['fw_id'],
+                    title=row['title'],
+                    rating=row['rating'],
+                    description=row['description'],
+                    type=row['type'],
+                    creation_date=row['creation_date'],
+                )
+            add_join_row(movies[row['fw_id']], row)
+        target.send(list(movies.values()))
+
+
+def add_join_row(film: Film, row: dict) -> None:
+    """The former `Film.add_genre`, `add_person` and `add_video`, retired with the cartesian join."""
+    relations = [(film.genre, ShortGenre(id=row['genre_id'], name=row['genre_name']))]
+    persons = {'actor': film.actors, 'writer': film.writers, 'director': film.directors}.get(row['person_role'])
+    if persons is not None:
+        relations.append((persons, ShortPerson(id=row['person_id'], name=row['person_name'])))
+    width = row['video_width']
+    if width:
+        files = film.high_quality_file if width >= 720 else film.middle_quality_file
+        if width < 480:
+            files = film.low_quality_file
+        relations.append((files, ShortFile(id=row['file_id'], path=row['file_path'])))
+    for items, item in relations:
+        if item not in items:
+            items.append(item)
+
+
+@coroutine
+def counter(result: dict) -> Generator:
+    while documents := (yield):
+        result['documents'] += len(documents)
+
+
+def run(name: str, db: PostgresProducer, query: str, transform: Callable[[Generator], Generator],
+        chunks: List[List[str]]) -> None:
+    result = {'documents': 0}
+    target = transform(counter(result))
+    rows_transferred = 0
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    for ids in chunks:
+        rows = []
+        for chunk_rows in db.execute(query, ids):
+            rows.extend(chunk_rows)
+        rows_transferred += len(rows)
+        target.send(rows)
+    db.commit()
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    print(f'{name:>10} | {rows_transferred:>15} | {result["documents"]:>10} | {cpu:>12.2f} | {wall:>12.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--films', type=int, default=20_000, help='Number of films to extract')
+    parser.add_argument('--seed', action='store_true', help='Insert the synthetic catalogue before the run')
+    parser.add_argument('--persons-per-film', type=int, default=40)
+    parser.add_argument('--genres-per-film', type=int, default=3)
+    parser.add_argument('--files-per-film', type=int, default=6)
+    args = parser.parse_args()
+
+    if args.seed:
+        print(f'Seeding {args.films} films...')
+        seed(args.films, persons_per_film=args.persons_per_film, genres_per_film=args.genres_per_film,
+             files_per_film=args.files_per_film)
+
+    pipeline = FilmWorkPipeline(State(JsonFileStorage()), PostgresProducer(DSN), NullLoader())
+    db = pipeline.db_adapter
+    ids = [row['id'] for chunk_rows in db.execute(SAMPLE_QUERY, (args.films,)) for row in chunk_rows]
+    chunks = [ids[i:i + config.ETL_CHUNK_SIZE] for i in range(0, len(ids), config.ETL_CHUNK_SIZE)]
+
+    print(f'{"query":>10} | {"rows":>15} | {"documents":>10} | {"CPU, s":>12} | {"wall, s":>12}')
+    run('join', db, JOIN_FW_QUERY, join_transform, chunks)
+    run('json_agg', db, queries.FW_QUERY, pipeline.transform, chunks)
+
+
+if __name__ == '__main__':
+    main()
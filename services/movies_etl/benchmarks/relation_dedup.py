@@ -0,0 +1,70 @@
+"""Transform time of one person with many film links: list scans against the set index of `Relations`.
+
+Rows are shaped like the PERSON_QUERY join (one row per film and role of the person), which goes
+through `Person.add_film`, the one relation the transforms still build row by row.
+
+    python benchmarks/relation_dedup.py --links 250 500 1000 2000
+"""
+import argparse
+import time
+from typing import Callable, List
+
+import common  # noqa: F401
+
+from models import Person, ShortFilm
+
+ROLES = ('actor', 'writer', 'director')
+
+
+def join_rows(links: int, roles: int) -> List[dict]:
+    return [
+        {
+            'person_role': ROLES[r % len(ROLES)],
+            'fw_id': f'film{i}', 'fw_title': f'Film {i}', 'fw_type': 'movie', 'fw_rating': 7.5,
+        }
+        for i in range(links) for r in range(roles)
+    ]
+
+
+def scan_transform(person: Person, rows: List[dict]) -> None:
+    """The former `add_film`: a membership test scans the whole list."""
+    for row in rows:
+        person.add_role(row['person_role'])
+        film = ShortFilm(id=row['fw_id'], title=row['fw_title'], type=row['fw_type'], rating=row['fw_rating'])
+        if film not in person.films:
+            person.films.append(film)
+
+
+def set_transform(person: Person, rows: List[dict]) -> None:
+    for row in rows:
+        person.add_role(row['person_role'])
+        person.add_film(ShortFilm(id=row['fw_id'], title=row['fw_title'], type=row['fw_type'], rating=row['fw_rating']))
+
+
+def measure(transform: Callable[[Person, List[dict]], None], rows: List[dict], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        person = Person(id='person', name='Person')
+        start = time.process_time()
+        transform(person, rows)
+        best = min(best, time.process_time() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--links', type=int, nargs='+', default=[250, 500, 1000, 2000], help='Film links per person')
+    parser.add_argument('--roles', type=int, default=2, help='Roles of the person in every film')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per transform, the best one is reported')
+    args = parser.parse_args()
+
+    print(f'{"links":>8} | {"rows":>8} | {"list scan, ms":>14} | {"set index, ms":>14} | {"speedup":>8}')
+    for links in args.links:
+        rows = join_rows(links, args.roles)
+        scan = measure(scan_transform, rows, args.repeat)
+        indexed = measure(set_transform, rows, args.repeat)
+        print(f'{links:>8} | {len(rows):>8} | {scan * 1000:>14.1f} | {indexed * 1000:>14.1f} | {scan / indexed:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""CPU cost of turning film documents into a bulk request body.
+
+Compares the former path (`dataclasses.asdict` of every document, stdlib `json.dumps` of the action
+and source lines, string formatting and a join of the encoded lines) with `BulkBuffer`, which encodes
+the dataclass models with orjson straight into a byte buffer.
+
+    python benchmarks/serialization.py --documents 100000
+"""
+import argparse
+import json
+import time
+from dataclasses import asdict
+from typing import Callable, List
+
+from common import synthetic_films
+
+from elastic import BulkBuffer
+from models import Film
+
+INDEX = 'movies'
+
+
+def legacy_body(documents: List[Film]) -> bytes:
+    actions = []
+    for document in documents:
+        row = asdict(document)
+        actions.append('{action}\n{source}\n'.format(
+            action=json.dumps({'index': {'_index': INDEX, '_id': row['id']}}),
+            source=json.dumps(row, default=str),
+        ).encode())
+    return b''.join(actions)
+
+
+def buffer_body(documents: List[Film], buffer: BulkBuffer = BulkBuffer(INDEX)) -> bytes:
+    for document in documents:
+        buffer.write(document.id, buffer.encode(document))
+    body, _, _ = buffer.take()
+    return body
+
+
+def run(name: str, build_body: Callable[[List[Film]], bytes], documents: List[Film], batch_size: int,
+        repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.process_time()
+        size = sum(len(build_body(documents[i:i + batch_size])) for i in range(0, len(documents), batch_size))
+        best = min(best, time.process_time() - start)
+
+    print(f'{name:>25} | {best:>10.2f} | {best / len(documents) * 1e6:>12.2f} | {size / 1024 / 1024:>10.1f}')
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=100_000)
+    parser.add_argument('--persons-per-film', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=1000, help='Documents per bulk body')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per path, the best one is reported')
+    args = parser.parse_args()
+
+    documents = synthetic_films(args.documents, persons_per_film=args.persons_per_film)
+
+    print(f'{"path":>25} | {"CPU, s":>10} | {"us/document":>12} | {"body, MB":>10}')
+    legacy = run('asdict + json.dumps', legacy_body, documents, args.batch_size, args.repeat)
+    current = run('orjson into BulkBuffer', buffer_body, documents, args.batch_size, args.repeat)
+    print(f'Speedup: {legacy / current:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
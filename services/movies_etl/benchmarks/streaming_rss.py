@@ -0,0 +1,54 @@
+"""Resident memory of a full `movies` reindex.
+
+With the streaming pipeline every chunk of ids goes through enrich, transform and load
+before the next one is fetched, so RSS must stay flat while the number of indexed films grows.
+
+    python benchmarks/streaming_rss.py --seed --films 1000000
+"""
+import argparse
+import time
+
+from common import DSN, NullLoader, current_rss_mb, peak_rss_mb, seed
+
+import queries
+from pipelines import FilmWorkPipeline
+from postgres import PostgresProducer
+from state import JsonFileStorage, State
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--films', type=int, default=1_000_000)
+    parser.add_argument('--seed', action='store_true', help='Insert the synthetic catalogue before the run')
+    parser.add_argument('--samples', type=int, default=10, help='Number of RSS samples to print')
+    args = parser.parse_args()
+
+    if args.seed:
+        print(f'Seeding {args.films} films...')
+        seed(args.films)
+
+    step = max(args.films // args.samples, 1)
+    samples = []
+
+    def on_load(loaded: int):
+        if not samples or loaded - samples[-1][0] >= step:
+            samples.append((loaded, current_rss_mb()))
+
+    loader = NullLoader(on_load)
+    pipeline = FilmWorkPipeline(State(JsonFileStorage()), PostgresProducer(DSN), loader)
+    es_target = pipeline.es_loader_coro(pipeline.index)
+    enrich_target = pipeline.enrich(queries.FW_QUERY, pipeline.transform(es_target))
+    updated_fw_target = pipeline.collect_updated_ids(queries.LAST_FW_QUERY, enrich_target, 'film_work')
+
+    start = time.perf_counter()
+    pipeline.run_cycle([updated_fw_target])
+    elapsed = time.perf_counter() - start
+
+    print(f'{"films indexed":>15} | {"RSS, MB":>10}')
+    for loaded, rss in samples:
+        print(f'{loaded:>15} | {rss:>10.1f}')
+    print(f'Indexed {loader.loaded} films in {elapsed:.1f} s, peak RSS {peak_rss_mb():.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,19 @@ ETL_MODE = os.environ.get('ETL_MODE')
 ETL_CHUNK_SIZE = int(os.environ.get('ETL_CHUNK_SIZE'))
 ETL_SYNC_DELAY = int(os.environ.get('ETL_SYNC_DELAY'))
 ETL_FILE_STATE = os.environ.get('ETL_FILE_STATE')
+ETL_STATE_STORAGE = os.environ.get('ETL_STATE_STORAGE', 'json')
+ETL_STATE_DB = os.environ.get('ETL_STATE_DB', 'state.db')
+ETL_HASH_STORE = os.environ.get('ETL_HASH_STORE')
 ETL_DEFAULT_DATE = os.environ.get('ETL_DEFAULT_DATE')
+ETL_BULK_SIZE = int(os.environ.get('ETL_BULK_SIZE', 5 * 1024 * 1024))
+ETL_BULK_WORKERS = int(os.environ.get('ETL_BULK_WORKERS', 4))
+ETL_CDC = os.environ.get('ETL_CDC', 'false').lower() == 'true'
+ETL_CDC_CHANNEL = os.environ.get('ETL_CDC_CHANNEL', 'etl_changes')
+ETL_CDC_BATCH_DELAY = float(os.environ.get('ETL_CDC_BATCH_DELAY', 0.5))
+ETL_CACHE_INVALIDATION = os.environ.get('CACHE_INVALIDATION', 'false').lower() == 'true'
+ETL_CACHE_INVALIDATION_STREAM = os.environ.get('CACHE_INVALIDATION_STREAM', 'cache_invalidation')
+ETL_CACHE_INVALIDATION_MAXLEN = int(os.environ.get('CACHE_INVALIDATION_MAXLEN', 10000))
+ETL_CACHE_VERSION_INTERVAL = float(os.environ.get('CACHE_INVALIDATION_VERSION_INTERVAL', 5))
 
 # Postgres
 POSTGRES_NAME = os.environ.get('POSTGRES_NAME')
@@ -16,4 +28,8 @@ POSTGRES_PORT = os.environ.get('POSTGRES_PORT')
 
 # Elasticsearch
 ELASTICSEARCH_HOST = os.environ.get('ELASTICSEARCH_HOST')
-ELASTICSEARCH_PORT = os.environ.get('ELASTICSEARCH_PORT')
\ No newline at end of file
+ELASTICSEARCH_PORT = os.environ.get('ELASTICSEARCH_PORT')
+
+# Redis
+REDIS_HOST = os.environ.get('REDIS_HOST')
+REDIS_PORT = os.environ.get('REDIS_PORT')
@@ -1,49 +1,270 @@
+import datetime as dt
 import json
 import logging
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import accumulate
 from pathlib import Path
-from typing import Generator, List
+from typing import Callable, DefaultDict, Deque, Dict, List, Set, Tuple
 
 import config
-from elasticsearch import Elasticsearch, exceptions
+import orjson
+from elasticsearch import Elasticsearch, JSONSerializer, exceptions
+from models import Document
 from utils import backoff
 
 module_logger = logging.getLogger('ElasticsearchLoader')
 
+# Bulk item statuses that are worth sending again: rejected by a full write queue or a node failure
+RETRY_STATUSES = {429, 502, 503, 504}
+
+FORCEMERGE_TIMEOUT = 60 * 60
+
+
+class BulkIndexError(Exception):
+    pass
+
+
+class OrjsonSerializer(JSONSerializer):
+    """Parses responses, large bulk ones first of all, with orjson."""
+
+    def loads(self, s):
+        return orjson.loads(s)
+
+
+class BulkBuffer:
+    """NDJSON bulk body of one index in a reused byte buffer, with the end offset and the id of every item."""
+
+    def __init__(self, index_name: str):
+        self.first_seq = 0
+        self.offsets: List[int] = []
+        self.ids: Set[str] = set()
+        self._buffer = bytearray()
+        self._size = 0
+        self._action_prefix = b'{"index":{"_index":' + orjson.dumps(index_name) + b',"_id":'
+
+    def __len__(self) -> int:
+        return self._size
+
+    def encode(self, document: Document) -> bytes:
+        return b''.join((
+            self._action_prefix, orjson.dumps(document.id), b'}}\n',
+            orjson.dumps(document, option=orjson.OPT_APPEND_NEWLINE),
+        ))
+
+    def write(self, document_id: str, item: bytes) -> None:
+        self._buffer[self._size:self._size + len(item)] = item
+        self._size += len(item)
+        self.offsets.append(self._size)
+        self.ids.add(document_id)
+
+    def take(self) -> Tuple[bytes, List[int], Set[str]]:
+        """Return the body with its item offsets and document ids and empty the buffer."""
+        with memoryview(self._buffer) as view:
+            body = view[:self._size].tobytes()
+        offsets, self.offsets, self._size = self.offsets, [], 0
+        ids, self.ids = self.ids, set()
+        return body, offsets, ids
+
 
 class ElasticsearchLoader:
-    def __init__(self, hosts: list, chunk_size: int = config.ETL_CHUNK_SIZE):
-        self.client = Elasticsearch(hosts=hosts)
-        self.chunk_size = chunk_size
+    """Bulk loader which keeps up to `workers` bulk requests of at most `bulk_size` bytes in flight."""
+
+    def __init__(self, hosts: list, bulk_size: int = config.ETL_BULK_SIZE, workers: int = config.ETL_BULK_WORKERS,
+                 total_tries: int = 5):
+        self.client = Elasticsearch(hosts=hosts, maxsize=workers, serializer=OrjsonSerializer())
+        self.bulk_size = bulk_size
+        self.workers = workers
+        self.total_tries = total_tries
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bulk')
+        self._load_seq = 0
+        self._in_flight: Dict[Future, int] = {}
+        self._in_flight_ids: Dict[Future, Tuple[str, Set[str]]] = {}
+        self._buffers: Dict[str, BulkBuffer] = {}
+        self._checkpoints: Deque[Tuple[int, Callable[[], None]]] = deque()
+        # Ids of the documents per index that failed with an error not worth retrying, until `refresh`
+        self.failed_ids: DefaultDict[str, Set[str]] = defaultdict(set)
+        self._updated_indexes: Set[str] = set()
+        self._concrete_indexes: Dict[str, str] = {}
 
     def init(self, index_name: str):
-        index_dir = Path(__file__).resolve(strict=True).parent.joinpath('indexes')
-        file = index_dir.joinpath(f'{index_name}.json')
-        with open(file, 'r') as index_file:
-            data = json.load(index_file)
-        try:
-            self.client.indices.create(index=index_name, body=data)
-        except exceptions.ElasticsearchException:
+        """Make sure `index_name` exists: an alias to a versioned index, or a plain index created before aliases."""
+        if self.client.indices.exists(index=index_name):
             module_logger.warning('Index already exist: %s', index_name)
+            return
+
+        versioned_index = self.create_index(index_name)
+        self.client.indices.put_alias(index=versioned_index, name=index_name)
+        module_logger.info('Index %s is created with alias %s', versioned_index, index_name)
+
+    def concrete_index(self, index_name: str) -> str:
+        """Name of the index behind the `index_name` alias, or `index_name` itself; looked up once per cycle."""
+        if index_name not in self._concrete_indexes:
+            self._concrete_indexes[index_name] = next(iter(self._get_alias(index_name)), index_name)
+        return self._concrete_indexes[index_name]
+
+    def create_index(self, index_name: str, **settings) -> str:
+        """Create a new version of the index from `indexes/<index_name>.json` and return its name."""
+        data = self._index_body(index_name)
+        data['settings'].update(settings)
+        versioned_index = '{index}_{version:%Y%m%d%H%M%S}'.format(index=index_name, version=dt.datetime.now())
+        self.client.indices.create(index=versioned_index, body=data)
+        return versioned_index
 
-    def load_to_es(self, records: List[dict], index_name: str) -> None:
-        for prepared_query in self._get_chunk_query(records, index_name):
-            str_query = '\n'.join(prepared_query) + '\n'
-            self._post_to_es(str_query, index_name)
-            module_logger.info('Post %d items to elastic search', len(prepared_query))
+    def start_reindex(self, index_name: str) -> str:
+        """Create a new version of the index tuned for bulk loading: no refreshes and no replicas."""
+        versioned_index = self.create_index(index_name, refresh_interval='-1', number_of_replicas=0)
+        module_logger.info('Reindex %s into %s', index_name, versioned_index)
+        return versioned_index
 
-    @backoff(Exception, logger=module_logger)
-    def _post_to_es(self, query: str, index: str) -> None:
-        self.client.bulk(body=query, index=index)
+    def finish_reindex(self, index_name: str, versioned_index: str) -> None:
+        """Merge the loaded index and restore its settings; the alias is switched to it by `swap_alias`."""
+        self.refresh()
+        self.client.indices.forcemerge(index=versioned_index, max_num_segments=1, request_timeout=FORCEMERGE_TIMEOUT)
+        settings = self._index_body(index_name)['settings']
+        self.client.indices.put_settings(index=versioned_index, body={
+            'index': {
+                'refresh_interval': settings.get('refresh_interval', '1s'),
+                'number_of_replicas': settings.get('number_of_replicas', 1),
+            }
+        })
+
+    def swap_alias(self, alias: str, index: str) -> None:
+        actions = [{'add': {'index': index, 'alias': alias}}]
+        previous_indexes = []
+        if self.client.indices.exists_alias(name=alias):
+            previous_indexes = [name for name in self.client.indices.get_alias(name=alias) if name != index]
+            actions.extend({'remove': {'index': name, 'alias': alias}} for name in previous_indexes)
+        elif self.client.indices.exists(index=alias):
+            # A plain index created before aliases took the name: drop it in the same atomic request
+            actions.append({'remove_index': {'index': alias}})
+        self.client.indices.update_aliases(body={'actions': actions})
+        module_logger.info('Alias %s points to %s', alias, index)
+
+        for name in previous_indexes:
+            self.client.indices.delete(index=name)
+            module_logger.info('Previous index %s is deleted', name)
+
+    def load_to_es(self, documents: List[Document], index_name: str) -> None:
+        self._load_seq += 1
+        buffer = self._buffers.get(index_name)
+        if buffer is None:
+            buffer = self._buffers[index_name] = BulkBuffer(index_name)
+        if not buffer:
+            buffer.first_seq = self._load_seq
+        for document in documents:
+            item = buffer.encode(document)
+            if buffer and len(buffer) + len(item) > self.bulk_size:
+                self._submit(buffer, index_name)
+                buffer.first_seq = self._load_seq
+            buffer.write(document.id, item)
+        self._run_checkpoints()
+
+    def checkpoint(self, callback: Callable[[], None]) -> None:
+        """Call `callback` once all documents loaded so far are indexed, in the order of registration."""
+        self._checkpoints.append((self._load_seq, callback))
+        self._run_checkpoints()
+
+    def flush(self) -> None:
+        """Send the documents left in the buffers and wait until every bulk request in flight is finished."""
+        for index_name, buffer in self._buffers.items():
+            if buffer:
+                self._submit(buffer, index_name)
+        self._wait(self._in_flight)
+        self._run_checkpoints()
+
+    def refresh(self) -> None:
+        """Flush the documents and make them visible to search."""
+        self.flush()
+        while self._updated_indexes:
+            self._refresh_index(self._updated_indexes.pop())
+        self._concrete_indexes.clear()
+        self.failed_ids.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self._executor.shutdown()
+        self.client.close()
+
+    def _submit(self, buffer: BulkBuffer, index: str) -> None:
+        body, offsets, ids = buffer.take()
+        self._wait([future for future, (future_index, future_ids) in self._in_flight_ids.items()
+                    if future_index == index and not future_ids.isdisjoint(ids)])
+        if len(self._in_flight) >= self.workers:
+            self._wait(wait(self._in_flight, return_when=FIRST_COMPLETED).done)
+        future = self._executor.submit(self._index_items, body, offsets, index)
+        self._in_flight[future] = buffer.first_seq
+        self._in_flight_ids[future] = (index, ids)
+        self._updated_indexes.add(index)
+
+    def _wait(self, futures) -> None:
+        """Wait for `futures` and forget them; a failed bulk request raises its error here."""
+        for future in list(futures):
+            del self._in_flight[future]
+            index, _ = self._in_flight_ids.pop(future)
+            self.failed_ids[index].update(future.result())
+
+    def _run_checkpoints(self) -> None:
+        self._wait([future for future in self._in_flight if future.done()])
+        first_unfinished = min(
+            [*self._in_flight.values(), *(buffer.first_seq for buffer in self._buffers.values() if buffer)],
+            default=self._load_seq + 1,
+        )
+        while self._checkpoints and self._checkpoints[0][0] < first_unfinished:
+            self._checkpoints.popleft()[1]()
+
+    def _index_items(self, body: bytes, offsets: List[int], index: str) -> Set[str]:
+        """Index the items and return the ids of the ones that failed with an error not worth retrying."""
+        failed_ids = set()
+        delay = 1
+        for _try in range(1, self.total_tries + 1):
+            response = self._post_to_es(body, index)
+            if not response['errors']:
+                module_logger.info('Post %d items to elastic search', len(offsets))
+                return failed_ids
+
+            # A rejected item is not sent again over a later version of its document in the batch
+            last_items = {item['index']['_id']: i for i, item in enumerate(response['items'])}
+            retry_items = []
+            for i, (start, end, item) in enumerate(zip([0, *offsets], offsets, response['items'])):
+                result = item['index']
+                if result['status'] in RETRY_STATUSES:
+                    if last_items[result['_id']] == i:
+                        retry_items.append(body[start:end])
+                elif 'error' in result:
+                    module_logger.error('Failed to index %s: %s', result['_id'], result['error'])
+                    failed_ids.add(result['_id'])
+            module_logger.info('Post %d items to elastic search, %d to retry',
+                               len(offsets) - len(retry_items), len(retry_items))
+            if not retry_items:
+                return failed_ids
+
+            body, offsets = b''.join(retry_items), list(accumulate(map(len, retry_items)))
+            module_logger.warning('Retry: %d/%d. Retrying in %d seconds...', _try, self.total_tries, delay)
+            time.sleep(delay)
+            delay *= 2
+
+        raise BulkIndexError(f'{len(offsets)} items were not indexed to {index}')
+
+    @backoff(exceptions.TransportError, logger=module_logger)
+    def _post_to_es(self, body: bytes, index: str) -> dict:
+        return self.client.bulk(body=body, index=index)
+
+    @backoff(exceptions.ConnectionError, logger=module_logger)
+    def _get_alias(self, alias: str) -> dict:
+        try:
+            return self.client.indices.get_alias(name=alias)
+        except exceptions.NotFoundError:
+            return {}
+
+    @backoff(exceptions.TransportError, logger=module_logger)
+    def _refresh_index(self, index: str) -> None:
         self.client.indices.refresh(index=index)
 
-    def _get_chunk_query(self, rows: List[dict], index_name: str) -> Generator[List[str], None, None]:
-        chunked_rows = (rows[i:i+self.chunk_size] for i in range(0, len(rows), self.chunk_size))
-
-        for chunk in chunked_rows:
-            prepared_query = []
-            for row in chunk:
-                prepared_query.extend([
-                    json.dumps({'index': {'_index': index_name, '_id': row['id']}}),
-                    json.dumps(row)
-                ])
-            yield prepared_query
+    @staticmethod
+    def _index_body(index_name: str) -> dict:
+        index_dir = Path(__file__).resolve(strict=True).parent.joinpath('indexes')
+        file = index_dir.joinpath(f'{index_name}.json')
+        with open(file, 'r') as index_file:
+            return json.load(index_file)
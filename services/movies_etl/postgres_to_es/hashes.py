@@ -0,0 +1,80 @@
+import hashlib
+import logging
+import sqlite3
+from collections import defaultdict
+from typing import DefaultDict, Dict, List, Tuple
+
+import orjson
+from models import Document
+
+module_logger = logging.getLogger('HashStore')
+
+# SQLite versions before 3.32 allow at most 999 bound parameters per statement
+SELECT_BATCH_SIZE = 900
+
+HashRow = Tuple[str, str, bytes]
+
+
+class HashStore:
+    """Digests of the documents last indexed, kept in SQLite to skip re-indexing unchanged ones."""
+
+    def __init__(self, file_path: str):
+        self.connection = sqlite3.connect(file_path, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL;')
+        self.connection.execute('PRAGMA synchronous=NORMAL;')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS document_hash (
+                index_name TEXT NOT NULL,
+                id TEXT NOT NULL,
+                hash BLOB NOT NULL,
+                PRIMARY KEY (index_name, id)
+            ) WITHOUT ROWID;
+        ''')
+        self._stats: DefaultDict[str, List[int]] = defaultdict(lambda: [0, 0])
+
+    @staticmethod
+    def digest(document: Document) -> bytes:
+        return hashlib.blake2b(orjson.dumps(document), digest_size=16).digest()
+
+    def filter_changed(self, index_name: str, documents: List[Document]) -> Tuple[List[Document], List[HashRow]]:
+        """Return the documents which differ from their last indexed version and the digests to save for them."""
+        stored = {}
+        for i in range(0, len(documents), SELECT_BATCH_SIZE):
+            ids = [document.id for document in documents[i:i + SELECT_BATCH_SIZE]]
+            stored.update(self.connection.execute(
+                'SELECT id, hash FROM document_hash WHERE index_name = ? AND id IN ({params});'.format(
+                    params=', '.join('?' * len(ids))
+                ),
+                [index_name, *ids],
+            ))
+
+        changed, hashes = [], []
+        for document in documents:
+            digest = self.digest(document)
+            if stored.get(document.id) != digest:
+                changed.append(document)
+                hashes.append((index_name, document.id, digest))
+
+        stats = self._stats[index_name]
+        stats[0] += len(documents)
+        stats[1] += len(documents) - len(changed)
+        return changed, hashes
+
+    def save(self, hashes: List[HashRow]) -> None:
+        with self.connection:
+            self.connection.execute('BEGIN;')
+            self.connection.executemany(
+                'INSERT INTO document_hash (index_name, id, hash) VALUES (?, ?, ?) '
+                'ON CONFLICT (index_name, id) DO UPDATE SET hash = excluded.hash;',
+                hashes,
+            )
+
+    def clear(self, index_name: str) -> None:
+        self.connection.execute('DELETE FROM document_hash WHERE index_name = ?;', (index_name,))
+        module_logger.info('Document hashes of %s are cleared', index_name)
+
+    def pop_stats(self) -> Dict[str, Tuple[int, int]]:
+        """Return `(checked, skipped)` documents per index since the previous call."""
+        stats = {index_name: (checked, skipped) for index_name, (checked, skipped) in self._stats.items()}
+        self._stats.clear()
+        return stats
@@ -0,0 +1,70 @@
+import logging
+import time
+from collections import defaultdict
+from typing import DefaultDict, Dict, Iterable, List, Set
+
+import config
+import orjson
+from redis import Redis, exceptions
+from utils import backoff
+
+module_logger = logging.getLogger('CacheInvalidation')
+
+# Ids per stream entry, a full reload of an index is announced in many small entries
+MESSAGE_SIZE = 1000
+
+
+class CacheInvalidationPublisher:
+    """Announces the ids of indexed documents on a Redis stream, read by the API to evict its cached items."""
+
+    def __init__(self, client: Redis, stream: str = config.ETL_CACHE_INVALIDATION_STREAM,
+                 maxlen: int = config.ETL_CACHE_INVALIDATION_MAXLEN,
+                 version_interval: float = config.ETL_CACHE_VERSION_INTERVAL):
+        self.client = client
+        self.stream = stream
+        self.maxlen = maxlen
+        self.version_interval = version_interval
+        # Indexes whose ids are kept from `publish` until `release`
+        self.held: Set[str] = set()
+        self._pending: DefaultDict[str, Set[str]] = defaultdict(set)
+        # Indexes with changes published since their last version bump, and the time of that bump
+        self._stale: Set[str] = set()
+        self._bumped: Dict[str, float] = {}
+
+    def add(self, index_name: str, ids: Iterable[str]) -> None:
+        self._pending[index_name].update(ids)
+
+    def hold(self, index_name: str) -> None:
+        self.held.add(index_name)
+
+    def release(self, index_name: str) -> None:
+        """Let `publish` announce the held ids of `index_name` and bump its version right away."""
+        self.held.discard(index_name)
+        self._stale.add(index_name)
+        self._bumped.pop(index_name, None)
+
+    def publish(self) -> None:
+        """Publish the pending ids, bumping the version of an index at most once per `version_interval` seconds."""
+        now = time.monotonic()
+        for index_name in (self._pending.keys() | self._stale) - self.held:
+            ids = sorted(self._pending.pop(index_name, ()))
+            bump = now - self._bumped.get(index_name, -self.version_interval) >= self.version_interval
+            if not ids and not bump:
+                continue
+            chunks = [ids[i:i + MESSAGE_SIZE] for i in range(0, len(ids), MESSAGE_SIZE)] or [[]]
+            for i, chunk in enumerate(chunks, start=1):
+                self._publish(index_name, chunk, bump and i == len(chunks))
+            if bump:
+                self._bumped[index_name] = now
+                self._stale.discard(index_name)
+            else:
+                self._stale.add(index_name)
+            if ids:
+                module_logger.info('Published %d changed ids of %s', len(ids), index_name)
+
+    @backoff(exceptions.ConnectionError, logger=module_logger)
+    def _publish(self, index_name: str, ids: List[str], bump: bool) -> None:
+        entry_id = self.client.xadd(self.stream, {'index': index_name, 'ids': orjson.dumps(ids), 'bump': int(bump)},
+                                    maxlen=self.maxlen, approximate=True)
+        if bump:
+            self.client.hset(f'{self.stream}:versions', index_name, entry_id)
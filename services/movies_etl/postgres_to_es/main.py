@@ -1,21 +1,52 @@
+import argparse
 import logging
 
 import config
 from elastic import ElasticsearchLoader
+from hashes import HashStore
+from invalidation import CacheInvalidationPublisher
 from models import ModeETL
-from pipelines import FilmWorkPipeline, GenrePipeline, PersonPipeline
+from pipelines import FilmWorkPipeline, GenrePipeline, PersonPipeline, SharedPipeline
 from postgres import PostgresProducer
-from state import JsonFileStorage, State
+from redis import Redis
+from state import JsonFileStorage, SqliteStorage, State
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s: %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('root')
 
+PIPELINES = {
+    ModeETL.FILM_WORK.value: FilmWorkPipeline,
+    ModeETL.PERSON.value: PersonPipeline,
+    ModeETL.GENRE.value: GenrePipeline,
+    ModeETL.ALL.value: SharedPipeline,
+}
+
+STORAGES = {
+    'json': lambda: JsonFileStorage(config.ETL_FILE_STATE),
+    'sqlite': lambda: SqliteStorage(config.ETL_STATE_DB, json_path=config.ETL_FILE_STATE),
+}
+
 
 def main():
+    parser = argparse.ArgumentParser(description='Postgres to Elasticsearch ETL')
+    parser.add_argument('--reindex', action='store_true',
+                        help='Rebuild the index into a new version, switch its alias and exit')
+    args = parser.parse_args()
+
     logger.info('Start ETL application with %s mode', config.ETL_MODE)
 
+    pipeline_class = PIPELINES.get(config.ETL_MODE)
+    if not pipeline_class:
+        logger.warning('Mode ETL must be from a list: %s', ', '.join([mode.value for mode in ModeETL]))
+        return
+
+    storage_factory = STORAGES.get(config.ETL_STATE_STORAGE)
+    if not storage_factory:
+        logger.warning('State storage must be from a list: %s', ', '.join(STORAGES))
+        return
+
     state = State(
-        JsonFileStorage(config.ETL_FILE_STATE)
+        storage_factory()
     )
     es_loader = ElasticsearchLoader(
         ['http://{host}:{port}'.format(host=config.ELASTICSEARCH_HOST, port=config.ELASTICSEARCH_PORT)]
@@ -28,17 +59,18 @@ def main():
         'port': config.POSTGRES_PORT,
     })
 
-    if config.ETL_MODE == ModeETL.FILM_WORK.value:
-        film_work = FilmWorkPipeline(state, db_adapter, es_loader)
-        film_work.etl_process()
-    elif config.ETL_MODE == ModeETL.PERSON.value:
-        person = PersonPipeline(state, db_adapter, es_loader)
-        person.etl_process()
-    elif config.ETL_MODE == ModeETL.GENRE.value:
-        genre = GenrePipeline(state, db_adapter, es_loader)
-        genre.etl_process()
+    hash_store = HashStore(config.ETL_HASH_STORE) if config.ETL_HASH_STORE else None
+    publisher = None
+    if config.ETL_CACHE_INVALIDATION:
+        publisher = CacheInvalidationPublisher(Redis(host=config.REDIS_HOST, port=int(config.REDIS_PORT)))
+
+    pipeline = pipeline_class(state, db_adapter, es_loader, hash_store, publisher)
+    if args.reindex:
+        pipeline.reindex()
+        es_loader.close()
+        db_adapter.close()
     else:
-        logger.warning('Mode ETL must be from a list: %s', ', '.join([mode.value for mode in ModeETL]))
+        pipeline.etl_process()
 
     logger.info('End ETL application with %s mode', config.ETL_MODE)
 
@@ -1,13 +1,29 @@
-from dataclasses import asdict, dataclass, field
+from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
-from typing import List
+from typing import Dict, List, Set, Union
 
 
 class ModeETL(Enum):
     FILM_WORK = 'film_work'
     PERSON = 'person'
     GENRE = 'genre'
+    ALL = 'all'
+
+
+@dataclass
+class Relations:
+    """Keeps relation lists free of duplicates with a set of ids per list instead of scanning it."""
+    # Not serialized into documents: orjson skips attributes starting with an underscore
+    _relation_ids: Dict[str, Set[str]] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def add_relation(self, relation: str, item) -> None:
+        ids = self._relation_ids.get(relation)
+        if ids is None:
+            ids = self._relation_ids[relation] = {added.id for added in getattr(self, relation)}
+        if item.id not in ids:
+            ids.add(item.id)
+            getattr(self, relation).append(item)
 
 
 @dataclass
@@ -31,7 +47,7 @@ class ShortFile:
 
 
 @dataclass
-class Person(ShortPerson):
+class Person(ShortPerson, Relations):
     roles: List[str] = field(default_factory=list)
     films: List[ShortFilm] = field(default_factory=list)
 
@@ -40,12 +56,7 @@ class Person(ShortPerson):
             self.roles.append(role)
 
     def add_film(self, film: ShortFilm):
-        if film not in self.films:
-            self.films.append(film)
-
-    @property
-    def as_dict(self):
-        return asdict(self)
+        self.add_relation('films', film)
 
 
 @dataclass
@@ -58,10 +69,6 @@ class ShortGenre:
 class Genre(ShortGenre):
     description: str
 
-    @property
-    def as_dict(self):
-        return asdict(self)
-
 
 @dataclass
 class Film(ShortFilm):
@@ -75,33 +82,6 @@ class Film(ShortFilm):
     middle_quality_file: List[ShortFile] = field(default_factory=list)
     low_quality_file: List[ShortFile] = field(default_factory=list)
 
-    def add_genre(self, gen: ShortGenre):
-        if gen not in self.genre:
-            self.genre.append(gen)
-
-    def add_person(self, person: ShortPerson, role: str):
-        if role == 'actor':
-            if person not in self.actors:
-                self.actors.append(person)
-        elif role == 'writer':
-            if person not in self.writers:
-                self.writers.append(person)
-        elif role == 'director':
-            if person not in self.directors:
-                self.directors.append(person)
-
-    def add_video(self, file: ShortFile, width: int):
-        if width:
-            if 720 <= width:
-                if file not in self.high_quality_file:
-                    self.high_quality_file.append(file)
-            elif 480 <= width < 720:
-                if file not in self.middle_quality_file:
-                    self.middle_quality_file.append(file)
-            elif width < 480:
-                if file not in self.low_quality_file:
-                    self.low_quality_file.append(file)
-
-    @property
-    def as_dict(self):
-        return asdict(self)
+
+# Documents loaded to Elasticsearch: serialized by orjson as they are
+Document = Union[Film, Person, Genre]
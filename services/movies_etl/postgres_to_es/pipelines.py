@@ -1,26 +1,96 @@
 import abc
-import datetime as dt
 import logging
+from functools import partial
 from time import sleep
-from typing import Generator, List
+from typing import Dict, Generator, List, Optional, Tuple
 
 import config
 import queries
 from elastic import ElasticsearchLoader
+from hashes import HashRow, HashStore
+from invalidation import CacheInvalidationPublisher
 from models import Film, Genre, Person, ShortFilm, ShortGenre, ShortPerson, ShortFile
-from postgres import PostgresProducer
+from postgres import FIRST_ID, PostgresProducer
+from psycopg2.extras import DictRow
 from state import State
-from utils import coroutine
+from utils import broadcast, coroutine
 
 module_logger = logging.getLogger('Pipeline')
 
 
-class BasePipeline(abc.ABC):
-    def __init__(self, state: State, db_adapter: PostgresProducer, es_loader: ElasticsearchLoader):
+class BaseRunner(abc.ABC):
+    """Runs ETL cycles of wired coroutines every ETL_SYNC_DELAY seconds, or on NOTIFY events with ETL_CDC."""
+
+    def __init__(self, state: State, db_adapter: PostgresProducer, es_loader: ElasticsearchLoader,
+                 hash_store: Optional[HashStore] = None, publisher: Optional[CacheInvalidationPublisher] = None):
         self.state = state
         self.db_adapter = db_adapter
         self.es_loader = es_loader
-        self.state_key = f'{self.index}_last_updated'
+        self.hash_store = hash_store
+        self.publisher = publisher
+
+    @abc.abstractmethod
+    def build_pipeline(self, index: Optional[str] = None) -> List[Generator]:
+        """Wire the coroutines loading into `index`, the pipeline index by default, and return the scans."""
+        pass
+
+    @abc.abstractmethod
+    def build_listeners(self) -> Dict[str, Generator]:
+        """Wire the coroutines and map a source table of NOTIFY events to the one that takes its changed ids."""
+        pass
+
+    @abc.abstractmethod
+    def reindex(self) -> None:
+        pass
+
+    def etl_process(self) -> None:
+        if config.ETL_CDC:
+            self.listen_loop(self.build_pipeline(), self.build_listeners())
+        else:
+            self.event_loop(self.build_pipeline())
+
+    def run_cycle(self, generators: List[Generator], since: Optional[Tuple[str, str]] = None) -> None:
+        """Scan rows updated after `since`, or after the checkpoint of every scan when it is not given."""
+        module_logger.info('Start ETL process for %s: %s', self.__class__.__name__, since or 'checkpoints')
+        for generator in generators:
+            generator.send(since)
+        self.finish_cycle()
+
+    def finish_cycle(self) -> None:
+        """Make the loaded documents visible, publish their ids, end the Postgres transaction and report skips."""
+        self.es_loader.refresh()
+        if self.publisher:
+            self.publisher.publish()
+        self.db_adapter.commit()
+        if self.hash_store:
+            for index_name, (checked, skipped) in self.hash_store.pop_stats().items():
+                module_logger.info('Skipped %d/%d unchanged documents of %s (%.1f%%)',
+                                   skipped, checked, index_name, skipped / checked * 100 if checked else 0)
+
+    def event_loop(self, generators: List[Generator]):
+        while True:
+            self.run_cycle(generators)
+            module_logger.info('ETL process is finished.  Sleep: %d seconds', config.ETL_SYNC_DELAY)
+            sleep(config.ETL_SYNC_DELAY)
+
+    def listen_loop(self, generators: List[Generator], listeners: Dict[str, Generator]):
+        """Index the micro-batches of ids sent by the `content` triggers, with a polling cycle when one is due."""
+        for changes in self.db_adapter.listen():
+            if changes is None:
+                self.run_cycle(generators)
+                continue
+
+            module_logger.info('Got changes: %s', {table: len(ids) for table, ids in changes.items()})
+            for table, ids in changes.items():
+                if table in listeners:
+                    listeners[table].send(list(ids))
+            self.finish_cycle()
+
+
+class BasePipeline(BaseRunner):
+    def __init__(self, state: State, db_adapter: PostgresProducer, es_loader: ElasticsearchLoader,
+                 hash_store: Optional[HashStore] = None, publisher: Optional[CacheInvalidationPublisher] = None):
+        super().__init__(state, db_adapter, es_loader, hash_store, publisher)
 
         self.db_adapter.init()
         self.es_loader.init(self.index)
@@ -30,51 +100,114 @@ class BasePipeline(abc.ABC):
     def index(self) -> str:
         pass
 
+    @property
     @abc.abstractmethod
-    def etl_process(self) -> None:
+    def enrich_query(self) -> str:
         pass
 
     @abc.abstractmethod
     def transform(self, target: Generator) -> Generator:
         pass
 
+    def build_loader(self, index: Optional[str] = None) -> Generator:
+        """Wire enrich, transform and load coroutines, which take ids of updated documents, loading into `index`."""
+        es_target = self.es_loader_coro(index or self.index)
+        if self.hash_store and not index:
+            es_target = self.skip_unchanged(self.index, es_target)
+        return self.enrich(self.enrich_query, self.transform(es_target))
+
+    def build_reindex_pipeline(self, index: str) -> List[Generator]:
+        """Wire the scans which reach every document of the pipeline index once, loading them to `index`."""
+        return self.build_pipeline(index)
+
+    def reindex(self) -> None:
+        """Rebuild the whole index into a new version, catch up with the changes made meanwhile and switch the alias."""
+        started = self.db_adapter.now()
+        versioned_index = self.es_loader.start_reindex(self.index)
+        self.run_cycle(self.build_reindex_pipeline(versioned_index), (config.ETL_DEFAULT_DATE, FIRST_ID))
+        self.es_loader.finish_reindex(self.index, versioned_index)
+
+        caught_up = self.db_adapter.now()
+        # The ids of the catch-up are published once the alias serves the new version
+        if self.publisher:
+            self.publisher.hold(self.index)
+        self.run_cycle(self.build_pipeline(versioned_index), (started, FIRST_ID))
+        previous_index = self.es_loader.concrete_index(self.index)
+        self.es_loader.swap_alias(self.index, versioned_index)
+        self.run_cycle(self.build_pipeline(versioned_index), (caught_up, FIRST_ID))
+        if self.publisher:
+            self.publisher.release(self.index)
+            self.publisher.publish()
+        if self.hash_store:
+            self.hash_store.clear(previous_index)
+
+    def get_checkpoint(self, source: str) -> Tuple[str, str]:
+        """High-water mark `(modified, id)` of the scan of `source`, or the last cycle time of former versions."""
+        checkpoint = self.state.get_state(f'{self.index}_{source}_checkpoint')
+        if checkpoint:
+            return checkpoint['modified'], checkpoint['id']
+        return self.state.get_state(f'{self.index}_last_updated') or config.ETL_DEFAULT_DATE, FIRST_ID
+
+    def set_checkpoint(self, source: str, row: DictRow) -> None:
+        self.state.set_state(f'{self.index}_{source}_checkpoint', {'modified': str(row['modified']), 'id': row['id']})
+
     @coroutine
     def enrich(self, query: str, target: Generator) -> Generator:
         while True:
-            context = []
             ids = (yield)
             module_logger.info('Got %d ids', len(ids))
             if ids:
+                context = []
                 for chunck_rows in self.db_adapter.execute(query, list(ids)):
                     context.extend(chunck_rows)
 
-                target.send(context)
+                if context:
+                    target.send(context)
 
     @coroutine
-    def collect_updated_ids(self, query: str, target: Generator) -> Generator:
+    def collect_updated_ids(self, query: str, target: Generator, source: str,
+                            pipelines: Optional[List['BasePipeline']] = None) -> Generator:
+        """Send pages of ids of `source` updated after the received `(modified, id)`, or after the checkpoints."""
+        pipelines = pipelines or [self]
         while True:
-            result = []
-            query_args = (yield)
-            if query_args:
-                for chunck_rows in self.db_adapter.execute(query, query_args):
-                    result.extend([row['id'] for row in chunck_rows])
+            since = (yield)
+            checkpoint = since is None
+            if checkpoint:
+                since = min(pipeline.get_checkpoint(source) for pipeline in pipelines)
+            for chunck_rows in self.db_adapter.paginate(query, since):
+                target.send([row['id'] for row in chunck_rows])
+                if checkpoint:
+                    for pipeline in pipelines:
+                        self.es_loader.checkpoint(partial(pipeline.set_checkpoint, source, chunck_rows[-1]))
 
-            target.send(result)
+    @coroutine
+    def collect_related_ids(self, query: str, target: Generator) -> Generator:
+        while True:
+            ids = (yield)
+            for chunck_rows in self.db_adapter.execute(query, list(ids)):
+                target.send([row['id'] for row in chunck_rows])
+
+    @coroutine
+    def skip_unchanged(self, index_name: str, target: Generator) -> Generator:
+        """Drop documents equal to their last indexed version; digests are saved once the rest are indexed."""
+        while documents := (yield):
+            changed, hashes = self.hash_store.filter_changed(self.es_loader.concrete_index(index_name), documents)
+            if changed:
+                target.send(changed)
+                self.es_loader.checkpoint(partial(self.save_hashes, index_name, hashes))
+
+    def save_hashes(self, index_name: str, hashes: List[HashRow]) -> None:
+        """Save the digests of the indexed documents; a document that failed to index is sent again next time."""
+        failed_ids = self.es_loader.failed_ids.get(index_name, set())
+        self.hash_store.save([row for row in hashes if row[1] not in failed_ids])
 
     @coroutine
     def es_loader_coro(self, index_name: str) -> Generator:
+        """Load documents to `index_name` and collect their ids, under the alias, to publish to the API caches."""
         while rows := (yield):
             self.es_loader.load_to_es(rows, index_name)
-
-    def event_loop(self, generators: List[Generator]):
-        while True:
-            state_value = self.state.get_state(self.state_key) or config.ETL_DEFAULT_DATE
-            module_logger.info('Start ETL process for %s: %s', self.state_key, state_value)
-            for generator in generators:
-                generator.send(state_value)
-            self.state.set_state(self.state_key, str(dt.datetime.now()))
-            module_logger.info('ETL process is finished.  Sleep: %d seconds', config.ETL_SYNC_DELAY)
-            sleep(config.ETL_SYNC_DELAY)
+            if self.publisher and (index_name == self.index or self.index in self.publisher.held):
+                self.publisher.add(self.index, (row.id for row in rows))
 
 
 class FilmWorkPipeline(BasePipeline):
@@ -82,76 +215,57 @@ class FilmWorkPipeline(BasePipeline):
     def index(self):
         return 'movies'
 
-    @coroutine
-    def enrich(self, query: str, target: Generator) -> Generator:
-        while True:
-            context = []
-            ids = set()
-            fw_ids_from_person = (yield)
-            ids.update(fw_ids_from_person)
-            module_logger.info('Got %d film_work ids from person etl', len(fw_ids_from_person))
-
-            fw_ids_from_genre = (yield)
-            ids.update(fw_ids_from_genre)
-            module_logger.info('Got %d film_work ids from genre etl', len(fw_ids_from_genre))
-
-            fw_ids_from_fw = (yield)
-            ids.update(fw_ids_from_fw)
-            module_logger.info('Got %d film_work ids from film_work etl', len(fw_ids_from_fw))
-
-            module_logger.info('Total unique film_work ids to update: %d', len(ids))
-            if ids:
-                for chunck_rows in self.db_adapter.execute(query, list(ids)):
-                    context.extend(chunck_rows)
-
-                target.send(context)
+    @property
+    def enrich_query(self):
+        return queries.FW_QUERY
 
     @coroutine
     def transform(self, target: Generator) -> Generator:
         while rows := (yield):
-            movies = {}
+            movies = []
             for row in rows:
-                if row['fw_id'] not in movies:
-                    movies[row['fw_id']] = Film(
-                        id=row['fw_id'],
-                        title=row['title'],
-                        rating=row['rating'],
-                        description=row['description'],
-                        type=row['type'],
-                        creation_date=row['creation_date'],
-                    )
-                movies[row['fw_id']].add_genre(
-                    ShortGenre(
-                        id=row['genre_id'],
-                        name=row['genre_name'])
+                movie = Film(
+                    id=row['id'],
+                    title=row['title'],
+                    rating=row['rating'],
+                    description=row['description'],
+                    type=row['type'],
+                    creation_date=row['creation_date'],
+                    genre=[ShortGenre(**genre) for genre in row['genre']],
+                    actors=[ShortPerson(**person) for person in row['actors']],
+                    writers=[ShortPerson(**person) for person in row['writers']],
+                    directors=[ShortPerson(**person) for person in row['directors']],
+                    high_quality_file=[ShortFile(**file) for file in row['high_quality_file']],
+                    middle_quality_file=[ShortFile(**file) for file in row['middle_quality_file']],
+                    low_quality_file=[ShortFile(**file) for file in row['low_quality_file']],
                 )
-                movies[row['fw_id']].add_person(
-                    ShortPerson(
-                        id=row['person_id'],
-                        name=row['person_name']),
-                    role=row['person_role']
-                )
-                movies[row['fw_id']].add_video(
-                    ShortFile(
-                        id=row['file_id'],
-                        path=row['file_path']),
-                    width=row['video_width']
-                )
-            target.send([movie.as_dict for movie in movies.values()])
+                movies.append(movie)
+            target.send(movies)
 
-    def etl_process(self):
-        es_target = self.es_loader_coro(self.index)
-        transform_target = self.transform(es_target)
-        enrich_target = self.enrich(queries.FW_QUERY, transform_target)
+    def build_pipeline(self, index=None):
+        enrich_target = self.build_loader(index)
 
-        person_fw_target = self.collect_updated_ids(queries.PERSON_FW_QUERY, enrich_target)
-        genre_fw_target = self.collect_updated_ids(queries.GENRE_FW_QUERY, enrich_target)
+        person_fw_target = self.collect_related_ids(queries.PERSON_FW_QUERY, enrich_target)
+        genre_fw_target = self.collect_related_ids(queries.GENRE_FW_QUERY, enrich_target)
 
-        updated_fw_target = self.collect_updated_ids(queries.LAST_FW_QUERY, enrich_target)
-        updated_person_target = self.collect_updated_ids(queries.LAST_PERSON_QUERY, person_fw_target)
-        updated_genre_target = self.collect_updated_ids(queries.LAST_GENRE_QUERY, genre_fw_target)
+        updated_fw_target = self.collect_updated_ids(queries.LAST_FW_QUERY, enrich_target, 'film_work')
+        updated_person_target = self.collect_updated_ids(queries.LAST_PERSON_QUERY, person_fw_target, 'person')
+        updated_genre_target = self.collect_updated_ids(queries.LAST_GENRE_QUERY, genre_fw_target, 'genre')
 
-        self.event_loop([updated_person_target, updated_genre_target, updated_fw_target])
+        return [updated_person_target, updated_genre_target, updated_fw_target]
+
+    def build_reindex_pipeline(self, index):
+        # Persons and genres lead to films which the film scan reaches anyway
+        return [self.collect_updated_ids(queries.LAST_FW_QUERY, self.build_loader(index), 'film_work')]
+
+    def build_listeners(self):
+        enrich_target = self.build_loader()
+
+        return {
+            'film_work': enrich_target,
+            'person': self.collect_related_ids(queries.PERSON_FW_QUERY, enrich_target),
+            'genre': self.collect_related_ids(queries.GENRE_FW_QUERY, enrich_target),
+        }
 
 
 class GenrePipeline(BasePipeline):
@@ -159,6 +273,10 @@ class GenrePipeline(BasePipeline):
     def index(self):
         return 'genres'
 
+    @property
+    def enrich_query(self):
+        return queries.GENRE_QUERY
+
     @coroutine
     def transform(self, target: Generator) -> Generator:
         while rows := (yield):
@@ -170,16 +288,17 @@ class GenrePipeline(BasePipeline):
                         name=row['genre_name'],
                         description=row['genre_description']
                     )
-            target.send([genre.as_dict for genre in genre.values()])
+            target.send(list(genre.values()))
+
+    def build_pipeline(self, index=None):
+        enrich_target = self.build_loader(index)
 
-    def etl_process(self):
-        es_target = self.es_loader_coro(self.index)
-        transform_target = self.transform(es_target)
-        enrich_target = self.enrich(queries.GENRE_QUERY, transform_target)
+        updated_genre_target = self.collect_updated_ids(queries.LAST_GENRE_QUERY, enrich_target, 'genre')
 
-        updated_genre_target = self.collect_updated_ids(queries.LAST_GENRE_QUERY, enrich_target)
+        return [updated_genre_target]
 
-        self.event_loop([updated_genre_target])
+    def build_listeners(self):
+        return {'genre': self.build_loader()}
 
 
 class PersonPipeline(BasePipeline):
@@ -187,6 +306,10 @@ class PersonPipeline(BasePipeline):
     def index(self):
         return 'persons'
 
+    @property
+    def enrich_query(self):
+        return queries.PERSON_QUERY
+
     @coroutine
     def transform(self, target: Generator) -> Generator:
         while rows := (yield):
@@ -208,13 +331,64 @@ class PersonPipeline(BasePipeline):
                         rating=row['fw_rating'],
                     )
                 )
-            target.send([person.as_dict for person in people.values()])
-
-    def etl_process(self):
-        es_target = self.es_loader_coro(self.index)
-        transform_target = self.transform(es_target)
-        enrich_target = self.enrich(queries.PERSON_QUERY, transform_target)
-
-        updated_person_target = self.collect_updated_ids(queries.LAST_PERSON_QUERY, enrich_target)
-
-        self.event_loop([updated_person_target])
+            target.send(list(people.values()))
+
+    def build_pipeline(self, index=None):
+        enrich_target = self.build_loader(index)
+
+        updated_person_target = self.collect_updated_ids(queries.LAST_PERSON_QUERY, enrich_target, 'person')
+
+        return [updated_person_target]
+
+    def build_listeners(self):
+        enrich_target = self.build_loader()
+
+        return {'person': enrich_target, 'person_film_work': enrich_target}
+
+
+class SharedPipeline(BaseRunner):
+    """Film work, person and genre pipelines in one process, sharing the scans of updated persons and genres."""
+
+    def __init__(self, state: State, db_adapter: PostgresProducer, es_loader: ElasticsearchLoader,
+                 hash_store: Optional[HashStore] = None, publisher: Optional[CacheInvalidationPublisher] = None):
+        super().__init__(state, db_adapter, es_loader, hash_store, publisher)
+        self.film_work = FilmWorkPipeline(state, db_adapter, es_loader, hash_store, publisher)
+        self.person = PersonPipeline(state, db_adapter, es_loader, hash_store, publisher)
+        self.genre = GenrePipeline(state, db_adapter, es_loader, hash_store, publisher)
+        self.pipelines = [self.film_work, self.person, self.genre]
+
+    def build_pipeline(self, index=None):
+        film_work_target = self.film_work.build_loader()
+        person_fw_target = self.film_work.collect_related_ids(queries.PERSON_FW_QUERY, film_work_target)
+        genre_fw_target = self.film_work.collect_related_ids(queries.GENRE_FW_QUERY, film_work_target)
+
+        updated_fw_target = self.film_work.collect_updated_ids(queries.LAST_FW_QUERY, film_work_target, 'film_work')
+        updated_person_target = self.person.collect_updated_ids(
+            queries.LAST_PERSON_QUERY, broadcast([self.person.build_loader(), person_fw_target]), 'person',
+            [self.person, self.film_work],
+        )
+        updated_genre_target = self.genre.collect_updated_ids(
+            queries.LAST_GENRE_QUERY, broadcast([self.genre.build_loader(), genre_fw_target]), 'genre',
+            [self.genre, self.film_work],
+        )
+
+        return [updated_person_target, updated_genre_target, updated_fw_target]
+
+    def build_listeners(self):
+        film_work_target = self.film_work.build_loader()
+        person_target = self.person.build_loader()
+
+        return {
+            'film_work': film_work_target,
+            'person': broadcast([
+                person_target, self.film_work.collect_related_ids(queries.PERSON_FW_QUERY, film_work_target),
+            ]),
+            'person_film_work': person_target,
+            'genre': broadcast([
+                self.genre.build_loader(), self.film_work.collect_related_ids(queries.GENRE_FW_QUERY, film_work_target),
+            ]),
+        }
+
+    def reindex(self) -> None:
+        for pipeline in self.pipelines:
+            pipeline.reindex()
@@ -1,26 +1,47 @@
+import json
 import logging
-from typing import Generator, List, Union
+import select
+import time
+from collections import defaultdict
+from typing import DefaultDict, Generator, List, Optional, Set, Tuple, Union
+from uuid import uuid4
 
 import config
 import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import connection as Connection
 from psycopg2.extras import DictCursor, DictRow
 from utils import backoff
 
 module_logger = logging.getLogger('PostgresProducer')
 
+# The lowest possible uuid, used as a keyset tiebreaker for the first page
+FIRST_ID = '00000000-0000-0000-0000-000000000000'
+
+# Seconds of silence on the LISTEN connection after which it is checked with a ping
+LISTEN_PING_INTERVAL = 60
+
+# Channel of the `content` triggers when the etl.cdc_channel setting of the database is not set
+TRIGGER_DEFAULT_CHANNEL = 'etl_changes'
+
+# A lost connection, which is reset, and query errors, which abort the transaction
+RETRY_ERRORS = (psycopg2.DatabaseError, psycopg2.InterfaceError)
+EXECUTE_TRIES = 5
+
+Changes = DefaultDict[str, Set[str]]
+
 
 class PostgresProducer:
     def __init__(self, dsn: dict, chunk_size: int = config.ETL_CHUNK_SIZE):
         self.dsn = dsn
         self.chunk_size = chunk_size
         self._connection = None
-        self._cursor = None
 
-    def cursor(self) -> None:
-        if not self._cursor or self._cursor.closed:
-            if not self._connection:
-                self.connect()
-            self._cursor = self._connection.cursor(cursor_factory=DictCursor)
+    def cursor(self) -> DictCursor:
+        """Open a named (server-side) cursor, so rows are kept in Postgres until they are fetched."""
+        if not self._connection or self._connection.closed:
+            self.connect()
+        return self._connection.cursor(name=f'etl_{uuid4().hex}', cursor_factory=DictCursor)
 
     @backoff(psycopg2.OperationalError, logger=module_logger)
     def connect(self) -> None:
@@ -28,37 +49,144 @@ class PostgresProducer:
         self._connection.autocommit = False
         module_logger.info('PostgreSQL connection is open')
 
-    @backoff(exceptions=(psycopg2.DatabaseError, psycopg2.OperationalError), logger=module_logger)
-    def execute(self, query: str, query_args: Union[List, str]) -> Generator[List[DictRow], None, None]:
+    def execute(self, query: str, query_args: Union[List, Tuple, str]) -> Generator[List[DictRow], None, None]:
+        """Yield the rows in chunks; if the connection fails, the query runs again and yields them from the first."""
+        delay = 1
+        for _try in range(1, EXECUTE_TRIES + 1):
+            try:
+                yield from self._stream(query, query_args)
+                return
+            except RETRY_ERRORS:
+                self.close()
+                if _try >= EXECUTE_TRIES:
+                    module_logger.exception('Retry: %d/%d', _try, EXECUTE_TRIES)
+                    raise
+                module_logger.exception('Retry: %d/%d. Retrying in %d seconds...', _try, EXECUTE_TRIES, delay)
+                time.sleep(delay)
+                delay *= 2
+
+    @backoff(RETRY_ERRORS, logger=module_logger)
+    def fetch_all(self, query: str, query_args: Union[List, Tuple, str]) -> List[DictRow]:
         try:
-            if isinstance(query_args, str):
-                query = self._cursor.mogrify(query, (query_args,))
-            elif isinstance(query_args, list):
-                query = self._cursor.mogrify(query, (tuple(query_args),))
-            else:
-                raise TypeError(f'Type of query args must be string or list. not {type(query_args)}')
-            self._cursor.execute(query)
-        except psycopg2.OperationalError:
-            self.reset()
+            return [row for rows in self._stream(query, query_args) for row in rows]
+        except RETRY_ERRORS:
+            self.close()
             raise
-        else:
-            while rows := self._cursor.fetchmany(self.chunk_size):
+
+    def _stream(self, query: str, query_args: Union[List, Tuple, str]) -> Generator[List[DictRow], None, None]:
+        if isinstance(query_args, str):
+            query_args = (query_args,)
+        elif isinstance(query_args, list):
+            query_args = (tuple(query_args),)
+        elif not isinstance(query_args, tuple):
+            raise TypeError(f'Type of query args must be string, list or tuple. not {type(query_args)}')
+
+        cursor = self.cursor()
+        try:
+            cursor.execute(query, query_args)
+            while rows := cursor.fetchmany(self.chunk_size):
                 yield rows
+        finally:
+            if not cursor.connection.closed and not cursor.closed:
+                cursor.close()
+
+    def paginate(self, query: str, since: Tuple[str, str]) -> Generator[List[DictRow], None, None]:
+        """Yield the pages of a query ordered by `(modified, id)` taking `(modified, id) > (%s, %s) LIMIT %s`."""
+        modified, last_id = since
+        while True:
+            rows = self.fetch_all(query, (modified, last_id, self.chunk_size))
+            if not rows:
+                return
+            yield rows
+            if len(rows) < self.chunk_size:
+                return
+            modified, last_id = rows[-1]['modified'], rows[-1]['id']
+
+    def listen(self, channel: str = config.ETL_CDC_CHANNEL, batch_delay: float = config.ETL_CDC_BATCH_DELAY,
+               batch_size: Optional[int] = None, poll_interval: float = config.ETL_SYNC_DELAY,
+               ) -> Generator[Optional[Changes], None, None]:
+        """Yield micro-batches of the ids changed per table, and None when a polling scan is due."""
+        batch_size = batch_size or self.chunk_size
+        while True:
+            connection = self._listen_connect(channel)
+            try:
+                yield None
+                poll_at = time.monotonic() + poll_interval
+                while True:
+                    changes = self._wait_notifications(connection, batch_delay, batch_size, poll_at)
+                    if changes:
+                        yield changes
+                    if time.monotonic() >= poll_at:
+                        yield None
+                        poll_at = time.monotonic() + poll_interval
+            except psycopg2.OperationalError:
+                module_logger.exception('LISTEN connection is lost, reconnecting')
+            finally:
+                connection.close()
+
+    @backoff(psycopg2.OperationalError, logger=module_logger)
+    def _listen_connect(self, channel: str) -> Connection:
+        connection = psycopg2.connect(**self.dsn)
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(sql.SQL('LISTEN {channel};').format(channel=sql.Identifier(channel)))
+            cursor.execute("SELECT current_setting('etl.cdc_channel', true);")
+            trigger_channel = cursor.fetchone()[0] or TRIGGER_DEFAULT_CHANNEL
+        if trigger_channel != channel:
+            module_logger.error('Triggers notify channel %s, not %s: set etl.cdc_channel of the database to it',
+                                trigger_channel, channel)
+        module_logger.info('Listen for changes on channel %s', channel)
+        return connection
+
+    @staticmethod
+    def _wait_notifications(connection: Connection, batch_delay: float, batch_size: int, until: float) -> Changes:
+        """Collect a batch of changes; an empty one is returned if none came by `until`."""
+        changes: Changes = defaultdict(set)
+        changed_count, deadline = 0, None
+        while changed_count < batch_size:
+            if deadline is None:
+                timeout = min(LISTEN_PING_INTERVAL, until - time.monotonic())
+            else:
+                timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            if select.select([connection], [], [], timeout) == ([], [], []):
+                if deadline is None:
+                    # A dead connection is noticed only when it is used
+                    with connection.cursor() as cursor:
+                        cursor.execute('SELECT 1;')
+                continue
+
+            connection.poll()
+            while connection.notifies:
+                payload = json.loads(connection.notifies.pop(0).payload)
+                ids = changes[payload['table']]
+                changed_count -= len(ids)
+                ids.add(payload['id'])
+                changed_count += len(ids)
+            if changes and deadline is None:
+                deadline = time.monotonic() + batch_delay
+        return changes
+
+    def now(self) -> str:
+        """Current time of the Postgres server, not the start of the current transaction."""
+        return str(self.fetch_all('SELECT clock_timestamp() AS now;', ())[0]['now'])
+
+    def commit(self) -> None:
+        """Finish the current transaction and release all server-side cursors opened in it."""
+        if self._connection and not self._connection.closed:
+            self._connection.commit()
 
     def reset(self) -> None:
         self.close()
         self.connect()
-        self.cursor()
 
     def close(self) -> None:
         if self._connection:
-            if self._cursor:
-                self._cursor.close()
             self._connection.close()
             module_logger.info('PostgreSQL connection is closed')
         self._connection = None
-        self._cursor = None
 
     def init(self) -> None:
-        self.connect()
-        self.cursor()
+        if not self._connection or self._connection.closed:
+            self.connect()
@@ -1,6 +1,26 @@
-LAST_FW_QUERY = "SELECT id FROM content.film_work WHERE modified > %s ORDER BY modified;"
-LAST_PERSON_QUERY = "SELECT id FROM content.person WHERE modified > %s ORDER BY modified;"
-LAST_GENRE_QUERY = "SELECT id FROM content.genre WHERE modified > %s ORDER BY modified;"
+LAST_FW_QUERY = '''
+SELECT id, modified
+FROM content.film_work
+WHERE (modified, id) > (%s, %s)
+ORDER BY modified, id
+LIMIT %s;
+'''
+
+LAST_PERSON_QUERY = '''
+SELECT id, modified
+FROM content.person
+WHERE (modified, id) > (%s, %s)
+ORDER BY modified, id
+LIMIT %s;
+'''
+
+LAST_GENRE_QUERY = '''
+SELECT id, modified
+FROM content.genre
+WHERE (modified, id) > (%s, %s)
+ORDER BY modified, id
+LIMIT %s;
+'''
 
 PERSON_FW_QUERY = '''
 SELECT DISTINCT fw.id
@@ -16,31 +36,60 @@ LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id
 WHERE gfw.genre_id IN %s; 
 '''
 
+# One row per film: every relation is aggregated into a JSON array by its own sub-select,
+# so persons, genres and files are not multiplied by each other.
 FW_QUERY = '''
 SELECT
-    fw.id as fw_id, 
-    fw.title, 
-    fw.description, 
-    fw.rating, 
-    fw.type, 
-    fw.creation_date, 
-    fw.modified, 
-    pfw.role as person_role, 
-    p.id as person_id, 
-    p.full_name as person_name,
-    g.id as genre_id,
-    g.name as genre_name,
-    f.id as file_id,
-    f.file_path as file_path,
-    f.video_width as video_width
+    fw.id,
+    fw.title,
+    fw.description,
+    fw.rating,
+    fw.type,
+    fw.creation_date,
+    COALESCE((
+        SELECT json_agg(json_build_object('id', g.id, 'name', g.name) ORDER BY g.name, g.id)
+        FROM content.genre_film_work gfw
+        JOIN content.genre g ON g.id = gfw.genre_id
+        WHERE gfw.film_work_id = fw.id
+    ), '[]') as genre,
+    COALESCE((
+        SELECT json_agg(json_build_object('id', p.id, 'name', p.full_name) ORDER BY p.full_name, p.id)
+        FROM content.person_film_work pfw
+        JOIN content.person p ON p.id = pfw.person_id
+        WHERE pfw.film_work_id = fw.id AND pfw.role = 'actor'
+    ), '[]') as actors,
+    COALESCE((
+        SELECT json_agg(json_build_object('id', p.id, 'name', p.full_name) ORDER BY p.full_name, p.id)
+        FROM content.person_film_work pfw
+        JOIN content.person p ON p.id = pfw.person_id
+        WHERE pfw.film_work_id = fw.id AND pfw.role = 'writer'
+    ), '[]') as writers,
+    COALESCE((
+        SELECT json_agg(json_build_object('id', p.id, 'name', p.full_name) ORDER BY p.full_name, p.id)
+        FROM content.person_film_work pfw
+        JOIN content.person p ON p.id = pfw.person_id
+        WHERE pfw.film_work_id = fw.id AND pfw.role = 'director'
+    ), '[]') as directors,
+    COALESCE((
+        SELECT json_agg(json_build_object('id', f.id, 'path', f.file_path) ORDER BY f.id)
+        FROM content.file_film_work ffw
+        JOIN content.file f ON f.id = ffw.file_id
+        WHERE ffw.film_work_id = fw.id AND f.video_width >= 720
+    ), '[]') as high_quality_file,
+    COALESCE((
+        SELECT json_agg(json_build_object('id', f.id, 'path', f.file_path) ORDER BY f.id)
+        FROM content.file_film_work ffw
+        JOIN content.file f ON f.id = ffw.file_id
+        WHERE ffw.film_work_id = fw.id AND f.video_width >= 480 AND f.video_width < 720
+    ), '[]') as middle_quality_file,
+    COALESCE((
+        SELECT json_agg(json_build_object('id', f.id, 'path', f.file_path) ORDER BY f.id)
+        FROM content.file_film_work ffw
+        JOIN content.file f ON f.id = ffw.file_id
+        WHERE ffw.film_work_id = fw.id AND f.video_width > 0 AND f.video_width < 480
+    ), '[]') as low_quality_file
 FROM content.film_work fw
-LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id
-LEFT JOIN content.person p ON p.id = pfw.person_id
-LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id
-LEFT JOIN content.genre g ON g.id = gfw.genre_id
-LEFT JOIN content.file_film_work ffw ON ffw.film_work_id = fw.id
-LEFT JOIN content.file f ON f.id = ffw.file_id
-WHERE fw.id IN %s; 
+WHERE fw.id IN %s;
 '''
 
 PERSON_QUERY = '''
@@ -55,7 +104,8 @@ SELECT
 FROM content.person p
 LEFT JOIN content.person_film_work pfw ON pfw.person_id = p.id
 LEFT JOIN content.film_work fw ON fw.id = pfw.film_work_id
-WHERE p.id IN %s; 
+WHERE p.id IN %s
+ORDER BY fw.title, fw.id, pfw.role; 
 '''
 
 
@@ -1,6 +1,9 @@
 import abc
 import json
 import logging
+import os
+import sqlite3
+import tempfile
 from typing import Any, Optional
 
 module_logger = logging.getLogger('JsonFileStorage')
@@ -21,11 +24,21 @@ class JsonFileStorage(BaseStorage):
         self.file_path = file_path
 
     def save_state(self, state: dict) -> None:
+        """Write the state to a temporary file and rename it over the old one, so it is never half-written."""
         if self.file_path is None:
             return None
 
-        with open(self.file_path, 'w') as f:
-            json.dump(state, f)
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.state.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
 
     def retrieve_state(self) -> Optional[dict]:
         if self.file_path is None:
@@ -41,6 +54,29 @@ class JsonFileStorage(BaseStorage):
         return {}
 
 
+class SqliteStorage(BaseStorage):
+    """State in a SQLite database, one row per key; a new database takes the state of `json_path`."""
+
+    def __init__(self, file_path: Optional[str] = None, json_path: Optional[str] = None):
+        self.connection = sqlite3.connect(file_path or ':memory:', isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL;')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL);')
+        if json_path and os.path.exists(json_path) and not self.retrieve_state():
+            self.save_state(JsonFileStorage(json_path).retrieve_state())
+            module_logger.info('State of %s is moved to %s', json_path, file_path)
+
+    def save_state(self, state: dict) -> None:
+        with self.connection:
+            self.connection.execute('BEGIN;')
+            self.connection.executemany(
+                'INSERT INTO state (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value;',
+                [(key, json.dumps(value)) for key, value in state.items()],
+            )
+
+    def retrieve_state(self) -> dict:
+        return {key: json.loads(value) for key, value in self.connection.execute('SELECT key, value FROM state;')}
+
+
 class State:
     def __init__(self, storage: BaseStorage):
         self.storage = storage
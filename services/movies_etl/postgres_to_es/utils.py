@@ -31,3 +31,11 @@ def coroutine(func):
         return fn
 
     return inner
+
+
+@coroutine
+def broadcast(targets: list):
+    while True:
+        item = (yield)
+        for target in targets:
+            target.send(item)
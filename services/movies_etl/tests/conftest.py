@@ -0,0 +1,22 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BASE_DIR = Path(__file__).resolve(strict=True).parent.parent
+sys.path.insert(0, str(BASE_DIR.joinpath('postgres_to_es')))
+sys.path.insert(1, str(BASE_DIR.joinpath('benchmarks')))
+
+os.environ.setdefault('ETL_CHUNK_SIZE', '3')
+os.environ.setdefault('ETL_SYNC_DELAY', '1')
+os.environ.setdefault('ETL_DEFAULT_DATE', '1970-01-01 00:00:00')
+
+from es_standin import ElasticsearchStandIn  # noqa: E402
+
+
+@pytest.fixture
+def es_standin():
+    standin = ElasticsearchStandIn(bulk_latency=0, refresh_latency=0).start()
+    yield standin
+    standin.stop()
@@ -0,0 +1,128 @@
+import threading
+import time
+
+import orjson
+import pytest
+
+import elastic
+from elastic import BulkBuffer, BulkIndexError, ElasticsearchLoader
+from models import Genre
+
+INDEX = 'genres'
+
+
+class FakeLoader(ElasticsearchLoader):
+    """Answers bulk requests itself: a request waits for the gate of its first id, if there is one,
+    and the items of `rejects` are rejected with 429 as many times as given."""
+
+    def __init__(self, **kwargs):
+        super().__init__(['http://127.0.0.1:1'], **kwargs)
+        self.gates = {}
+        self.rejects = {}
+        self.posts = []
+        self.events = []
+        self._lock = threading.Lock()
+
+    def _post_to_es(self, body: bytes, index: str) -> dict:
+        ids = [orjson.loads(line)['index']['_id'] for line in body.splitlines()[::2]]
+        with self._lock:
+            self.posts.append(body)
+            self.events.append(('start', ids))
+        if ids[0] in self.gates:
+            self.gates[ids[0]].wait(5)
+        items = []
+        with self._lock:
+            for document_id in ids:
+                rejected = self.rejects.get(document_id, 0) > 0
+                if rejected:
+                    self.rejects[document_id] -= 1
+                items.append({'index': {'_id': document_id, 'status': 429 if rejected else 201}})
+            self.events.append(('end', ids))
+        return {'errors': any(item['index']['status'] == 429 for item in items), 'items': items}
+
+
+def genre(genre_id, name=None):
+    return Genre(id=genre_id, name=name or f'Genre {genre_id}', description='')
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(elastic.time, 'sleep', lambda seconds: None)
+
+
+@pytest.fixture
+def loader():
+    # Every document goes to a batch of its own
+    loader = FakeLoader(bulk_size=1, workers=4)
+    yield loader
+    loader.close()
+
+
+def test_checkpoints_run_in_submission_order(loader):
+    loader.gates = {'a': threading.Event(), 'b': threading.Event()}
+    done = []
+    for document_id in 'abc':
+        loader.load_to_es([genre(document_id)], INDEX)
+        loader.checkpoint(lambda document_id=document_id: done.append(document_id))
+
+    loader.gates['b'].set()
+    while ('end', ['b']) not in loader.events:
+        time.sleep(0.01)
+    loader.checkpoint(lambda: done.append('later'))
+    assert done == []
+
+    loader.gates['a'].set()
+    loader.flush()
+    assert done == ['a', 'b', 'c', 'later']
+
+
+def test_batch_waits_for_in_flight_batch_of_same_id(loader):
+    loader.gates = {'a': threading.Event()}
+    loader.load_to_es([genre('a', 'First')], INDEX)
+    loader.load_to_es([genre('b')], INDEX)
+    threading.Timer(0.2, loader.gates['a'].set).start()
+    loader.load_to_es([genre('a', 'Second')], INDEX)
+    loader.load_to_es([genre('c')], INDEX)
+    loader.flush()
+
+    events = loader.events
+    # The batch of `b` is not held back by the one of `a`
+    assert events.index(('start', ['b'])) < events.index(('end', ['a']))
+    assert events.count(('start', ['a'])) == 2
+    second_start = len(events) - 1 - events[::-1].index(('start', ['a']))
+    assert events.index(('end', ['a'])) < second_start
+    assert [b'"Second"' in post for post in loader.posts if b'"_id":"a"' in post] == [False, True]
+
+
+def test_only_last_rejected_version_is_retried():
+    loader = FakeLoader(workers=1)
+    buffer = BulkBuffer(INDEX)
+    loader.rejects = {'a': 2, 'c': 1}
+    loader.load_to_es([genre('a', 'First'), genre('b'), genre('c'), genre('a', 'Second')], INDEX)
+    loader.flush()
+
+    assert len(loader.posts) == 2
+    assert loader.posts[1] == buffer.encode(genre('c')) + buffer.encode(genre('a', 'Second'))
+    loader.close()
+
+
+def test_rejected_former_version_is_not_retried():
+    loader = FakeLoader(workers=1)
+    loader.rejects = {'a': 1}
+    loader.load_to_es([genre('a', 'First'), genre('a', 'Second')], INDEX)
+    loader.flush()
+
+    assert len(loader.posts) == 1
+    loader.close()
+
+
+def test_error_after_total_tries():
+    loader = FakeLoader(workers=1, total_tries=3)
+    loader.rejects = {'a': 10}
+    loader.load_to_es([genre('a'), genre('b')], INDEX)
+
+    with pytest.raises(BulkIndexError):
+        loader.flush()
+    assert len(loader.posts) == 3
+    loader.rejects = {}
+    loader.close()
@@ -0,0 +1,66 @@
+import pytest
+
+from hashes import SELECT_BATCH_SIZE, HashStore
+from models import Genre
+
+
+@pytest.fixture
+def hash_store(tmp_path):
+    return HashStore(str(tmp_path / 'hashes.db'))
+
+
+def genres(*ids, description=''):
+    return [Genre(id=str(genre_id), name=f'Genre {genre_id}', description=description) for genre_id in ids]
+
+
+def test_saved_documents_are_unchanged(hash_store):
+    changed, hashes = hash_store.filter_changed('genres_1', genres('a', 'b'))
+    assert [genre.id for genre in changed] == ['a', 'b']
+    hash_store.save(hashes)
+
+    changed, hashes = hash_store.filter_changed('genres_1', genres('a', 'b', 'c'))
+    assert [genre.id for genre in changed] == ['c']
+    assert [row[1] for row in hashes] == ['c']
+
+
+def test_changed_document_gets_new_digest(hash_store):
+    hash_store.save(hash_store.filter_changed('genres_1', genres('a'))[1])
+    changed, hashes = hash_store.filter_changed('genres_1', genres('a', description='New'))
+    assert len(changed) == 1
+    hash_store.save(hashes)
+
+    assert hash_store.filter_changed('genres_1', genres('a', description='New'))[0] == []
+    assert len(hash_store.filter_changed('genres_1', genres('a'))[0]) == 1
+
+
+def test_digests_are_kept_per_index(hash_store):
+    hash_store.save(hash_store.filter_changed('genres_1', genres('a'))[1])
+    hash_store.save(hash_store.filter_changed('genres_2', genres('a'))[1])
+    assert len(hash_store.filter_changed('genres_3', genres('a'))[0]) == 1
+
+    hash_store.clear('genres_1')
+    assert len(hash_store.filter_changed('genres_1', genres('a'))[0]) == 1
+    assert hash_store.filter_changed('genres_2', genres('a'))[0] == []
+
+
+def test_more_documents_than_a_select_takes(hash_store):
+    documents = genres(*range(SELECT_BATCH_SIZE * 2 + 1))
+    hash_store.save(hash_store.filter_changed('genres_1', documents)[1])
+
+    assert hash_store.filter_changed('genres_1', documents)[0] == []
+
+
+def test_stats_are_counted_until_popped(hash_store):
+    hash_store.save(hash_store.filter_changed('genres_1', genres('a', 'b'))[1])
+    hash_store.pop_stats()
+    hash_store.filter_changed('genres_1', genres('a', 'b', 'c'))
+
+    assert hash_store.pop_stats() == {'genres_1': (3, 2)}
+    assert hash_store.pop_stats() == {}
+
+
+def test_digests_survive_reopening(tmp_path):
+    path = str(tmp_path / 'hashes.db')
+    HashStore(path).save(HashStore(path).filter_changed('genres_1', genres('a'))[1])
+
+    assert HashStore(path).filter_changed('genres_1', genres('a'))[0] == []
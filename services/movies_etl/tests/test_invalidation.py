@@ -0,0 +1,117 @@
+import orjson
+import pytest
+
+import invalidation
+from elastic import ElasticsearchLoader
+from invalidation import CacheInvalidationPublisher
+from models import Genre
+from pipelines import GenrePipeline
+from state import JsonFileStorage, State
+
+
+class FakeRedis:
+    def __init__(self):
+        self.entries = []
+        self.versions = {}
+
+    def xadd(self, stream, fields, maxlen, approximate):
+        entry_id = f'{len(self.entries) + 1}-0'
+        self.entries.append((entry_id, fields))
+        return entry_id
+
+    def hset(self, name, key, value):
+        self.versions[key] = value
+
+
+class FakeProducer:
+    def init(self):
+        pass
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(invalidation, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def redis():
+    return FakeRedis()
+
+
+@pytest.fixture
+def publisher(redis):
+    return CacheInvalidationPublisher(redis, stream='changes', version_interval=10)
+
+
+def published(redis):
+    return [(fields['index'], orjson.loads(fields['ids']), fields['bump']) for _, fields in redis.entries]
+
+
+def test_version_is_bumped_once_per_interval(publisher, redis, clock):
+    publisher.add('genres', ['b', 'a'])
+    publisher.publish()
+    clock.now += 1
+    publisher.add('genres', ['c'])
+    publisher.publish()
+    clock.now += 1
+    publisher.publish()
+    assert published(redis) == [('genres', ['a', 'b'], 1), ('genres', ['c'], 0)]
+    assert redis.versions == {'genres': '1-0'}
+
+    # The deferred bump comes with the first publish after the interval, even without changes
+    clock.now += 10
+    publisher.publish()
+    publisher.publish()
+    assert published(redis)[2:] == [('genres', [], 1)]
+    assert redis.versions == {'genres': '3-0'}
+
+
+def test_version_is_bumped_by_the_last_entry(publisher, redis, clock, monkeypatch):
+    monkeypatch.setattr(invalidation, 'MESSAGE_SIZE', 2)
+    publisher.add('genres', ['a', 'b', 'c'])
+    publisher.publish()
+    assert published(redis) == [('genres', ['a', 'b'], 0), ('genres', ['c'], 1)]
+    assert redis.versions == {'genres': '2-0'}
+
+
+def test_held_ids_are_published_on_release(publisher, redis, clock):
+    publisher.add('genres', ['a'])
+    publisher.publish()
+    publisher.hold('genres')
+    publisher.add('genres', ['b'])
+    publisher.publish()
+    assert published(redis) == [('genres', ['a'], 1)]
+
+    publisher.release('genres')
+    publisher.publish()
+    assert published(redis)[1:] == [('genres', ['b'], 1)]
+    assert redis.versions == {'genres': '2-0'}
+
+
+def test_catch_up_of_new_version_is_collected_under_alias(es_standin, publisher, redis, clock):
+    loader = ElasticsearchLoader([es_standin.url], workers=2)
+    pipeline = GenrePipeline(State(JsonFileStorage()), FakeProducer(), loader, publisher=publisher)
+    genres = [Genre(id=genre_id, name=genre_id, description='') for genre_id in ('a', 'b')]
+    try:
+        pipeline.es_loader_coro('genres_v2').send(genres[:1])
+        publisher.hold('genres')
+        pipeline.es_loader_coro('genres_v2').send(genres[1:])
+        loader.refresh()
+    finally:
+        loader.close()
+
+    publisher.publish()
+    assert redis.entries == []
+    publisher.release('genres')
+    publisher.publish()
+    assert published(redis) == [('genres', ['b'], 1)]
@@ -0,0 +1,142 @@
+import json
+import logging
+import socket
+from collections import namedtuple
+
+import psycopg2
+import pytest
+
+import postgres
+import utils
+from postgres import PostgresProducer
+
+Notify = namedtuple('Notify', 'channel payload')
+
+
+class FakeListenConnection:
+    """LISTEN connection whose socket is readable while notifications are queued."""
+
+    def __init__(self, setting=None):
+        self.setting = setting
+        self.closed = False
+        self.broken = False
+        self.autocommit = False
+        self.notifies = []
+        self.queries = []
+        self._socket, self._peer = socket.socketpair()
+
+    def fileno(self):
+        return self._socket.fileno()
+
+    def notify(self, table, row_id):
+        self.notifies.append(Notify('etl_changes', json.dumps({'table': table, 'id': row_id})))
+        self._peer.send(b'.')
+
+    def poll(self):
+        self._socket.recv(1024)
+
+    def cursor(self):
+        return FakeListenCursor(self)
+
+    def close(self):
+        self.closed = True
+        self._socket.close()
+        self._peer.close()
+
+
+class FakeListenCursor:
+    def __init__(self, connection: FakeListenConnection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query):
+        if self.connection.broken:
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+        self.connection.queries.append(query)
+
+    def fetchone(self):
+        return (self.connection.setting,)
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    connections = []
+
+    def connect(**dsn):
+        connections.append(FakeListenConnection())
+        return connections[-1]
+
+    monkeypatch.setattr(postgres.psycopg2, 'connect', connect)
+    monkeypatch.setattr(utils.time, 'sleep', lambda seconds: None)
+    yield connections
+    for connection in connections:
+        if not connection.closed:
+            connection.close()
+
+
+@pytest.fixture
+def producer():
+    return PostgresProducer({}, chunk_size=3)
+
+
+def test_changes_are_batched(producer, connections):
+    changes = producer.listen('etl_changes', batch_delay=0.05, poll_interval=10)
+    assert next(changes) is None
+    connection = connections[-1]
+    assert connection.autocommit
+
+    for table, row_id in (('film_work', 'a'), ('film_work', 'a'), ('person', 'p')):
+        connection.notify(table, row_id)
+    assert next(changes) == {'film_work': {'a'}, 'person': {'p'}}
+    changes.close()
+    assert connection.closed
+
+
+def test_full_batch_is_not_held_for_batch_delay(producer, connections):
+    changes = producer.listen('etl_changes', batch_delay=10, batch_size=2, poll_interval=10)
+    next(changes)
+    for row_id in 'abc':
+        connections[-1].notify('genre', row_id)
+
+    assert next(changes) == {'genre': {'a', 'b', 'c'}}
+    changes.close()
+
+
+def test_poll_cycle_is_requested_every_poll_interval(producer, connections):
+    changes = producer.listen('etl_changes', batch_delay=0.05, poll_interval=0.05)
+    assert next(changes) is None
+    assert next(changes) is None
+    connections[-1].notify('genre', 'a')
+    assert next(changes) == {'genre': {'a'}}
+    changes.close()
+    assert len(connections) == 1
+
+
+def test_lost_connection_is_listened_again(producer, connections, monkeypatch):
+    monkeypatch.setattr(postgres, 'LISTEN_PING_INTERVAL', 0.01)
+    changes = producer.listen('etl_changes', batch_delay=0.05, poll_interval=10)
+    next(changes)
+    connections[-1].broken = True
+
+    # The events sent meanwhile are lost, so a polling cycle is requested after the reconnect
+    assert next(changes) is None
+    assert len(connections) == 2 and connections[0].closed
+    connections[-1].notify('person', 'p')
+    assert next(changes) == {'person': {'p'}}
+    changes.close()
+
+
+def test_channel_of_triggers_is_checked(producer, connections, monkeypatch, caplog):
+    monkeypatch.setattr(postgres.psycopg2, 'connect', lambda **dsn: connections.append(
+        FakeListenConnection(setting='other_channel')) or connections[-1])
+    changes = producer.listen('etl_changes', poll_interval=10)
+    next(changes)
+    changes.close()
+
+    assert any(record.levelno == logging.ERROR and 'other_channel' in record.getMessage()
+               for record in caplog.records)
@@ -0,0 +1,44 @@
+import pytest
+
+from elastic import ElasticsearchLoader
+from hashes import HashStore
+from models import Genre
+from pipelines import GenrePipeline
+from state import JsonFileStorage, State
+
+
+class FakeProducer:
+    def init(self):
+        pass
+
+
+@pytest.fixture
+def hash_store():
+    return HashStore(':memory:')
+
+
+@pytest.fixture
+def pipeline(es_standin, hash_store):
+    loader = ElasticsearchLoader([es_standin.url], workers=2)
+    yield GenrePipeline(State(JsonFileStorage()), FakeProducer(), loader, hash_store)
+    loader.close()
+
+
+def genres(*ids):
+    return [Genre(id=genre_id, name=f'Genre {genre_id}', description='') for genre_id in ids]
+
+
+def test_digests_of_failed_documents_are_not_saved(pipeline, es_standin, hash_store):
+    es_standin.fail_ids = {'b'}
+    loader = pipeline.skip_unchanged('genres', pipeline.es_loader_coro('genres'))
+    loader.send(genres('a', 'b', 'c'))
+    pipeline.es_loader.refresh()
+
+    changed, _ = hash_store.filter_changed('genres', genres('a', 'b', 'c'))
+    assert [genre.id for genre in changed] == ['b']
+
+    es_standin.fail_ids = set()
+    loader.send(genres('a', 'b', 'c'))
+    pipeline.es_loader.refresh()
+    assert es_standin.indexed == 3
+    assert hash_store.filter_changed('genres', genres('a', 'b', 'c'))[0] == []
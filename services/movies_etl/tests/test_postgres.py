@@ -0,0 +1,161 @@
+import psycopg2
+import pytest
+
+import postgres
+import utils
+from postgres import EXECUTE_TRIES, PostgresProducer
+
+
+class FakeDatabase:
+    """Rows of one table: keyset queries take `(modified, id, limit)`, the others a tuple of ids.
+
+    The connection is dropped on the cursor operation number `drop_at`, counted over all connections.
+    """
+
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=lambda row: (row['modified'], row['id']))
+        self.operations = 0
+        self.drop_at = set()
+        self.connections = 0
+        self.queries = 0
+
+    def run(self, args):
+        self.queries += 1
+        if len(args) == 3:
+            modified, last_id, limit = args
+            return [row for row in self.rows if (row['modified'], row['id']) > (modified, last_id)][:limit]
+        return [row for row in self.rows if row['id'] in args[0]]
+
+
+class FakeCursor:
+    def __init__(self, connection: 'FakeConnection'):
+        self.connection = connection
+        self.closed = False
+        self._rows = []
+
+    def execute(self, query, args):
+        self.connection.operate()
+        self._rows = self.connection.database.run(args)
+
+    def fetchmany(self, size):
+        self.connection.operate()
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self, database: FakeDatabase):
+        self.database = database
+        self.closed = False
+        self.autocommit = True
+        database.connections += 1
+
+    def cursor(self, name=None, cursor_factory=None):
+        return FakeCursor(self)
+
+    def operate(self):
+        if self.closed:
+            raise psycopg2.InterfaceError('connection already closed')
+        self.database.operations += 1
+        if self.database.operations in self.database.drop_at:
+            self.closed = True
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def row(modified, row_id):
+    return {'modified': modified, 'id': row_id}
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(postgres.time, 'sleep', lambda seconds: None)
+    monkeypatch.setattr(utils.time, 'sleep', lambda seconds: None)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase([row(f'2021-0{i // 3 + 1}', f'id{i}') for i in range(8)])
+    monkeypatch.setattr(postgres.psycopg2, 'connect', lambda **dsn: FakeConnection(database))
+    return database
+
+
+@pytest.fixture
+def producer(database):
+    return PostgresProducer({}, chunk_size=3)
+
+
+def ids(chunks):
+    return [row['id'] for rows in chunks for row in rows]
+
+
+def test_execute_yields_chunks(producer):
+    chunks = list(producer.execute('SELECT', ['id1', 'id4', 'id5', 'id7']))
+    assert [len(rows) for rows in chunks] == [3, 1]
+
+
+def test_execute_runs_again_on_lost_connection(producer, database):
+    # Dropped while fetching the second chunk: the rows are yielded again from the first
+    database.drop_at = {3}
+    assert ids(producer.execute('SELECT', ['id1', 'id4', 'id5', 'id7'])) == ['id1', 'id4', 'id5',
+                                                                            'id1', 'id4', 'id5', 'id7']
+    assert database.connections == 2
+
+
+def test_execute_runs_again_after_query_on_another_cursor_reconnected(producer, database):
+    outer = producer.execute('SELECT', ['id1', 'id4', 'id5', 'id7'])
+    assert ids([next(outer)]) == ['id1', 'id4', 'id5']
+    database.drop_at = {database.operations + 1}
+    assert ids(producer.execute('SELECT', ['id2'])) == ['id2']
+
+    assert ids(outer) == ['id1', 'id4', 'id5', 'id7']
+
+
+def test_execute_gives_up_after_tries(producer, database):
+    database.drop_at = set(range(1, 100))
+    with pytest.raises(psycopg2.OperationalError):
+        list(producer.execute('SELECT', ['id1']))
+    assert database.connections == EXECUTE_TRIES
+
+
+def test_fetch_all_runs_again_on_lost_connection(producer, database):
+    database.drop_at = {3}
+    assert [row['id'] for row in producer.fetch_all('SELECT', ['id1', 'id4', 'id5', 'id7'])] == [
+        'id1', 'id4', 'id5', 'id7']
+
+
+def test_paginate_walks_keyset(producer):
+    pages = list(producer.paginate('SELECT', ('1970-01-01', postgres.FIRST_ID)))
+
+    assert [[row['id'] for row in rows] for rows in pages] == [['id0', 'id1', 'id2'], ['id3', 'id4', 'id5'],
+                                                               ['id6', 'id7']]
+
+
+def test_paginate_resumes_after_checkpoint(producer):
+    # Rows of the same `modified` are told apart by their id
+    assert ids(producer.paginate('SELECT', ('2021-02', 'id3'))) == ['id4', 'id5', 'id6', 'id7']
+    assert ids(producer.paginate('SELECT', ('2021-03', 'id7'))) == []
+
+
+def test_paginate_stops_after_full_last_page(database, producer):
+    database.rows = database.rows[:6]
+    list(producer.paginate('SELECT', ('1970-01-01', postgres.FIRST_ID)))
+    # Two full pages and the empty one which tells the end
+    assert database.queries == 3
+
+
+def test_paginate_resumes_page_on_lost_connection(database, producer):
+    pages = producer.paginate('SELECT', ('1970-01-01', postgres.FIRST_ID))
+    first = next(pages)
+    database.drop_at = {database.operations + 2}
+
+    assert ids([first]) + ids(pages) == [f'id{i}' for i in range(8)]
+    assert database.connections == 2
@@ -0,0 +1,43 @@
+import json
+
+from state import JsonFileStorage, SqliteStorage, State
+
+
+def test_sqlite_state_survives_reopening(tmp_path):
+    path = str(tmp_path / 'state.db')
+    State(SqliteStorage(path)).set_state('movies_film_work_checkpoint', {'modified': '2021-06-16', 'id': 'a'})
+    state = State(SqliteStorage(path))
+    state.set_state('movies_last_updated', '2021-06-16')
+
+    assert SqliteStorage(path).retrieve_state() == {
+        'movies_film_work_checkpoint': {'modified': '2021-06-16', 'id': 'a'},
+        'movies_last_updated': '2021-06-16',
+    }
+
+
+def test_sqlite_state_takes_json_state_once(tmp_path):
+    json_path = tmp_path / 'state.json'
+    json_path.write_text(json.dumps({'movies_last_updated': '2021-06-16'}))
+    path = str(tmp_path / 'state.db')
+
+    state = State(SqliteStorage(path, json_path=str(json_path)))
+    assert state.get_state('movies_last_updated') == '2021-06-16'
+    state.set_state('movies_last_updated', '2022-01-01')
+
+    # The JSON state is not taken over a database that has a state already
+    json_path.write_text(json.dumps({'movies_last_updated': '2020-01-01'}))
+    assert State(SqliteStorage(path, json_path=str(json_path))).get_state('movies_last_updated') == '2022-01-01'
+
+
+def test_sqlite_state_without_json_state(tmp_path):
+    storage = SqliteStorage(str(tmp_path / 'state.db'), json_path=str(tmp_path / 'missing.json'))
+    assert storage.retrieve_state() == {}
+
+
+def test_json_state_is_replaced_whole(tmp_path):
+    path = tmp_path / 'state.json'
+    JsonFileStorage(str(path)).save_state({'a': 1})
+    JsonFileStorage(str(path)).save_state({'b': 2})
+
+    assert JsonFileStorage(str(path)).retrieve_state() == {'b': 2}
+    assert [file.name for file in tmp_path.iterdir()] == ['state.json']